@@ -5,9 +5,33 @@ Prompt management extension with sidebar browser
 
 import os
 import json
+import asyncio
+import atexit
 import hashlib
 import base64
-from datetime import datetime
+import fnmatch
+import functools
+import gzip
+import bisect
+import heapq
+import inspect
+import math
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+import zlib
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from itertools import chain, islice
+from operator import attrgetter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from pathlib import Path
 from io import BytesIO
 
@@ -15,56 +39,1123 @@ import folder_paths
 from aiohttp import web
 from server import PromptServer
 
+# ============================================================================
+# METRICS
+# ============================================================================
+# Latency histograms and counters, served in the Prometheus text format by
+# /ps/metrics. PromptDB methods, /ps/* handlers, persists and the image helpers
+# record into them. With PS_SLOW_MS set, any of these that takes at least that
+# many milliseconds is also printed (the slow-operation log).
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+# name -> (type, help, label names, buckets)
+METRIC_FAMILIES = {
+    "ps_http_request_seconds": ("histogram", "Duration of /ps/* requests", ("method", "route"), LATENCY_BUCKETS),
+    "ps_http_responses_total": ("counter", "Responses of /ps/* handlers", ("method", "route", "status"), None),
+    "ps_db_call_seconds": ("histogram", "Duration of PromptDB methods, including the wait for the lock",
+                           ("method",), LATENCY_BUCKETS),
+    "ps_operation_seconds": ("histogram", "Duration of thumbnail, capture, metadata and image encoding work",
+                             ("operation",), LATENCY_BUCKETS),
+    "ps_persist_seconds": ("histogram", "Duration of writes of the library to disk", ("kind",), LATENCY_BUCKETS),
+    "ps_persist_bytes": ("histogram", "Bytes written per persist (journal line or snapshot)", ("kind",),
+                         SIZE_BUCKETS),
+    "ps_stream_items_total": ("counter", "Items sent by streamed responses (exported prompts, zipped files)",
+                              ("stream",), None),
+    "ps_event_loop_lag_seconds": ("histogram", "How late the event loop woke a timer (sampled every 0.5s)",
+                                  (), LATENCY_BUCKETS),
+}
+LOOP_LAG_INTERVAL = 0.5
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_label_value(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    __slots__ = ("counts", "sum")
+    
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)  # per bucket (value <= bound), the last is +Inf
+        self.sum = 0.0
+
+
+class Metrics:
+    """Process-wide metric store; observe/count take the label values in METRIC_FAMILIES order"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {name: {} for name in METRIC_FAMILIES}  # name -> {label values: Histogram | count}
+        self.slow_ms = float(os.environ.get("PS_SLOW_MS") or 0)
+        self._loop_monitor = None
+    
+    def observe(self, name, value, labels=()):
+        buckets = METRIC_FAMILIES[name][3]
+        with self._lock:
+            h = self._values[name].get(labels)
+            if h is None:
+                h = self._values[name][labels] = Histogram(buckets)
+            h.counts[bisect.bisect_left(buckets, value)] += 1
+            h.sum += value
+    
+    def count(self, name, labels=(), amount=1):
+        with self._lock:
+            values = self._values[name]
+            values[labels] = values.get(labels, 0) + amount
+    
+    def slow(self, kind, name, seconds):
+        """Slow-operation log: print if PS_SLOW_MS is set and seconds reaches it"""
+        if self.slow_ms and seconds * 1000 >= self.slow_ms:
+            print(f"[PS] Slow {kind} {name}: {seconds * 1000:.0f} ms")
+    
+    def persisted(self, kind, seconds, size=None):
+        self.observe("ps_persist_seconds", seconds, (kind,))
+        if size is not None:
+            self.observe("ps_persist_bytes", size, (kind,))
+        self.slow("persist", kind if size is None else f"{kind} ({size} bytes)", seconds)
+    
+    def start_loop_monitor(self):
+        """Sample event-loop lag from now on; call from a coroutine on the loop to watch"""
+        if self._loop_monitor is None:
+            self._loop_monitor = asyncio.get_running_loop().create_task(self._watch_loop())
+    
+    async def _watch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            lag = max(loop.time() - started - LOOP_LAG_INTERVAL, 0.0)
+            self.observe("ps_event_loop_lag_seconds", lag)
+            self.slow("event loop", "lag", lag)
+    
+    def render(self, gauges=()):
+        """
+        Prometheus text exposition of everything recorded, followed by gauges:
+        (name, help, [(labels dict, value)]) computed by the caller at scrape time
+        """
+        with self._lock:
+            snapshot = {name: {labels: (list(v.counts), v.sum) if isinstance(v, Histogram) else v
+                               for labels, v in values.items()}
+                        for name, values in self._values.items()}
+        lines = []
+        for name, values in snapshot.items():
+            kind, text, label_names, buckets = METRIC_FAMILIES[name]
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(values.items()):
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(label_names, labels)} {value}")
+                    continue
+                counts, total = value
+                cumulative = 0
+                for bound, n in zip(buckets + ("+Inf",), counts):
+                    cumulative += n
+                    le = f'le="{bound}"'
+                    lines.append(f"{name}_bucket{_labels(label_names, labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(label_names, labels)} {total}")
+                lines.append(f"{name}_count{_labels(label_names, labels)} {cumulative}")
+        for name, text, samples in gauges:
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(list(labels), list(labels.values()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def timed(kind, name=None):
+    """
+    Decorator: record each call's duration in ps_<kind>_seconds (kind "db" or
+    "operation"), labelled with name or the function's name
+    """
+    family = {"db": "ps_db_call_seconds", "operation": "ps_operation_seconds"}[kind]
+    
+    def decorate(fn):
+        labels = (name or fn.__name__,)
+        
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.observe(family, elapsed, labels)
+                metrics.slow(kind, labels[0], elapsed)
+        return wrapper
+    return decorate
+
+
+def timed_methods(cls):
+    """Class decorator: time the public methods a class defines (not generators or context managers)"""
+    for name, fn in list(vars(cls).items()):
+        if name.startswith("_") or not inspect.isfunction(fn) or inspect.isgeneratorfunction(inspect.unwrap(fn)):
+            continue
+        setattr(cls, name, timed("db", name)(fn))
+    return cls
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that counts its waiting and running tasks (ps_executor_* gauges)"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._count_lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+    
+    def submit(self, fn, /, *args, **kwargs):
+        def run():
+            with self._count_lock:
+                self.queued -= 1
+                self.active += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._count_lock:
+                    self.active -= 1
+        
+        with self._count_lock:
+            self.queued += 1
+        try:
+            future = super().submit(run)
+        except BaseException:
+            with self._count_lock:
+                self.queued -= 1
+            raise
+        future.add_done_callback(self._cancelled)
+        return future
+    
+    def _cancelled(self, future):
+        # A cancelled task never ran, so it never left the queue
+        if future.cancelled():
+            with self._count_lock:
+                self.queued -= 1
+
+
 # ============================================================================
 # DATABASE
 # ============================================================================
 
+# Words of an SD prompt: "(masterpiece:1.2), <lora:add_detail:0.5>, long_hair" ->
+# masterpiece, 1, 2, lora, add_detail, 0, 5, long_hair. Weights and brackets are separators.
+_TOKEN_RE = re.compile(r"[^\W_]+(?:_[^\W_]+)*")
+
+
+def _fold(text):
+    """Lowercase and strip diacritics (café -> cafe), like SQLite's unicode61 tokenizer"""
+    text = (text or "").lower()
+    if text.isascii():
+        return text
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def search_terms(text):
+    """Distinct terms of a search query"""
+    return list(dict.fromkeys(_TOKEN_RE.findall(_fold(text))))
+
+
+def document_tokens(text):
+    """Index tokens of a prompt text; snake_case tags are indexed whole and by part"""
+    tokens = []
+    for t in _TOKEN_RE.findall(_fold(text)):
+        tokens.append(t)
+        if "_" in t:
+            tokens.extend(t.split("_"))
+    return tokens
+
+
+class ThumbnailStore:
+    """
+    Content-addressed thumbnail files under data/thumbs/<k[:2]>/<k>, where k is a
+    sha256 prefix of the image bytes. Prompts only reference k ("thumb"), so the
+    same image is stored once and can be served with an immutable cache header.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.path.mkdir(exist_ok=True)
+    
+    @staticmethod
+    def valid_key(key):
+        return isinstance(key, str) and len(key) == 32 and all(c in "0123456789abcdef" for c in key)
+    
+    def _file(self, key):
+        return self.path / key[:2] / key
+    
+    def put(self, data):
+        key = hashlib.sha256(data).hexdigest()[:32]
+        fp = self._file(key)
+        try:
+            os.utime(fp)  # Already stored; the fresh mtime also keeps sweep() off it
+            return key
+        except FileNotFoundError:
+            pass
+        fp.parent.mkdir(exist_ok=True)
+        # A private temp file per writer: concurrent puts of the same image must not share one
+        fd, tmp = tempfile.mkstemp(dir=fp.parent, prefix=key, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, fp)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        return key
+    
+    def put_base64(self, b64):
+        try:
+            return self.put(base64.b64decode(b64))
+        except Exception as e:
+            print(f"[PS] Invalid inline thumbnail: {e}")
+            return None
+    
+    def exists(self, key):
+        return self.valid_key(key) and self._file(key).exists()
+    
+    def sweep(self, referenced, grace=3600):
+        """
+        Delete files whose key is not in referenced (and stray temp files); files
+        touched in the last grace seconds are kept, as a put() may not have been
+        committed to a prompt yet. Returns the number of files removed.
+        """
+        cutoff = time.time() - grace
+        removed = 0
+        for folder in self.path.iterdir():
+            if not folder.is_dir():
+                continue
+            for fp in folder.iterdir():
+                if fp.name in referenced:
+                    continue
+                try:
+                    if fp.stat().st_mtime < cutoff:
+                        fp.unlink()
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+    
+    def get(self, key):
+        if not self.valid_key(key):
+            return None
+        try:
+            with open(self._file(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+    
+    @staticmethod
+    def content_type(data):
+        if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+            return "image/webp"
+        if data[:8] == b'\x89PNG\r\n\x1a\n':
+            return "image/png"
+        return "image/jpeg"
+
+
+def broadcast(event, data):
+    """Push an event to every connected browser; data must not be mutated afterwards"""
+    try:
+        PromptServer.instance.send_sync(event, data)
+    except Exception:
+        pass
+
+
+EXPORT_FORMAT = "ps-prompts"  # "format" of the header record of streamed exports
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def pack_time(value):
+    """
+    ISO timestamp as written by datetime.isoformat() -> integer microseconds since 1970
+    (naive, like the string). Anything else is kept as it is, so unpack_time() always
+    gives back the original value.
+    """
+    # Only the exact isoformat() layouts, "YYYY-MM-DDTHH:MM:SS" and "...SS.ffffff", round-trip
+    if (type(value) is str and len(value) in (19, 26) and value[10] == "T" and value[4] == value[7] == "-"
+            and value[13] == value[16] == ":" and (len(value) == 19 or value[19] == ".")):
+        try:
+            dt = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+        if dt.tzinfo is None and (len(value) == 19) == (dt.microsecond == 0):
+            return (dt - _EPOCH) // _MICROSECOND
+    return value
+
+
+def unpack_time(value):
+    return (_EPOCH + _MICROSECOND * value).isoformat() if type(value) is int else value
+
+
+def sort_time(value):
+    """Comparable form of a packed timestamp: microseconds, best effort for the strings pack_time kept"""
+    if isinstance(value, int):
+        return value
+    try:
+        dt = datetime.fromisoformat(value)
+    except (ValueError, TypeError):
+        return 0
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return (dt - _EPOCH) // _MICROSECOND
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class PromptRecord:
+    """
+    A prompt as PromptDB keeps it in memory: slots instead of a dict, category, model
+    and tags interned (one string object per distinct value, shared by all prompts),
+    timestamps packed to integers. Item access (p["tags"], p.get("updated_at"))
+    reads and writes it in the dict shape; to_dict() is that shape for the API and files.
+    """
+    FIELDS = ("id", "text", "hash", "model", "category", "tags", "rating", "thumb",
+              "created_at", "updated_at", "used_count", "source")
+    __slots__ = FIELDS + ("extra",)
+    _FIELD_SET = frozenset(FIELDS)
+    _TIMES = ("created_at", "updated_at")
+    
+    @classmethod
+    def from_dict(cls, d):
+        # Same conversions as __setitem__, spelled out: this runs for every prompt at load
+        p = cls.__new__(cls)
+        get = d.get
+        p.id = get("id")
+        p.text = get("text")
+        p.hash = get("hash")
+        p.model = _intern(get("model"))
+        p.category = _intern(get("category"))
+        tags = get("tags")
+        p.tags = tuple(map(_intern, tags)) if tags else ()
+        p.rating = get("rating")
+        p.thumb = get("thumb")
+        created, updated = get("created_at"), get("updated_at")
+        p.created_at = pack_time(created)
+        p.updated_at = p.created_at if updated == created else pack_time(updated)
+        p.used_count = get("used_count")
+        p.source = get("source")
+        p.extra = None
+        if not cls._FIELD_SET.issuperset(d):
+            p.extra = {k: v for k, v in d.items() if k not in cls._FIELD_SET}
+        return p
+    
+    def to_dict(self):
+        created = unpack_time(self.created_at)
+        d = {
+            "id": self.id,
+            "text": self.text,
+            "hash": self.hash,
+            "model": self.model,
+            "category": self.category,
+            "tags": list(self.tags),
+            "rating": self.rating,
+            "thumb": self.thumb,
+            "created_at": created,
+            "updated_at": created if self.updated_at == self.created_at else unpack_time(self.updated_at),
+            "used_count": self.used_count
+        }
+        if self.source is not None:
+            d["source"] = self.source
+        if self.extra:
+            d.update(self.extra)
+        return d
+    
+    def copy(self):
+        p = PromptRecord.__new__(PromptRecord)
+        for key in self.__slots__:
+            setattr(p, key, getattr(self, key))
+        if p.extra:
+            p.extra = dict(p.extra)
+        return p
+    
+    def __setitem__(self, key, value):
+        if key in self._FIELD_SET:
+            if key == "tags":
+                value = tuple(map(_intern, value)) if value else ()
+            elif key in self._TIMES:
+                value = pack_time(value)
+            elif key in ("model", "category"):
+                value = _intern(value)
+            setattr(self, key, value)
+        elif self.extra is None:
+            self.extra = {key: value}
+        else:
+            self.extra[key] = value
+    
+    def __getitem__(self, key):
+        if key in self._FIELD_SET:
+            value = getattr(self, key)
+            if key == "tags":
+                return list(value)
+            return unpack_time(value) if key in self._TIMES else value
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+    
+    def __contains__(self, key):
+        if key in self._FIELD_SET:
+            return getattr(self, key) is not None
+        return bool(self.extra) and key in self.extra
+    
+    def get(self, key, default=None):
+        # An empty slot reads as a missing key
+        value = self[key] if key in self else None
+        return default if value is None else value
+    
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self.get(key)
+    
+    def pop(self, key, default=None):
+        if key not in self:
+            return default
+        value = self[key]
+        if key in self._FIELD_SET:
+            setattr(self, key, None)
+        else:
+            del self.extra[key]
+        return value
+    
+    def update(self, other):
+        for key, value in other.items():
+            self[key] = value
+
+
+def _locked(method):
+    """
+    Run a PromptDB method under the instance lock (handlers call in from worker threads,
+    nodes from the execution thread), after the library has finished loading
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self._ready.is_set() or self._load_error:
+            self._wait_ready()
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+@timed_methods
 class PromptDB:
     _instance = None
     
     def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance._init_db()
-        return cls._instance
+        if PromptDB._instance is None:
+            if cls is PromptDB and os.environ.get("PS_STORAGE") == "sqlite":
+                cls = SQLitePromptDB
+            PromptDB._instance = super().__new__(cls)
+            PromptDB._instance._init_db()
+        return PromptDB._instance
     
     def _init_db(self):
         self.path = Path(os.path.dirname(__file__)) / "data"
         self.path.mkdir(exist_ok=True)
         self.file = self.path / "prompts.json"
-        self.data = self._load()
+        # "journal" appends one line per mutation to prompts.journal and folds it into
+        # prompts.json in the background; "json" rewrites prompts.json on every mutation
+        self.storage = os.environ.get("PS_STORAGE", "journal")
+        self.journal = self.path / "prompts.journal"
+        self.journal_old = self.path / "prompts.journal.old"
+        self.compact_threshold = int(os.environ.get("PS_COMPACT_BYTES", 8 * 1024 * 1024))
+        self._journal_lock = threading.RLock()
+        self._journal_fh = None
+        self._journal_size = 0
+        self._compacting = False
+        # "deferred" persists in the background at most every PS_FLUSH_MS (a crash loses
+        # at most that window), "commit" before each mutation returns, "fsync" also fsyncs
+        self.durability = os.environ.get("PS_DURABILITY", "deferred")
+        self.flush_interval = int(os.environ.get("PS_FLUSH_MS", 250)) / 1000
+        self._pending = []
+        self._dirty = False
+        self._batch_depth = 0
+        self._flush_wanted = threading.Event()
+        self.vocab_version = 0  # bumped when categories/models/tags change; lets callers cache lists
+        self.revision = 0  # bumped by every mutation (ETags of the list endpoints)
+        self.text_revision = 0  # bumped by every change to the text index (relevance cursors)
+        self._search_cache = OrderedDict()  # (query, scored) -> _search result, for _search_cache_revision
+        self._search_cache_revision = None
+        self._changes = []  # (pid, "put"/"del") since the last change event
+        self._event_vocab = 0
+        self._lock = threading.RLock()
+        self.thumbs = ThumbnailStore(self.path / "thumbs")
         self._last_saved_id = None  # Track last saved prompt for overwrite logic
+        # The library is read on a background thread so ComfyUI's startup does not wait
+        # for it; public methods block until it is there (see _locked)
+        self._ready = threading.Event()
+        self._load_error = None
+        threading.Thread(target=self._load_db, name="ps-load", daemon=True).start()
+    
+    def _load_db(self):
+        started = time.perf_counter()
+        try:
+            self.data = self._load(replay=self.storage == "journal")
+            prompts = self.data["prompts"]
+            for pid, p in prompts.items():
+                prompts[pid] = PromptRecord.from_dict(p)
+            if self.storage == "journal":
+                self._open_journal()
+            self._migrate_thumbnails()
+            self._build_indexes()
+            if self.durability == "deferred":
+                threading.Thread(target=self._flusher, name="ps-flush", daemon=True).start()
+            atexit.register(self.flush)
+            print(f"[PS] Library ready: {len(self.data['prompts'])} prompts ({time.perf_counter() - started:.2f}s)")
+        except Exception as e:
+            self._load_error = e
+            print(f"[PS] Loading the library failed: {e}")
+        finally:
+            self._ready.set()
     
-    def _load(self):
+    def _wait_ready(self):
+        self._ready.wait()
+        if self._load_error:
+            raise RuntimeError(f"Prompt library failed to load: {self._load_error}")
+    
+    def _load(self, replay=True):
+        data = None
         if self.file.exists():
             try:
                 with open(self.file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                    data.setdefault("prompts", {})
-                    data.setdefault("categories", [])
-                    data.setdefault("models", [])
-                    data.setdefault("tags", [])
-                    return data
             except:
                 pass
-        return {
-            "prompts": {},
-            "categories": [],
-            "models": [],
-            "tags": []
-        }
+        if not isinstance(data, dict):
+            data = {}
+        data.setdefault("prompts", {})
+        data.setdefault("categories", [])
+        data.setdefault("models", [])
+        data.setdefault("tags", [])
+        if replay:
+            # Old journal first: it holds records from a compaction that never finished
+            for journal in (self.journal_old, self.journal):
+                self._replay(journal, data)
+        return data
     
     def _save(self):
-        with open(self.file, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        self._write_snapshot(self.data, indent=2)
+    
+    def _write_snapshot(self, data, indent=None):
+        """Atomically replace prompts.json (write temp file, fsync, rename)"""
+        started = time.perf_counter()
+        tmp = self.file.with_name(self.file.name + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=indent, ensure_ascii=False, default=PromptRecord.to_dict,
+                      separators=None if indent else (',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(tmp, self.file)
+        metrics.persisted("snapshot", time.perf_counter() - started, size)
+    
+    # ------------------------------------------------------------------------
+    # Journal
+    # ------------------------------------------------------------------------
+    # One line per commit, a JSON array of ops, so a commit is replayed whole or not at all:
+    #   ["put", pid, prompt] | ["del", pid] | ["add", key, value] | ["rm", key, value]
+    
+    @staticmethod
+    def _apply(data, ops):
+        for op in ops:
+            kind = op[0]
+            if kind == "put":
+                data["prompts"][op[1]] = op[2]
+            elif kind == "del":
+                data["prompts"].pop(op[1], None)
+            elif kind == "add":
+                if op[2] not in data.setdefault(op[1], []):
+                    data[op[1]].append(op[2])
+            elif kind == "rm":
+                if op[2] in data.get(op[1], []):
+                    data[op[1]].remove(op[2])
+    
+    def _replay(self, journal, data):
+        """Apply a journal on top of the snapshot. A torn last line (crash mid-write) is cut off."""
+        if not journal.exists():
+            return
+        good = 0
+        with open(journal, 'rb+') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    ops = json.loads(line)
+                except ValueError:
+                    break
+                self._apply(data, ops)
+                good += len(line)
+            size = f.seek(0, os.SEEK_END)
+            if good < size:
+                f.truncate(good)
+                print(f"[PS] Dropped {size - good} bytes of incomplete journal data from {journal.name}")
+    
+    def _open_journal(self):
+        if self.journal_old.exists():
+            # A previous compaction did not finish - fold everything into the snapshot now
+            self._write_snapshot(self.data)
+            for journal in (self.journal, self.journal_old):
+                if journal.exists():
+                    os.remove(journal)
+        self._journal_fh = open(self.journal, 'ab')
+        self._journal_size = self._journal_fh.seek(0, os.SEEK_END)
+    
+    def _commit(self, *ops):
+        """Record a mutation (journal ops). It is persisted by flush(), now or later depending on durability."""
+        self.revision += 1
+        if any(op[0] in ("add", "rm") for op in ops):
+            self.vocab_version += 1
+        with self._journal_lock:
+            self._pending.extend(ops)
+            self._dirty = True
+        self._changes.extend((op[1], op[0]) for op in ops if op[0] in ("put", "del"))
+        if self._batch_depth:
+            return
+        if self.durability == "deferred":
+            self._flush_wanted.set()
+        else:
+            self.flush()
+        self._publish()
+    
+    def _put(self, pid):
+        # References the live record, so a flush writes its latest state
+        return ("put", pid, self.data["prompts"][pid])
+    
+    @staticmethod
+    def _coalesce(ops):
+        """Drop puts/dels of a prompt that a later op on the same prompt supersedes"""
+        last = {op[1]: i for i, op in enumerate(ops) if op[0] in ("put", "del")}
+        return [op for i, op in enumerate(ops) if op[0] not in ("put", "del") or last[op[1]] == i]
     
-    def _hash(self, text):
+    @_locked
+    def flush(self):
+        """
+        Persist pending mutations now: one journal line for all of them (replayed
+        whole or not at all), or one rewrite of prompts.json in json mode.
+        """
+        with self._journal_lock:
+            if not self._dirty:
+                return
+            ops, self._pending, self._dirty = self._pending, [], False
+            if self.storage != "journal":
+                self._save()
+                return
+            started = time.perf_counter()
+            line = json.dumps(self._coalesce(ops), ensure_ascii=False, separators=(',', ':'),
+                              default=PromptRecord.to_dict).encode('utf-8') + b'\n'
+            self._journal_fh.write(line)
+            self._journal_fh.flush()
+            if self.durability == "fsync":
+                os.fsync(self._journal_fh.fileno())
+            metrics.persisted("journal", time.perf_counter() - started, len(line))
+            self._journal_size += len(line)
+            if self._journal_size >= self.compact_threshold and not self._compacting:
+                self._start_compaction()
+    
+    @contextmanager
+    def batch(self):
+        """Group several mutations so they are persisted once, as a single commit"""
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+            if not self._batch_depth and self._dirty:
+                if self.durability == "deferred":
+                    self._flush_wanted.set()
+                else:
+                    self.flush()
+                self._publish()
+    
+    def _flusher(self):
+        """Background writer for deferred durability: waits for a mutation, lets more arrive, flushes"""
+        while True:
+            self._flush_wanted.wait()
+            time.sleep(self.flush_interval)
+            self._flush_wanted.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[PS] Flush failed: {e}")
+    
+    # ------------------------------------------------------------------------
+    # Change events
+    # ------------------------------------------------------------------------
+    # Every commit is broadcast as one "ps-prompts" event, so open sidebars patch their
+    # list instead of refetching it:
+    #   {"revision": n, "vocab": bool, "changes": [{"op": "put", "prompt": {...}} | {"op": "del", "id": pid}]}
+    # Bulk commits (import, harvest) send {"revision": n, "vocab": bool, "reset": true} instead.
+    
+    EVENT_FIELDS = ("id", "text", "model", "category", "tags", "rating", "thumb", "updated_at")
+    EVENT_MAX_CHANGES = 50
+    
+    def _event_prompt(self, pid):
+        return self.data["prompts"].get(pid)
+    
+    def _publish(self):
+        """Broadcast the changes recorded since the last event (caller holds the lock)"""
+        if self._batch_depth:
+            return
+        changes, self._changes = self._changes, []
+        vocab = self.vocab_version != self._event_vocab
+        self._event_vocab = self.vocab_version
+        if not changes and not vocab:
+            return
+        last = dict(changes)  # latest op per prompt
+        event = {"revision": self.revision, "vocab": vocab}
+        if len(last) > self.EVENT_MAX_CHANGES:
+            event["reset"] = True
+        else:
+            event["changes"] = []
+            for pid, op in last.items():
+                p = self._event_prompt(pid) if op == "put" else None
+                if p is None:
+                    event["changes"].append({"op": "del", "id": pid})
+                else:
+                    prompt = {k: p.get(k) for k in self.EVENT_FIELDS}
+                    prompt["tags"] = list(prompt["tags"] or [])
+                    event["changes"].append({"op": "put", "prompt": prompt})
+        broadcast("ps-prompts", event)
+    
+    def _start_compaction(self):
+        """Rotate the journal and write a fresh snapshot from a copy of the data in the background"""
+        with self._journal_lock:
+            self._compacting = True
+            self._journal_fh.close()
+            if self.journal_old.exists():
+                # Last compaction failed; keep its records ahead of the current ones
+                with open(self.journal_old, 'ab') as old, open(self.journal, 'rb') as cur:
+                    shutil.copyfileobj(cur, old)
+                os.remove(self.journal)
+            else:
+                os.replace(self.journal, self.journal_old)
+            self._journal_fh = open(self.journal, 'ab')
+            self._journal_size = 0
+            # Copy records so the writer thread never iterates a dict that is being mutated
+            snapshot = {k: list(v) if isinstance(v, list) else v for k, v in self.data.items()}
+            snapshot["prompts"] = {pid: p.copy() for pid, p in self.data["prompts"].items()}
+        threading.Thread(target=self._compact, args=(snapshot,), name="ps-compact", daemon=True).start()
+    
+    def _compact(self, snapshot):
+        try:
+            self._write_snapshot(snapshot)
+            os.remove(self.journal_old)
+        except Exception as e:
+            print(f"[PS] Journal compaction failed: {e}")
+        finally:
+            self._compacting = False
+    
+    # ------------------------------------------------------------------------
+    # Thumbnails
+    # ------------------------------------------------------------------------
+    
+    def _extract_thumbnail(self, p, thumbnails=None):
+        """
+        Resolve a prompt's thumbnail to a store key in p["thumb"]: inline base64
+        ("thumbnail", older versions and exports) or bytes from an export's
+        "thumbnails" map are written to the store; unknown keys are dropped.
+        """
+        inline = p.pop("thumbnail", None)
+        key = p.get("thumb")
+        if inline:
+            p["thumb"] = self.thumbs.put_base64(inline)
+        elif key and thumbnails and key in thumbnails:
+            p["thumb"] = self.thumbs.put_base64(thumbnails[key])
+        elif key and not self.thumbs.exists(key):
+            p["thumb"] = None
+        else:
+            p.setdefault("thumb", None)
+        return p
+    
+    def _migrate_thumbnails(self):
+        """Move inline base64 thumbnails from older versions into the thumbnail store"""
+        moved = [pid for pid, p in self.data["prompts"].items() if "thumbnail" in p]
+        if not moved:
+            return
+        for pid in moved:
+            self._extract_thumbnail(self.data["prompts"][pid])
+        if self.storage == "journal":
+            self._start_compaction()
+        else:
+            self._save()
+        print(f"[PS] Moved {len(moved)} inline thumbnails to {self.thumbs.path}")
+    
+    def thumbnail_export(self, prompts):
+        """key -> base64 for the thumbnails referenced by prompts (each image once)"""
+        out = {}
+        for p in prompts:
+            key = p.get("thumb")
+            if key and key not in out:
+                data = self.thumbs.get(key)
+                if data:
+                    out[key] = base64.b64encode(data).decode('ascii')
+        return out
+    
+    # ------------------------------------------------------------------------
+    # Indexes
+    # ------------------------------------------------------------------------
+    # hash/category/model/tag/rating -> {pid: None} (dicts as ordered sets, so their
+    # sizes are the usage counts), a count of prompts with a thumbnail, sets mirroring
+    # the vocabulary lists, and an inverted text index token -> {pid: term frequency}
+    # with a sorted token list for prefix lookups. _order keeps the ids sorted by
+    # (sort value, id) for each ORDERS sort; new ids wait in _order_new until a query
+    # needs the order, so bulk inserts sort once. Mutators call _unindex(pid) before
+    # changing an indexed field and _index(pid) afterwards (_unindex_fields/_index_fields
+    # when the text stays the same).
+    
+    _INDEX_ATTRS = ("_by_hash", "_by_category", "_by_model", "_by_tag", "_by_rating", "_thumb_count",
+                    "_vocabulary", "_postings", "_doc_len", "_total_len", "_token_list", "_order")
+    VOCABULARIES = ("categories", "models", "tags")
+    ORDERS = ("updated_at", "rating", "used_count")
+    _PREFIX_MIN = 3  # shorter search terms only match whole tokens
+    _PREFIX_MAX = 50  # tokens a prefix expands to at most (the ones closest to it)
+    
+    def _build_indexes(self):
+        self._by_hash = {}
+        self._by_category = {}
+        self._by_model = {}
+        self._by_tag = {}
+        self._by_rating = {}
+        self._thumb_count = 0
+        self._vocabulary = {key: set(self.data[key]) for key in self.VOCABULARIES}
+        self._postings = {}
+        self._doc_len = {}
+        self._total_len = 0
+        self._token_list = None  # sorted once below instead of insort per token
+        self._order = {sort: [] for sort in self.ORDERS}
+        self._order_new = set()
+        for pid in self.data["prompts"]:
+            self._index(pid)
+        self._token_list = sorted(self._postings)
+        self._sync_order()
+    
+    def _index_keys(self, p):
+        yield self._by_hash, p.hash
+        yield self._by_category, p.category
+        yield self._by_model, p.model
+        for t in p.tags:
+            yield self._by_tag, t.lower()
+        yield self._by_rating, p.rating or None
+    
+    def _index_fields(self, pid):
+        p = self.data["prompts"][pid]
+        for index, key in self._index_keys(p):
+            if key is not None:
+                index.setdefault(key, {})[pid] = None
+        if p.thumb:
+            self._thumb_count += 1
+        self._order_new.add(pid)
+    
+    def _unindex_fields(self, pid):
+        p = self.data["prompts"][pid]
+        for index, key in self._index_keys(p):
+            bucket = index.get(key)
+            if bucket is not None:
+                bucket.pop(pid, None)
+                if not bucket:
+                    del index[key]
+        if p.thumb:
+            self._thumb_count -= 1
+        if pid in self._order_new:
+            self._order_new.discard(pid)
+        else:
+            for sort, order in self._order.items():
+                key = self._order_key(sort)
+                i = bisect.bisect_left(order, key(pid), key=key)
+                if i < len(order) and order[i] == pid:
+                    del order[i]
+    
+    def _order_key(self, sort):
+        value = self._sort_key(sort)
+        prompts = self.data["prompts"]
+        return lambda pid: (value(prompts[pid]), pid)
+    
+    def _sync_order(self):
+        """Merge _order_new into the sort orders: insort a few, re-sort for many"""
+        if not self._order_new:
+            return
+        for sort, order in self._order.items():
+            key = self._order_key(sort)
+            if len(self._order_new) * 64 < len(order):
+                for pid in self._order_new:
+                    bisect.insort(order, pid, key=key)
+            else:
+                order.extend(self._order_new)
+                order.sort(key=key)
+        self._order_new.clear()
+    
+    def _index(self, pid):
+        self._index_fields(pid)
+        p = self.data["prompts"][pid]
+        tokens = document_tokens(p.text)
+        self.text_revision += 1
+        if tokens:
+            self._doc_len[pid] = len(tokens)
+            self._total_len += len(tokens)
+            for token, tf in Counter(tokens).items():
+                posting = self._postings.get(token)
+                if posting is None:
+                    posting = self._postings[token] = {}
+                    if self._token_list is not None:
+                        bisect.insort(self._token_list, token)
+                posting[pid] = tf
+    
+    def _unindex(self, pid):
+        self._unindex_fields(pid)
+        p = self.data["prompts"][pid]
+        self.text_revision += 1
+        if pid in self._doc_len:
+            self._total_len -= self._doc_len.pop(pid)
+            for token in set(document_tokens(p.text)):
+                posting = self._postings.get(token)
+                if posting is not None:
+                    posting.pop(pid, None)
+                    if not posting:
+                        del self._postings[token]
+                        i = bisect.bisect_left(self._token_list, token)
+                        if i < len(self._token_list) and self._token_list[i] == token:
+                            del self._token_list[i]
+    
+    def _vocab_insert(self, key, value):
+        """Append value to a vocabulary list; its journal op, or None if it was already there"""
+        if not value or not isinstance(value, str) or value in self._vocabulary[key]:
+            return None
+        self._vocabulary[key].add(value)
+        self.data[key].append(value)
+        return ("add", key, value)
+    
+    def _vocab_delete(self, key, value):
+        if value not in self._vocabulary[key]:
+            return None
+        self._vocabulary[key].discard(value)
+        self.data[key].remove(value)
+        return ("rm", key, value)
+    
+    def _find_hash(self, text_hash):
+        bucket = self._by_hash.get(text_hash)
+        return next(iter(bucket)) if bucket else None
+    
+    @_locked
+    def check_indexes(self):
+        """Self-test: rebuild the indexes from the data and return any drift from the live ones"""
+        self._sync_order()
+        live = {name: getattr(self, name) for name in self._INDEX_ATTRS}
+        self._build_indexes()
+        problems = []
+        for name, old in live.items():
+            new = getattr(self, name)
+            if isinstance(old, dict):
+                for key in set(old) | set(new):
+                    if old.get(key) != new.get(key):
+                        problems.append(f"{name}[{key!r}]: {old.get(key)!r} != {new.get(key)!r}")
+            elif old != new:
+                problems.append(f"{name}: live value differs from rebuilt value")
+            setattr(self, name, old)
+        return problems
+    
+    def _search(self, query, scored=True):
+        """
+        pid -> BM25 relevance for prompts where every query term matches one of their
+        tokens: whole, or as a prefix for terms of _PREFIX_MIN or more characters (an
+        exact token counts double). None if the query has no terms. Unscored, only the
+        keys matter; the result may then be an index posting, which must not be modified.
+        """
+        terms = search_terms(query)
+        if not terms:
+            return None
+        expanded = []
+        for term in terms:
+            if len(term) < self._PREFIX_MIN:
+                tokens = [term] if term in self._postings else []
+            else:
+                lo = bisect.bisect_left(self._token_list, term)
+                hi = bisect.bisect_left(self._token_list, term + "\U0010ffff", lo)
+                tokens = self._token_list[lo:min(hi, lo + self._PREFIX_MAX)]
+            if not tokens:
+                return {}
+            postings = [self._postings[token] for token in tokens]
+            expanded.append((sum(map(len, postings)), term, tokens, postings))
+        # Rarest term first: the others then only probe the prompts it left
+        expanded.sort(key=lambda e: e[0])
+        
+        if not scored:
+            matched = None
+            for _, _, _, postings in expanded:
+                if matched is None:
+                    matched = postings[0] if len(postings) == 1 else dict.fromkeys(pid for p in postings for pid in p)
+                else:
+                    matched = {pid: None for pid in matched if any(pid in p for p in postings)}
+                if not matched:
+                    break
+            return matched
+        
+        n = len(self._doc_len) or 1
+        avg_len = (self._total_len / n) or 1
+        doc_len = self._doc_len
+        # weight * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avg_len)), k1 = 1.2, b = 0.75
+        k_base, k_len = 1.2 * 0.25, 1.2 * 0.75 / avg_len
+        scores = None
+        for _, term, tokens, postings in expanded:
+            term_scores = {}
+            for token, posting in zip(tokens, postings):
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                weight = (idf if token == term else idf / 2) * 2.2
+                if scores is None:
+                    items = posting.items()
+                elif len(scores) < len(posting):
+                    items = ((pid, posting[pid]) for pid in scores if pid in posting)
+                else:
+                    items = ((pid, tf) for pid, tf in posting.items() if pid in scores)
+                token_scores = {pid: weight * tf / (tf + k_base + k_len * doc_len[pid]) for pid, tf in items}
+                if not term_scores:
+                    term_scores = token_scores
+                    continue
+                for pid, s in token_scores.items():
+                    if s > term_scores.get(pid, 0):
+                        term_scores[pid] = s
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {pid: scores[pid] + s for pid, s in term_scores.items()}
+            if not scores:
+                break
+        return scores
+    
+    def text_hash(self, text):
+        """Hash a prompt text is deduplicated by (the "hash" field)"""
         return hashlib.sha256(text.encode()).hexdigest()[:12]
     
     def _id(self):
         import random, string
         return ''.join(random.choices(string.ascii_lowercase + string.digits, k=10))
     
+    @staticmethod
+    def _split_tags(tags):
+        result = []
+        for t in (tags or "").split(","):
+            t = t.strip().lower()
+            if t and t not in result:
+                result.append(t)
+        return result
+    
+    @_locked
     def save_prompt(self, text, saver_id=None, model=None, category=None, tags=None):
         """
         Save prompt logic with per-saver tracking:
@@ -77,7 +1168,7 @@ class PromptDB:
             return None
         
         text = text.strip()
-        text_hash = self._hash(text)
+        text_hash = self.text_hash(text)
         now = datetime.now().isoformat()
         
         # Initialize per-saver tracking if needed
@@ -89,13 +1180,15 @@ class PromptDB:
         
         # Process new tags
         new_tags = []
+        vocab_ops = []
         if tags:
             for t in tags.split(","):
                 t = t.strip().lower()
                 if t:
                     new_tags.append(t)
-                    if t not in self.data["tags"]:
-                        self.data["tags"].append(t)
+                    op = self._vocab_insert("tags", t)
+                    if op:
+                        vocab_ops.append(op)
         
         # Helper to merge tags (stack without duplicates)
         def merge_tags(existing, new):
@@ -110,6 +1203,7 @@ class PromptDB:
         if last_id and last_id in self.data["prompts"]:
             pid = last_id
             p = self.data["prompts"][pid]
+            self._unindex(pid)
             p["text"] = text
             p["hash"] = text_hash
             if model and model != "none":
@@ -121,31 +1215,33 @@ class PromptDB:
                 p["tags"] = merge_tags(p.get("tags", []), new_tags)
             p["updated_at"] = now
             p["used_count"] = p.get("used_count", 0) + 1
-            self._save()
-            print(f"[PS] Overwritten prompt {pid} (saver: {track_key})")
+            self._index(pid)
+            self._commit(self._put(pid), *vocab_ops)
             return pid
         
         # Check if prompt with same hash already exists
-        for pid, p in self.data["prompts"].items():
-            if p.get("hash") == text_hash:
-                # Update existing
-                if model and model != "none":
-                    p["model"] = model
-                if category and category != "none":
-                    p["category"] = category
-                # Stack tags
-                if new_tags:
-                    p["tags"] = merge_tags(p.get("tags", []), new_tags)
-                p["updated_at"] = now
-                p["used_count"] = p.get("used_count", 0) + 1
-                self._saver_last_ids[track_key] = pid
-                self._save()
-                print(f"[PS] Updated existing prompt {pid} (same hash, saver: {track_key})")
-                return pid
+        pid = self._find_hash(text_hash)
+        if pid:
+            p = self.data["prompts"][pid]
+            self._unindex(pid)
+            # Update existing
+            if model and model != "none":
+                p["model"] = model
+            if category and category != "none":
+                p["category"] = category
+            # Stack tags
+            if new_tags:
+                p["tags"] = merge_tags(p.get("tags", []), new_tags)
+            p["updated_at"] = now
+            p["used_count"] = p.get("used_count", 0) + 1
+            self._index(pid)
+            self._saver_last_ids[track_key] = pid
+            self._commit(self._put(pid), *vocab_ops)
+            return pid
         
         # Create new
         pid = self._id()
-        self.data["prompts"][pid] = {
+        self.data["prompts"][pid] = PromptRecord.from_dict({
             "id": pid,
             "text": text,
             "hash": text_hash,
@@ -153,16 +1249,17 @@ class PromptDB:
             "category": category if category and category != "none" else None,
             "tags": new_tags,
             "rating": None,
-            "thumbnail": None,
+            "thumb": None,
             "created_at": now,
             "updated_at": now,
             "used_count": 1
-        }
+        })
+        self._index(pid)
         self._saver_last_ids[track_key] = pid
-        self._save()
-        print(f"[PS] Created new prompt {pid} (saver: {track_key}), _saver_last_ids now has {len(self._saver_last_ids)} entries")
+        self._commit(self._put(pid), *vocab_ops)
         return pid
     
+    @_locked
     def reset_last_saved(self, saver_id=None):
         """Reset last_saved_id for specific saver - next save will create new"""
         if not hasattr(self, '_saver_last_ids'):
@@ -171,80 +1268,255 @@ class PromptDB:
         track_key = saver_id or 'default'
         if track_key in self._saver_last_ids:
             del self._saver_last_ids[track_key]
-        print(f"[PS] Reset saver: {track_key}")
     
-    def get_prompts(self, search=None, category=None, model=None, tag=None, rating_min=None, limit=50, sort="updated_at"):
-        results = []
-        for p in self.data["prompts"].values():
-            if search and search.lower() not in p.get("text", "").lower():
-                continue
-            if category and category not in ["All", "none", ""] and p.get("category") != category:
-                continue
-            if model and model not in ["All", "none", ""] and p.get("model") != model:
-                continue
-            if tag and tag not in ["All", ""] and tag.lower() not in [t.lower() for t in p.get("tags", [])]:
-                continue
-            if rating_min and (p.get("rating") or 0) < rating_min:
-                continue
-            results.append(p)
-        
+    # ------------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------------
+    
+    @staticmethod
+    def _sort_key(sort, scores=None):
+        """Sort value of a prompt; relevance needs the scores of a text search"""
+        if sort == "relevance" and scores is not None:
+            return lambda p: scores.get(p.id, 0)
         if sort == "rating":
-            results.sort(key=lambda x: x.get("rating") or 0, reverse=True)
-        elif sort == "used_count":
-            results.sort(key=lambda x: x.get("used_count", 0), reverse=True)
+            return lambda p: p.rating or 0
+        if sort == "used_count":
+            return lambda p: p.used_count or 0
+        return lambda p: sort_time(p.updated_at)
+    
+    @staticmethod
+    def _encode_cursor(value, pid, revision=None):
+        fields = [value, pid] if revision is None else [value, pid, revision]
+        raw = json.dumps(fields, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip("=")
+    
+    @staticmethod
+    def _decode_cursor(cursor, revision=None):
+        """
+        (sort value, id) of the last row of the previous page; ValueError if malformed.
+        Relevance cursors also carry the text_revision they were made at: any change to
+        the text index moves the scores, so a cursor from before it is rejected too.
+        """
+        try:
+            value, pid, *rest = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except Exception:
+            raise ValueError("Invalid cursor")
+        if not isinstance(value, (str, int, float)) or not isinstance(pid, str) or len(rest) > 1:
+            raise ValueError("Invalid cursor")
+        if revision is not None and rest != [revision]:
+            raise ValueError("Stale cursor: the search results have changed, start from the first page")
+        return value, pid
+    
+    def _filters(self, category=None, model=None, tag=None, rating_min=None, scores=None):
+        """
+        Index buckets a match has to be in, smallest first: a prompt matches if its id is
+        in one bucket of every group (a group has several for rating_min). [] = all prompts.
+        """
+        groups = []
+        if scores is not None:
+            groups.append([scores])
+        if category and category not in ["All", "none", ""]:
+            groups.append([self._by_category.get(category, {})])
+        if model and model not in ["All", "none", ""]:
+            groups.append([self._by_model.get(model, {})])
+        if tag and tag not in ["All", ""]:
+            groups.append([self._by_tag.get(tag.lower(), {})])
+        if rating_min and rating_min > 0:
+            groups.append([bucket for rating, bucket in self._by_rating.items() if rating >= rating_min])
+        groups.sort(key=lambda group: sum(map(len, group)))
+        return groups
+    
+    @staticmethod
+    def _narrow(ids, groups):
+        """The ids that are in every group, filtered in C (a group of several buckets is merged first)"""
+        for group in groups:
+            bucket = group[0] if len(group) == 1 else dict.fromkeys(chain.from_iterable(group))
+            ids = filter(bucket.__contains__, ids)
+        return ids
+    
+    def _ids(self, groups):
+        """Ids of the matches of _filters groups; the smallest group drives"""
+        if not groups:
+            return iter(self.data["prompts"])
+        return self._narrow(chain.from_iterable(groups[0]), groups[1:])
+    
+    def _matching(self, search=None, category=None, model=None, tag=None, rating_min=None, scores=None):
+        # Narrow by the search and the indexes first, the smallest group drives the scan
+        groups = self._filters(category, model, tag, rating_min, scores)
+        candidates = map(self.data["prompts"].__getitem__, self._ids(groups))
+        if scores is None and search:
+            # Queries without word characters fall back to a substring match
+            needle = search.lower()
+            candidates = (p for p in candidates if needle in (p.text or "").lower())
+        return candidates
+    
+    def _cached_search(self, query, scored):
+        """_search, remembered for the current revision: a page and its facets share one search"""
+        if self._search_cache_revision != self.revision:
+            self._search_cache.clear()
+            self._search_cache_revision = self.revision
+        for key in ((query, True),) if scored else ((query, False), (query, True)):
+            if key in self._search_cache:
+                self._search_cache.move_to_end(key)
+                return self._search_cache[key]
+        result = self._search_cache[(query, scored)] = self._search(query, scored)
+        while len(self._search_cache) > 4:
+            self._search_cache.popitem(last=False)
+        return result
+    
+    def _top(self, search, category, model, tag, rating_min, sort, count, cursor=None):
+        """
+        (the first count matches by (sort value, id) descending after cursor, the number
+        of matches, a match's cursor fields). For the ORDERS sorts, the order index is walked from
+        the top while that is cheaper than ranking every match.
+        """
+        scores = self._cached_search(search, scored=sort == "relevance") if search else None
+        groups = self._filters(category, model, tag, rating_min, scores)
+        prompts = self.data["prompts"]
+        text_only = scores is None and bool(search)
+        if text_only:
+            total = sum(1 for _ in self._matching(search, category, model, tag, rating_min, scores))
+        elif not groups:
+            total = len(prompts)
+        elif len(groups) == 1:
+            total = sum(map(len, groups[0]))
         else:
-            results.sort(key=lambda x: x.get("updated_at", ""), reverse=True)
-        return results[:limit]
+            total = len(list(self._ids(groups)))
+        
+        value = self._sort_key(sort, scores)
+        ranked = sort == "relevance" and scores is not None
+        
+        def key(p):
+            return (value(p), p.id)
+        
+        def cursor_fields(p):
+            return (*key(p), self.text_revision) if ranked else key(p)
+        
+        after = self._decode_cursor(cursor, self.text_revision if ranked else None) if cursor else None
+        # A walk visits about count * n / total ids at a few C-level lookups each; ranking
+        # calls key() on every match
+        if not ranked and not text_only and (not groups or count * len(prompts) <= 16 * total * total):
+            order_sort = sort if sort in self.ORDERS else "updated_at"
+            self._sync_order()
+            order = self._order[order_sort]
+            end = len(order)
+            if after is not None:
+                try:
+                    end = bisect.bisect_left(order, after, key=self._order_key(order_sort))
+                except TypeError:
+                    raise ValueError("Cursor does not match sort")
+            ids = self._narrow(islice(reversed(order), len(order) - end, None), groups)
+            return [prompts[pid] for pid in islice(ids, count)], total, cursor_fields
+        
+        if ranked:
+            # Rank (score, id) pairs, and only look up the records of the page
+            if len(groups) == 1:
+                ranks = zip(scores.values(), scores)
+            else:
+                ranks = ((scores[pid], pid) for pid in self._ids(groups))
+            if after is not None:
+                ranks = (rank for rank in ranks if rank < after)
+            try:
+                return [prompts[pid] for _, pid in heapq.nlargest(count, ranks)], total, cursor_fields
+            except TypeError:
+                raise ValueError("Cursor does not match sort")
+        
+        matches = self._matching(search, category, model, tag, rating_min, scores)
+        if after is not None:
+            matches = (p for p in matches if key(p) < after)
+        try:
+            return heapq.nlargest(count, matches, key=key), total, cursor_fields
+        except TypeError:
+            raise ValueError("Cursor does not match sort")
+    
+    @_locked
+    def get_prompts(self, search=None, category=None, model=None, tag=None, rating_min=None, limit=50, sort="updated_at"):
+        page, _, _ = self._top(search, category, model, tag, rating_min, sort, limit)
+        # Copies, so callers can serialize them outside the lock
+        return [p.to_dict() for p in page]
+    
+    @_locked
+    def get_prompts_page(self, search=None, category=None, model=None, tag=None, rating_min=None,
+                         limit=50, sort="updated_at", offset=0, cursor=None):
+        """
+        One page of matches plus the total count. Rows are ordered by (sort value, id),
+        so a cursor from the previous page still points at the same place when prompts
+        are inserted ahead of it - except for sort=relevance, where any change to the
+        text index rescores the matches and the cursor is rejected (ValueError) instead.
+        offset is applied after the cursor.
+        """
+        page, total, fields = self._top(search, category, model, tag, rating_min, sort, offset + limit + 1, cursor)
+        page = page[offset:]
+        next_cursor = self._encode_cursor(*fields(page[limit - 1])) if limit and len(page) > limit else None
+        return {"prompts": [p.to_dict() for p in page[:limit]], "total": total, "next_cursor": next_cursor}
     
+    @_locked
     def get_prompt(self, pid):
-        return self.data["prompts"].get(pid)
+        p = self.data["prompts"].get(pid)
+        return p.to_dict() if p is not None else None
     
+    @_locked
     def rate(self, pid, rating):
         if pid in self.data["prompts"]:
+            self._unindex_fields(pid)
             self.data["prompts"][pid]["rating"] = rating if rating > 0 else None
-            self._save()
+            self._index_fields(pid)
+            self._commit(self._put(pid))
             return True
         return False
     
+    @_locked
     def delete_prompt(self, pid):
         if pid in self.data["prompts"]:
+            self._unindex(pid)
             del self.data["prompts"][pid]
             if self._last_saved_id == pid:
                 self._last_saved_id = None
-            self._save()
+            self._commit(("del", pid))
             return True
         return False
     
-    def set_thumbnail(self, pid, thumbnail_base64):
+    @_locked
+    def set_thumbnail(self, pid, thumb, source=None):
+        """thumb is a ThumbnailStore key, source the image it was made from (kept for re-rendering)"""
         if pid in self.data["prompts"]:
-            self.data["prompts"][pid]["thumbnail"] = thumbnail_base64
-            self._save()
-            print(f"[PS] Thumbnail set for prompt {pid}")
+            self._unindex_fields(pid)
+            self.data["prompts"][pid]["thumb"] = thumb
+            self._index_fields(pid)
+            if source:
+                self.data["prompts"][pid]["source"] = source
+            self._commit(self._put(pid))
             return True
         print(f"[PS] Cannot set thumbnail - prompt {pid} not found")
         return False
     
+    @_locked
+    def thumbnail_sources(self):
+        """(pid, thumb, source) of every prompt"""
+        return [(pid, p.get("thumb"), p.get("source")) for pid, p in self.data["prompts"].items()]
+    
+    @_locked
     def get_all_last_saved_ids(self):
         """Get all recently saved prompt IDs (for thumbnail assignment)"""
         if not hasattr(self, '_saver_last_ids'):
             self._saver_last_ids = {}
-        ids = list(self._saver_last_ids.values())
-        print(f"[PS] get_all_last_saved_ids: {ids} (from {len(self._saver_last_ids)} savers)")
-        return ids
+        return list(self._saver_last_ids.values())
     
+    @_locked
     def register_saved_prompt(self, saver_id, prompt_id):
         """Register a prompt as recently saved (for thumbnail assignment)"""
         if not hasattr(self, '_saver_last_ids'):
             self._saver_last_ids = {}
         self._saver_last_ids[saver_id] = prompt_id
-        print(f"[PS] Registered: saver={saver_id} -> prompt={prompt_id}")
     
+    @_locked
     def update_prompt(self, pid, model=None, category=None, tags=None):
         """Update prompt metadata"""
         if pid not in self.data["prompts"]:
             return False
         
         p = self.data["prompts"][pid]
+        self._unindex(pid)
         
         if model is not None:
             p["model"] = model if model and model != "none" else None
@@ -252,6 +1524,7 @@ class PromptDB:
         if category is not None:
             p["category"] = category if category and category != "none" else None
         
+        vocab_ops = []
         if tags is not None:
             tag_list = []
             if tags:
@@ -259,187 +1532,1850 @@ class PromptDB:
                     t = t.strip().lower()
                     if t:
                         tag_list.append(t)
-                        if t not in self.data["tags"]:
-                            self.data["tags"].append(t)
+                        op = self._vocab_insert("tags", t)
+                        if op:
+                            vocab_ops.append(op)
             p["tags"] = tag_list
         
         p["updated_at"] = datetime.now().isoformat()
-        self._save()
+        self._index(pid)
+        self._commit(self._put(pid), *vocab_ops)
         return True
     
+    @_locked
     def get_categories(self):
-        return self.data.get("categories", [])
+        return list(self.data.get("categories", []))
     
+    @_locked
     def add_category(self, cat):
-        if cat and cat not in self.data["categories"]:
-            self.data["categories"].append(cat)
-            self._save()
-            return True
-        return False
+        op = self._vocab_insert("categories", cat)
+        if op:
+            self._commit(op)
+        return op is not None
     
+    @_locked
     def delete_category(self, cat):
-        if cat in self.data["categories"]:
-            self.data["categories"].remove(cat)
-            self._save()
-            return True
-        return False
+        op = self._vocab_delete("categories", cat)
+        if op:
+            self._commit(op)
+        return op is not None
     
+    @_locked
     def get_models(self):
-        return self.data.get("models", [])
+        return list(self.data.get("models", []))
     
+    @_locked
     def add_model(self, model):
-        if model and model not in self.data.get("models", []):
-            self.data.setdefault("models", []).append(model)
-            self._save()
-            return True
-        return False
+        op = self._vocab_insert("models", model)
+        if op:
+            self._commit(op)
+        return op is not None
     
+    @_locked
     def delete_model(self, model):
-        if model in self.data.get("models", []):
-            self.data["models"].remove(model)
-            self._save()
-            return True
-        return False
+        op = self._vocab_delete("models", model)
+        if op:
+            self._commit(op)
+        return op is not None
     
+    @_locked
     def get_tags(self):
-        return self.data.get("tags", [])
+        return list(self.data.get("tags", []))
     
+    @_locked
     def get_stats(self):
-        prompts = list(self.data["prompts"].values())
+        """Counts kept by the indexes; nothing here walks the prompts"""
         return {
-            "total": len(prompts),
-            "rated": sum(1 for p in prompts if p.get("rating")),
-            "with_thumbnail": sum(1 for p in prompts if p.get("thumbnail")),
-            "categories": len(self.data.get("categories", [])),
-            "models": len(self.data.get("models", [])),
-            "tags": len(self.data.get("tags", []))
+            "total": len(self.data["prompts"]),
+            "rated": sum(map(len, self._by_rating.values())),
+            "with_thumbnail": self._thumb_count,
+            "categories": len(self.data["categories"]),
+            "models": len(self.data["models"]),
+            "tags": len(self.data["tags"])
         }
     
-    def export_data(self):
-        return self.data
+    @staticmethod
+    def _is_filtered(search=None, category=None, model=None, tag=None, rating_min=None):
+        return bool(search or rating_min or category not in (None, "All", "none", "")
+                    or model not in (None, "All", "none", "") or tag not in (None, "All", ""))
+    
+    @_locked
+    def get_facets(self, search=None, category=None, model=None, tag=None, rating_min=None):
+        """
+        Number of matching prompts per category, model, tag (lowercased) and rating
+        (0 = unrated). Without a filter these are the index bucket sizes, O(values);
+        with one, a single pass over the matches.
+        """
+        if not self._is_filtered(search, category, model, tag, rating_min):
+            total = len(self.data["prompts"])
+            facets = {name: {key: len(bucket) for key, bucket in index.items()}
+                      for name, index in (("categories", self._by_category), ("models", self._by_model),
+                                          ("tags", self._by_tag), ("ratings", self._by_rating))}
+        else:
+            scores = self._cached_search(search, scored=False) if search else None
+            matches = list(self._matching(search, category, model, tag, rating_min, scores))
+            total = len(matches)
+            # Counted in C from the matches' fields
+            facets = {"categories": Counter(map(attrgetter("category"), matches)),
+                      "models": Counter(map(attrgetter("model"), matches)),
+                      "tags": Counter(chain.from_iterable(map(attrgetter("tags"), matches))),
+                      "ratings": Counter(map(attrgetter("rating"), matches))}
+            if any(t != t.lower() for t in facets["tags"]):
+                # Tags are counted lowercased, once per prompt
+                facets["tags"] = Counter(t for p in matches for t in {t.lower() for t in p.tags})
+            facets["ratings"].pop(0, None)
+            for counts in facets.values():
+                counts.pop(None, None)
+            facets = {name: dict(counts) for name, counts in facets.items()}
+        facets["ratings"][0] = total - sum(facets["ratings"].values())
+        return {"total": total, **facets}
+    
+    @_locked
+    def export_data(self, thumbnails=False):
+        """Copy of the library; with thumbnails=True, referenced images are added as a base64 "thumbnails" map"""
+        data = {k: list(v) if isinstance(v, list) else v for k, v in self.data.items()}
+        data["prompts"] = {pid: p.to_dict() for pid, p in self.data["prompts"].items()}
+        if thumbnails:
+            data["thumbnails"] = self.thumbnail_export(data["prompts"].values())
+        return data
+    
+    def export_header(self):
+        """First record of a streamed (NDJSON) export: format marker and vocabularies"""
+        return {"format": EXPORT_FORMAT, "version": 1, "categories": self.get_categories(),
+                "models": self.get_models(), "tags": self.get_tags()}
+    
+    def iter_export(self, size=500):
+        """
+        Copies of all prompts in batches of size, for streamed exports. The lock is
+        held per batch only; prompts deleted meanwhile are skipped.
+        """
+        pids = self._prompt_ids()
+        for i in range(0, len(pids), size):
+            yield self._copy_prompts(pids[i:i + size])
+    
+    @_locked
+    def _prompt_ids(self):
+        return list(self.data["prompts"])
     
+    @_locked
+    def _copy_prompts(self, pids):
+        prompts = self.data["prompts"]
+        return [prompts[pid].to_dict() for pid in pids if pid in prompts]
+    
+    @_locked
     def import_data(self, incoming):
         """Import/merge data. Newer overwrites older based on updated_at."""
         added = 0
         updated = 0
+        ops = []
+        thumbnails = incoming.get("thumbnails")
         
         for pid, p in incoming.get("prompts", {}).items():
-            h = p.get("hash") or self._hash(p.get("text", ""))
+            p = self._extract_thumbnail(dict(p), thumbnails)
+            h = p.get("hash") or self.text_hash(p.get("text", ""))
             
-            # Find existing by hash
-            existing_id = None
-            for eid, ep in self.data["prompts"].items():
-                if ep.get("hash") == h:
-                    existing_id = eid
-                    break
+            existing_id = self._find_hash(h)
             
             if existing_id:
                 # Compare dates
                 incoming_date = p.get("updated_at", "")
                 existing_date = self.data["prompts"][existing_id].get("updated_at", "")
                 if incoming_date > existing_date:
+                    self._unindex(existing_id)
                     self.data["prompts"][existing_id].update({
                         "text": p.get("text"),
                         "model": p.get("model"),
                         "category": p.get("category"),
                         "tags": p.get("tags", []),
                         "rating": p.get("rating"),
-                        "thumbnail": p.get("thumbnail"),
+                        "thumb": p.get("thumb"),
                         "updated_at": incoming_date,
                         "used_count": max(self.data["prompts"][existing_id].get("used_count", 0), p.get("used_count", 0))
                     })
+                    self._index(existing_id)
+                    ops.append(self._put(existing_id))
                     updated += 1
             else:
-                # Add new
-                new_id = self._id()
-                self.data["prompts"][new_id] = {**p, "id": new_id, "hash": h}
-                added += 1
+                # Add new
+                new_id = self._id()
+                self.data["prompts"][new_id] = PromptRecord.from_dict({**p, "id": new_id, "hash": h})
+                self._index(new_id)
+                ops.append(self._put(new_id))
+                added += 1
+        
+        # Merge categories, models, tags
+        for key in self.VOCABULARIES:
+            for value in incoming.get(key) or []:
+                op = self._vocab_insert(key, value)
+                if op:
+                    ops.append(op)
+        
+        if ops:
+            self._commit(*ops)
+        return {"added": added, "updated": updated}
+    
+    @_locked
+    def known_hashes(self, hashes):
+        """The subset of text hashes already in the library"""
+        return {h for h in hashes if self._find_hash(h)}
+    
+    @_locked
+    def add_prompts(self, entries, category=None, tags=None):
+        """
+        Bulk insert of harvested prompts ({text, thumb, created_at}) as one commit.
+        Texts already in the library are counted as duplicates; only a missing
+        thumbnail is filled in on them.
+        """
+        added = 0
+        duplicates = 0
+        new_tags = self._split_tags(tags)
+        ops = [op for op in (self._vocab_insert("tags", t) for t in new_tags) if op]
+        now = datetime.now().isoformat()
+        
+        for e in entries:
+            text = (e.get("text") or "").strip()
+            if not text:
+                continue
+            h = self.text_hash(text)
+            pid = self._find_hash(h)
+            if pid:
+                duplicates += 1
+                p = self.data["prompts"][pid]
+                if e.get("thumb") and not p.get("thumb"):
+                    self._unindex_fields(pid)
+                    p["thumb"] = e["thumb"]
+                    self._index_fields(pid)
+                    if e.get("source"):
+                        p["source"] = e["source"]
+                    ops.append(self._put(pid))
+                continue
+            pid = self._id()
+            self.data["prompts"][pid] = PromptRecord.from_dict({
+                "id": pid,
+                "text": text,
+                "hash": h,
+                "model": None,
+                "category": category if category and category != "none" else None,
+                "tags": list(new_tags),
+                "rating": None,
+                "thumb": e.get("thumb"),
+                "created_at": e.get("created_at") or now,
+                "updated_at": now,
+                "used_count": 0,
+                "source": e.get("source")
+            })
+            self._index(pid)
+            ops.append(self._put(pid))
+            added += 1
+        
+        if ops:
+            self._commit(*ops)
+        return {"added": added, "duplicates": duplicates}
+    
+    @_locked
+    def get_last_saved_id(self):
+        return self._last_saved_id
+
+
+@timed_methods
+class SQLitePromptDB(PromptDB):
+    """
+    PromptDB backed by data/prompts.sqlite3 (PS_STORAGE=sqlite).
+    Same public methods; filters are indexed SQL queries, so the library
+    does not have to fit in memory or be rewritten on every change.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS prompts (
+            id TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            hash TEXT,
+            model TEXT,
+            category TEXT,
+            rating INTEGER,
+            thumb TEXT,
+            created_at TEXT,
+            updated_at TEXT,
+            used_count INTEGER NOT NULL DEFAULT 0,
+            extra TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_prompts_hash ON prompts(hash);
+        CREATE INDEX IF NOT EXISTS idx_prompts_category ON prompts(category);
+        CREATE INDEX IF NOT EXISTS idx_prompts_model ON prompts(model);
+        CREATE INDEX IF NOT EXISTS idx_prompts_rating ON prompts(rating);
+        CREATE INDEX IF NOT EXISTS idx_prompts_updated_at ON prompts(updated_at);
+        CREATE TABLE IF NOT EXISTS prompt_tags (
+            prompt_id TEXT NOT NULL REFERENCES prompts(id) ON DELETE CASCADE,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (prompt_id, tag)
+        );
+        CREATE INDEX IF NOT EXISTS idx_prompt_tags_tag ON prompt_tags(tag COLLATE NOCASE);
+        CREATE TABLE IF NOT EXISTS vocab (
+            kind TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (kind, value)
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS counts (
+            facet TEXT NOT NULL,
+            value NOT NULL,
+            n INTEGER NOT NULL,
+            PRIMARY KEY (facet, value)
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS prompts_fts USING fts5(
+            text, id UNINDEXED, prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+        );
+    """
+    
+    # Columns stored directly; any other prompt keys round-trip through "extra"
+    FIELDS = ("id", "text", "hash", "model", "category", "rating", "thumb",
+              "created_at", "updated_at", "used_count")
+    
+    # counts rows (facet, value) -> number of prompts, kept by the triggers below; NULL
+    # values are not counted. Tags are counted lowercased, once per prompt.
+    COUNTED = (("total", "''"),
+               ("rated", "CASE WHEN {row}.rating IS NOT NULL THEN '' END"),
+               ("with_thumbnail", "CASE WHEN NULLIF({row}.thumb, '') IS NOT NULL THEN '' END"),
+               ("categories", "{row}.category"),
+               ("models", "{row}.model"),
+               ("ratings", "NULLIF({row}.rating, 0)"))
+    
+    @staticmethod
+    def _count(facet, value, delta, where=""):
+        return (f"INSERT INTO counts (facet, value, n) SELECT '{facet}', v, {delta} FROM (SELECT {value} AS v) "
+                f"WHERE v IS NOT NULL{where} ON CONFLICT(facet, value) DO UPDATE SET n = n + excluded.n;")
+    
+    @classmethod
+    def _counts_schema(cls):
+        """Triggers that keep counts in step with prompts, prompt_tags and vocab, in the same transaction"""
+        add = " ".join(cls._count(f, v.format(row="NEW"), 1) for f, v in cls.COUNTED)
+        remove = " ".join(cls._count(f, v.format(row="OLD"), -1) for f, v in cls.COUNTED)
+        # Another spelling of the same tag on the same prompt is not counted again
+        other_spelling = (" AND NOT EXISTS (SELECT 1 FROM prompt_tags WHERE prompt_id = {row}.prompt_id"
+                          " AND lower(tag) = v{same})")
+        return f"""
+            CREATE TRIGGER IF NOT EXISTS counts_prompts_insert AFTER INSERT ON prompts BEGIN {add} END;
+            CREATE TRIGGER IF NOT EXISTS counts_prompts_delete AFTER DELETE ON prompts BEGIN {remove} END;
+            CREATE TRIGGER IF NOT EXISTS counts_prompts_update AFTER UPDATE OF category, model, rating, thumb
+                ON prompts BEGIN {remove} {add} END;
+            CREATE TRIGGER IF NOT EXISTS counts_tags_insert AFTER INSERT ON prompt_tags BEGIN
+                {cls._count("tags", "lower(NEW.tag)", 1, other_spelling.format(row="NEW", same=" AND rowid != NEW.rowid"))}
+            END;
+            CREATE TRIGGER IF NOT EXISTS counts_tags_delete AFTER DELETE ON prompt_tags BEGIN
+                {cls._count("tags", "lower(OLD.tag)", -1, other_spelling.format(row="OLD", same=""))}
+            END;
+            CREATE TRIGGER IF NOT EXISTS counts_vocab_insert AFTER INSERT ON vocab BEGIN
+                {cls._count("vocab", "NEW.kind", 1)}
+            END;
+            CREATE TRIGGER IF NOT EXISTS counts_vocab_delete AFTER DELETE ON vocab BEGIN
+                {cls._count("vocab", "OLD.kind", -1)}
+            END;
+        """
+    
+    def _init_db(self):
+        import sqlite3
+        self.path = Path(os.path.dirname(__file__)) / "data"
+        self.path.mkdir(exist_ok=True)
+        self.file = self.path / "prompts.json"
+        self.storage = "sqlite"
+        self.journal = self.path / "prompts.journal"
+        self.journal_old = self.path / "prompts.journal.old"
+        self.db_file = self.path / "prompts.sqlite3"
+        self.durability = os.environ.get("PS_DURABILITY", "deferred")
+        self.vocab_version = 0
+        self.text_revision = 0  # bumped by every change to prompts_fts (relevance cursors)
+        self._batch_depth = 0
+        self._changes = []
+        self._lock = threading.RLock()
+        self.thumbs = ThumbnailStore(self.path / "thumbs")
+        self._last_saved_id = None
+        self._event_vocab = self.vocab_version
+        self.conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Every mutation is its own WAL transaction; "fsync" also syncs the WAL on each commit
+        self.conn.execute("PRAGMA synchronous=" + ("FULL" if self.durability == "fsync" else "NORMAL"))
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(self.SCHEMA)
+        self.conn.executescript(self._counts_schema())
+        # Migrating a prompts.json or filling the FTS table can take a while on a large
+        # library: like PromptDB, do it on a background thread (see _locked)
+        self._ready = threading.Event()
+        self._load_error = None
+        threading.Thread(target=self._load_db, name="ps-load", daemon=True).start()
+    
+    def _load_db(self):
+        started = time.perf_counter()
+        try:
+            with self._lock:
+                self._migrate_json()
+                self._build_fts()
+                self._build_counts()
+                self._changes = []  # the migration is not news to anyone
+                self._event_vocab = self.vocab_version
+            count = self.conn.execute("SELECT COUNT(*) FROM prompts").fetchone()[0]
+            print(f"[PS] Library ready: {count} prompts ({self.db_file.name}, {time.perf_counter() - started:.2f}s)")
+        except Exception as e:
+            self._load_error = e
+            print(f"[PS] Loading the library failed: {e}")
+        finally:
+            self._ready.set()
+    
+    def _migrate_json(self):
+        """One-shot import of an existing prompts.json (+ journal) into an empty database"""
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone():
+            return
+        has_rows = self.conn.execute("SELECT 1 FROM prompts LIMIT 1").fetchone()
+        if not has_rows and (self.file.exists() or self.journal.exists()):
+            data = self._load(replay=True)
+            with self.conn:
+                for p in data["prompts"].values():
+                    self._write(self._extract_thumbnail(p))
+                for key in ("categories", "models", "tags"):
+                    self._add_vocab(key, data[key])
+            print(f"[PS] Migrated {len(data['prompts'])} prompts from {self.file.name} to {self.db_file.name}")
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('migrated_json', ?)", (datetime.now().isoformat(),))
+    
+    def flush(self):
+        """Nothing is buffered: SQLite commits each mutation itself"""
+    
+    @property
+    def revision(self):
+        # Rows changed through this connection - grows with every mutation. Read without
+        # the lock (SQLite serializes it) so the event loop never waits on a transaction.
+        return self.conn.total_changes
+    
+    @contextmanager
+    def batch(self):
+        """Hold the lock across several mutations so no other thread interleaves (and send one change event)"""
+        # Wait before taking the lock: _load_db needs it to finish loading
+        self._wait_ready()
+        with self._lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+            self._publish()
+    
+    @contextmanager
+    def _transaction(self):
+        """Lock + transaction of a mutation; its change event goes out once it has committed"""
+        with self._lock:
+            started = time.perf_counter()
+            try:
+                with self.conn:
+                    yield
+            except BaseException:
+                self._changes = []
+                raise
+            # SQLite does not say how much it wrote; the duration covers the statements and the commit
+            metrics.persisted("sqlite", time.perf_counter() - started)
+            self._publish()
+    
+    def _event_prompt(self, pid):
+        return self._fetch(pid)
+    
+    # ------------------------------------------------------------------------
+    # Full-text index
+    # ------------------------------------------------------------------------
+    # prompts_fts keeps its own copy of the text. Its rowid is derived from the prompt
+    # id rather than prompts.rowid, which VACUUM may renumber on a TEXT-keyed table.
+    
+    @staticmethod
+    def _fts_rowid(pid):
+        return int.from_bytes(hashlib.blake2b(pid.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+    
+    def _build_fts(self):
+        """One-shot fill of the FTS table for databases created before it existed"""
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'fts'").fetchone():
+            return
+        with self.conn:
+            self.conn.execute("DELETE FROM prompts_fts")
+            self.conn.executemany(
+                "INSERT INTO prompts_fts (rowid, text, id) VALUES (?, ?, ?)",
+                ((self._fts_rowid(pid), text or "", pid) for pid, text in self.conn.execute("SELECT id, text FROM prompts").fetchall())
+            )
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('fts', ?)", (datetime.now().isoformat(),))
+    
+    @staticmethod
+    def _fts_query(search):
+        """
+        FTS5 MATCH expression: every term as a prefix phrase. unicode61 splits snake_case,
+        so long_ha becomes the phrase "long ha"*, matching long_hair like the in-memory index.
+        """
+        terms = search_terms(search)
+        return " ".join('"{}"*'.format(term.replace("_", " ")) for term in terms) or None
+    
+    # ------------------------------------------------------------------------
+    # Counts
+    # ------------------------------------------------------------------------
+    
+    def _build_counts(self):
+        """One-shot fill of the counts table for databases created before it existed"""
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'counts'").fetchone():
+            return
+        with self.conn:
+            self.conn.execute("DELETE FROM counts")
+            for facet, value in self.COUNTED:
+                self.conn.execute(f"INSERT INTO counts (facet, value, n) SELECT '{facet}', v, COUNT(*) "
+                                  f"FROM (SELECT {value.format(row='prompts')} AS v FROM prompts) "
+                                  f"WHERE v IS NOT NULL GROUP BY v")
+            self.conn.execute("INSERT INTO counts (facet, value, n) "
+                              "SELECT 'tags', lower(tag), COUNT(DISTINCT prompt_id) FROM prompt_tags GROUP BY 2")
+            self.conn.execute("INSERT INTO counts (facet, value, n) SELECT 'vocab', kind, COUNT(*) FROM vocab GROUP BY kind")
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('counts', ?)", (datetime.now().isoformat(),))
+    
+    def _counts(self, facet):
+        return dict(self.conn.execute("SELECT value, n FROM counts WHERE facet = ? AND n > 0", (facet,)))
+    
+    def _counter(self, facet, value=""):
+        row = self.conn.execute("SELECT n FROM counts WHERE facet = ? AND value = ?", (facet, value)).fetchone()
+        return row[0] if row else 0
+    
+    # ------------------------------------------------------------------------
+    # Row helpers
+    # ------------------------------------------------------------------------
+    
+    def _write(self, p):
+        """Upsert a prompt dict and its tag rows (caller holds the transaction)"""
+        extra = {k: v for k, v in p.items() if k not in self.FIELDS and k != "tags"}
+        values = [p.get(k) for k in self.FIELDS]
+        values[self.FIELDS.index("used_count")] = p.get("used_count") or 0
+        self.conn.execute(
+            f"INSERT INTO prompts ({', '.join(self.FIELDS)}, extra) VALUES ({', '.join('?' * (len(self.FIELDS) + 1))}) "
+            f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{k} = excluded.{k}' for k in self.FIELDS[1:])}, extra = excluded.extra",
+            values + [json.dumps(extra, ensure_ascii=False) if extra else None]
+        )
+        rid = self._fts_rowid(p["id"])
+        self.text_revision += 1
+        self.conn.execute("DELETE FROM prompts_fts WHERE rowid = ?", (rid,))
+        self.conn.execute("INSERT INTO prompts_fts (rowid, text, id) VALUES (?, ?, ?)", (rid, p.get("text") or "", p["id"]))
+        self.conn.execute("DELETE FROM prompt_tags WHERE prompt_id = ?", (p["id"],))
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO prompt_tags (prompt_id, tag) VALUES (?, ?)",
+            [(p["id"], t) for t in p.get("tags") or []]
+        )
+        self._changes.append((p["id"], "put"))
+    
+    def _rows(self, sql, args=()):
+        """Run a SELECT over prompts (all columns) and return prompt dicts with tags"""
+        rows = self.conn.execute(sql, args).fetchall()
+        prompts = []
+        for row in rows:
+            p = dict(zip(self.FIELDS, row[:len(self.FIELDS)]))
+            p["tags"] = []
+            if row[-1]:
+                p.update(json.loads(row[-1]))
+            prompts.append(p)
+        by_id = {p["id"]: p for p in prompts}
+        ids = list(by_id)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            for pid, tag in self.conn.execute(
+                f"SELECT prompt_id, tag FROM prompt_tags WHERE prompt_id IN ({', '.join('?' * len(chunk))}) ORDER BY rowid",
+                chunk
+            ):
+                by_id[pid]["tags"].append(tag)
+        return prompts
+    
+    def _select(self):
+        return f"SELECT {', '.join(self.FIELDS)}, extra FROM prompts"
+    
+    def _hydrate(self, ids):
+        """Full prompt dicts for ids, in the given order"""
+        by_id = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            for p in self._rows(f"{self._select()} WHERE id IN ({', '.join('?' * len(chunk))})", chunk):
+                by_id[p["id"]] = p
+        return [by_id[pid] for pid in ids if pid in by_id]
+    
+    def _fetch(self, pid):
+        if not pid:
+            return None
+        found = self._rows(f"{self._select()} WHERE id = ?", (pid,))
+        return found[0] if found else None
+    
+    def _add_vocab(self, kind, values):
+        if self.conn.executemany("INSERT OR IGNORE INTO vocab (kind, value) VALUES (?, ?)",
+                                 [(kind, v) for v in values if v and isinstance(v, str)]).rowcount > 0:
+            self.vocab_version += 1
+    
+    def _vocab(self, kind):
+        return [r[0] for r in self.conn.execute("SELECT value FROM vocab WHERE kind = ? ORDER BY rowid", (kind,))]
+    
+    # ------------------------------------------------------------------------
+    # Public API (mirrors PromptDB)
+    # ------------------------------------------------------------------------
+    
+    @_locked
+    def save_prompt(self, text, saver_id=None, model=None, category=None, tags=None):
+        if not text or not text.strip():
+            return None
+        
+        text = text.strip()
+        text_hash = self.text_hash(text)
+        now = datetime.now().isoformat()
+        
+        if not hasattr(self, '_saver_last_ids'):
+            self._saver_last_ids = {}
+        track_key = saver_id or 'default'
+        new_tags = self._split_tags(tags)
+        
+        def merge_tags(existing, new):
+            result = list(existing) if existing else []
+            for t in new:
+                if t not in result:
+                    result.append(t)
+            return result
+        
+        with self._transaction():
+            self._add_vocab("tags", new_tags)
+            
+            # Overwrite this saver's last prompt, else update a same-hash prompt
+            p = self._fetch(self._saver_last_ids.get(track_key))
+            overwrite = p is not None
+            if p is None:
+                row = self.conn.execute("SELECT id FROM prompts WHERE hash = ? LIMIT 1", (text_hash,)).fetchone()
+                p = self._fetch(row[0]) if row else None
+            
+            if p is not None:
+                pid = p["id"]
+                if overwrite:
+                    p["text"] = text
+                    p["hash"] = text_hash
+                if model and model != "none":
+                    p["model"] = model
+                if category and category != "none":
+                    p["category"] = category
+                if new_tags:
+                    p["tags"] = merge_tags(p.get("tags", []), new_tags)
+                p["updated_at"] = now
+                p["used_count"] = (p.get("used_count") or 0) + 1
+                self._write(p)
+                self._saver_last_ids[track_key] = pid
+                return pid
+            
+            pid = self._id()
+            self._write({
+                "id": pid,
+                "text": text,
+                "hash": text_hash,
+                "model": model if model and model != "none" else None,
+                "category": category if category and category != "none" else None,
+                "tags": new_tags,
+                "rating": None,
+                "thumb": None,
+                "created_at": now,
+                "updated_at": now,
+                "used_count": 1
+            })
+            self._saver_last_ids[track_key] = pid
+        return pid
+    
+    def _query(self, search=None, category=None, model=None, tag=None, rating_min=None, sort="updated_at"):
+        """FROM source, WHERE clauses, args and ORDER expression shared by the prompt queries"""
+        source, where, args = "prompts", [], []
+        match = self._fts_query(search) if search else None
+        if match:
+            source += (" JOIN (SELECT id AS fts_id, -bm25(prompts_fts) AS score FROM prompts_fts"
+                       " WHERE prompts_fts MATCH ?) s ON s.fts_id = prompts.id")
+            args.append(match)
+        elif search:
+            # Queries without word characters fall back to a substring match
+            escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            where.append("text LIKE ? ESCAPE '\\'")
+            args.append(f"%{escaped}%")
+        if category and category not in ["All", "none", ""]:
+            where.append("category = ?")
+            args.append(category)
+        if model and model not in ["All", "none", ""]:
+            where.append("model = ?")
+            args.append(model)
+        if tag and tag not in ["All", ""]:
+            where.append("id IN (SELECT prompt_id FROM prompt_tags WHERE tag = ? COLLATE NOCASE)")
+            args.append(tag)
+        if rating_min:
+            where.append("rating >= ?")
+            args.append(rating_min)
+        
+        # Same values as PromptDB._sort_key; NULL ratings count as 0
+        if sort == "relevance" and match:
+            order = "s.score"
+        else:
+            order = {"rating": "COALESCE(rating, 0)", "used_count": "used_count"}.get(sort, "COALESCE(updated_at, '')")
+        return source, where, args, order
+    
+    def _page(self, source, where, args, order, limit, offset=0, cursor=None):
+        """(id, sort value) rows of one page, ordered like PromptDB.get_prompts_page"""
+        if cursor:
+            where = where + [f"({order}, prompts.id) < (?, ?)"]
+            args = args + list(self._decode_cursor(cursor, self._cursor_revision(order)))
+        sql = f"SELECT prompts.id, {order} FROM {source}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order} DESC, prompts.id DESC LIMIT ? OFFSET ?"
+        return self.conn.execute(sql, args + [limit, offset]).fetchall()
+    
+    def _cursor_revision(self, order):
+        """text_revision for relevance cursors (BM25 scores move with the FTS index), else None"""
+        return self.text_revision if order == "s.score" else None
+    
+    @_locked
+    def get_prompts(self, search=None, category=None, model=None, tag=None, rating_min=None, limit=50, sort="updated_at"):
+        source, where, args, order = self._query(search, category, model, tag, rating_min, sort)
+        keys = self._page(source, where, args, order, limit)
+        return self._hydrate([pid for pid, _ in keys])
+    
+    @_locked
+    def get_prompts_page(self, search=None, category=None, model=None, tag=None, rating_min=None,
+                         limit=50, sort="updated_at", offset=0, cursor=None):
+        source, where, args, order = self._query(search, category, model, tag, rating_min, sort)
+        count_sql = f"SELECT COUNT(*) FROM {source}" + (" WHERE " + " AND ".join(where) if where else "")
+        total = self.conn.execute(count_sql, args).fetchone()[0]
+        keys = self._page(source, where, args, order, limit + 1, offset, cursor)
+        page = self._hydrate([pid for pid, _ in keys[:limit]])
+        next_cursor = None
+        if limit and len(keys) > limit:
+            pid, value = keys[limit - 1]
+            next_cursor = self._encode_cursor(value, pid, self._cursor_revision(order))
+        return {"prompts": page, "total": total, "next_cursor": next_cursor}
+    
+    @_locked
+    def get_prompt(self, pid):
+        return self._fetch(pid)
+    
+    def _set_column(self, pid, column, value):
+        with self._transaction():
+            found = self.conn.execute(f"UPDATE prompts SET {column} = ? WHERE id = ?", (value, pid)).rowcount > 0
+            if found:
+                self._changes.append((pid, "put"))
+        return found
+    
+    @_locked
+    def rate(self, pid, rating):
+        return self._set_column(pid, "rating", rating if rating > 0 else None)
+    
+    @_locked
+    def delete_prompt(self, pid):
+        with self._transaction():
+            deleted = self.conn.execute("DELETE FROM prompts WHERE id = ?", (pid,)).rowcount > 0
+            self.conn.execute("DELETE FROM prompts_fts WHERE rowid = ?", (self._fts_rowid(pid),))
+            if deleted:
+                self.text_revision += 1
+                self._changes.append((pid, "del"))
+        if deleted and self._last_saved_id == pid:
+            self._last_saved_id = None
+        return deleted
+    
+    @_locked
+    def set_thumbnail(self, pid, thumb, source=None):
+        if source:
+            with self._transaction():
+                p = self._fetch(pid)
+                if p is not None:
+                    p["thumb"] = thumb
+                    p["source"] = source
+                    self._write(p)
+            found = p is not None
+        else:
+            found = self._set_column(pid, "thumb", thumb)
+        if found:
+            return True
+        print(f"[PS] Cannot set thumbnail - prompt {pid} not found")
+        return False
+    
+    @_locked
+    def thumbnail_sources(self):
+        return [(pid, thumb, json.loads(extra).get("source") if extra else None)
+                for pid, thumb, extra in self.conn.execute("SELECT id, thumb, extra FROM prompts")]
+    
+    @_locked
+    def update_prompt(self, pid, model=None, category=None, tags=None):
+        """Update prompt metadata"""
+        with self._transaction():
+            p = self._fetch(pid)
+            if p is None:
+                return False
+            if model is not None:
+                p["model"] = model if model and model != "none" else None
+            if category is not None:
+                p["category"] = category if category and category != "none" else None
+            if tags is not None:
+                p["tags"] = self._split_tags(tags)
+                self._add_vocab("tags", p["tags"])
+            p["updated_at"] = datetime.now().isoformat()
+            self._write(p)
+        return True
+    
+    def _vocab_add(self, kind, value):
+        if not value:
+            return False
+        return self._vocab_change("INSERT OR IGNORE INTO vocab (kind, value) VALUES (?, ?)", kind, value)
+    
+    def _vocab_remove(self, kind, value):
+        return self._vocab_change("DELETE FROM vocab WHERE kind = ? AND value = ?", kind, value)
+    
+    def _vocab_change(self, sql, kind, value):
+        with self._transaction():
+            changed = self.conn.execute(sql, (kind, value)).rowcount > 0
+            if changed:
+                self.vocab_version += 1
+            return changed
+    
+    @_locked
+    def get_categories(self):
+        return self._vocab("categories")
+    
+    @_locked
+    def add_category(self, cat):
+        return self._vocab_add("categories", cat)
+    
+    @_locked
+    def delete_category(self, cat):
+        return self._vocab_remove("categories", cat)
+    
+    @_locked
+    def get_models(self):
+        return self._vocab("models")
+    
+    @_locked
+    def add_model(self, model):
+        return self._vocab_add("models", model)
+    
+    @_locked
+    def delete_model(self, model):
+        return self._vocab_remove("models", model)
+    
+    @_locked
+    def get_tags(self):
+        return self._vocab("tags")
+    
+    @_locked
+    def get_stats(self):
+        """Counts kept by the counts triggers; nothing here walks the prompts"""
+        vocab = self._counts("vocab")
+        return {
+            "total": self._counter("total"),
+            "rated": self._counter("rated"),
+            "with_thumbnail": self._counter("with_thumbnail"),
+            "categories": vocab.get("categories", 0),
+            "models": vocab.get("models", 0),
+            "tags": vocab.get("tags", 0)
+        }
+    
+    @_locked
+    def get_facets(self, search=None, category=None, model=None, tag=None, rating_min=None):
+        """Without a filter, the counts table (O(values)); with one, GROUP BY over the matches"""
+        if not self._is_filtered(search, category, model, tag, rating_min):
+            total = self._counter("total")
+            facets = {name: self._counts(name) for name in ("categories", "models", "tags", "ratings")}
+        else:
+            source, where, args, _ = self._query(search, category, model, tag, rating_min)
+            where_sql = " WHERE " + " AND ".join(where) if where else ""
+            total = self.conn.execute(f"SELECT COUNT(*) FROM {source}{where_sql}", args).fetchone()[0]
+            facets = {}
+            for name, column in (("categories", "category"), ("models", "model"), ("ratings", "NULLIF(rating, 0)")):
+                facets[name] = dict(self.conn.execute(
+                    f"SELECT {column}, COUNT(*) FROM {source}{where_sql} GROUP BY 1 HAVING {column} IS NOT NULL", args))
+            facets["tags"] = dict(self.conn.execute(
+                f"SELECT lower(tag), COUNT(DISTINCT prompt_id) FROM prompt_tags WHERE prompt_id IN "
+                f"(SELECT prompts.id FROM {source}{where_sql}) GROUP BY 1", args))
+        facets["ratings"][0] = total - sum(facets["ratings"].values())
+        return {"total": total, **facets}
+    
+    @_locked
+    def export_data(self, thumbnails=False):
+        data = {
+            "prompts": {p["id"]: p for p in self._rows(self._select() + " ORDER BY rowid")},
+            "categories": self._vocab("categories"),
+            "models": self._vocab("models"),
+            "tags": self._vocab("tags")
+        }
+        if thumbnails:
+            data["thumbnails"] = self.thumbnail_export(data["prompts"].values())
+        return data
+    
+    def iter_export(self, size=500):
+        self._wait_ready()
+        last = 0
+        while True:
+            with self._lock:
+                rows = self.conn.execute("SELECT rowid, id FROM prompts WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                                         (last, size)).fetchall()
+                if not rows:
+                    return
+                batch = self._hydrate([pid for _, pid in rows])
+            last = rows[-1][0]
+            yield batch
+    
+    @_locked
+    def import_data(self, incoming):
+        """Import/merge data. Newer overwrites older based on updated_at."""
+        added = 0
+        updated = 0
+        
+        thumbnails = incoming.get("thumbnails")
+        
+        with self._transaction():
+            for pid, p in incoming.get("prompts", {}).items():
+                p = self._extract_thumbnail(dict(p), thumbnails)
+                h = p.get("hash") or self.text_hash(p.get("text", ""))
+                row = self.conn.execute("SELECT id FROM prompts WHERE hash = ? LIMIT 1", (h,)).fetchone()
+                
+                if row:
+                    existing = self._fetch(row[0])
+                    incoming_date = p.get("updated_at", "")
+                    if incoming_date > (existing.get("updated_at") or ""):
+                        existing.update({
+                            "text": p.get("text"),
+                            "model": p.get("model"),
+                            "category": p.get("category"),
+                            "tags": p.get("tags", []),
+                            "rating": p.get("rating"),
+                            "thumb": p.get("thumb"),
+                            "updated_at": incoming_date,
+                            "used_count": max(existing.get("used_count") or 0, p.get("used_count", 0))
+                        })
+                        self._write(existing)
+                        updated += 1
+                else:
+                    self._write({**p, "id": self._id(), "hash": h})
+                    added += 1
+            
+            for key in ("categories", "models", "tags"):
+                self._add_vocab(key, incoming.get(key, []))
+        
+        return {"added": added, "updated": updated}
+    
+    @_locked
+    def known_hashes(self, hashes):
+        """The subset of text hashes already in the library"""
+        hashes = list(hashes)
+        found = set()
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            found.update(r[0] for r in self.conn.execute(
+                f"SELECT hash FROM prompts WHERE hash IN ({', '.join('?' * len(chunk))})", chunk))
+        return found
+    
+    @_locked
+    def add_prompts(self, entries, category=None, tags=None):
+        """Bulk insert of harvested prompts ({text, thumb, created_at}) in one transaction"""
+        added = 0
+        duplicates = 0
+        new_tags = self._split_tags(tags)
+        now = datetime.now().isoformat()
+        
+        with self._transaction():
+            for e in entries:
+                text = (e.get("text") or "").strip()
+                if not text:
+                    continue
+                h = self.text_hash(text)
+                row = self.conn.execute("SELECT id, thumb FROM prompts WHERE hash = ? LIMIT 1", (h,)).fetchone()
+                if row:
+                    duplicates += 1
+                    if e.get("thumb") and not row[1]:
+                        p = self._fetch(row[0])
+                        p["thumb"] = e["thumb"]
+                        if e.get("source"):
+                            p["source"] = e["source"]
+                        self._write(p)
+                    continue
+                p = {
+                    "id": self._id(),
+                    "text": text,
+                    "hash": h,
+                    "model": None,
+                    "category": category if category and category != "none" else None,
+                    "tags": list(new_tags),
+                    "rating": None,
+                    "thumb": e.get("thumb"),
+                    "created_at": e.get("created_at") or now,
+                    "updated_at": now,
+                    "used_count": 0
+                }
+                if e.get("source"):
+                    p["source"] = e["source"]
+                self._write(p)
+                added += 1
+            self._add_vocab("tags", new_tags)
+        
+        return {"added": added, "duplicates": duplicates}
+
+
+db = PromptDB()
+
+
+# ============================================================================
+# THUMBNAIL HELPER
+# ============================================================================
+
+# Thumbnail size (px, square) and encoding ("jpeg" or "webp") for new thumbnails
+THUMB_SIZE = int(os.environ.get("PS_THUMB_SIZE", 64))
+THUMB_FORMAT = os.environ.get("PS_THUMB_FORMAT", "jpeg").lower()
+
+
+@timed("operation")
+def create_thumbnail(image_path, size=None, format=None):
+    """
+    Square (center-cropped) thumbnail, returns the encoded bytes. JPEGs are decoded
+    at a reduced DCT scale (draft); other formats are shrunk by an integer-factor
+    reduce() to about twice the target before the LANCZOS pass.
+    """
+    size = size or THUMB_SIZE
+    format = (format or THUMB_FORMAT).lower()
+    try:
+        from PIL import Image
+        with Image.open(image_path) as img:
+            img.draft("RGB", (size, size))  # no-op for anything but JPEG
+            if img.mode not in ("RGB", "RGBA", "L"):
+                img = img.convert("RGBA" if img.mode in ("LA", "PA") or "transparency" in img.info else "RGB")
+            # Crop to square
+            w, h = img.size
+            m = min(w, h)
+            left = (w - m) // 2
+            top = (h - m) // 2
+            thumb = img.resize((size, size), Image.Resampling.LANCZOS,
+                               box=(left, top, left + m, top + m), reducing_gap=2.0)
+        
+        buf = BytesIO()
+        if format == "webp":
+            thumb.save(buf, format='WEBP', quality=80, method=4)
+        else:
+            thumb.convert('RGB').save(buf, format='JPEG', quality=85)
+        return buf.getvalue()
+    except Exception as e:
+        print(f"[PS] Thumbnail error: {e}")
+        return None
+
+
+def is_inside(base, path):
+    """Whether absolute path is base or below it (never for another drive, where commonpath raises)"""
+    try:
+        return os.path.commonpath([base, path]) == base
+    except ValueError:
+        return False
+
+
+def output_relpath(path):
+    """path relative to the output folder if it is inside it (what prompts store as "source"), else absolute"""
+    path = os.path.abspath(path)
+    output_dir = os.path.abspath(folder_paths.get_output_directory())
+    if is_inside(output_dir, path):
+        return os.path.relpath(path, output_dir).replace(os.sep, "/")
+    return path
+
+
+def source_path(source):
+    """Absolute path of a prompt's "source" image"""
+    return os.path.join(folder_paths.get_output_directory(), source) if not os.path.isabs(source) else source
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+
+class NewestImageIndex:
+    """
+    Newest image under a directory tree. A directory is only re-listed when its
+    mtime changed since the last call (new files change it), so a lookup costs one
+    stat per directory instead of one per file.
+    """
+    
+    def __init__(self):
+        self._dirs = {}  # dir -> (dir mtime, subdirs, newest path, newest mtime)
+        self._lock = threading.Lock()
+    
+    @timed("operation", "newest_output_image")
+    def newest(self, root):
+        with self._lock:
+            best, best_time = None, 0
+            seen = set()
+            stack = [root]
+            while stack:
+                d = stack.pop()
+                seen.add(d)
+                try:
+                    mtime = os.stat(d).st_mtime_ns
+                except OSError:
+                    continue
+                entry = self._dirs.get(d)
+                if entry is None or entry[0] != mtime:
+                    subdirs, newest, newest_time = [], None, 0
+                    try:
+                        with os.scandir(d) as it:
+                            for e in it:
+                                if e.is_dir(follow_symlinks=False):
+                                    subdirs.append(e.path)
+                                elif e.name.lower().endswith(IMAGE_EXTENSIONS):
+                                    t = e.stat().st_mtime
+                                    if t > newest_time:
+                                        newest, newest_time = e.path, t
+                    except OSError:
+                        pass
+                    entry = self._dirs[d] = (mtime, subdirs, newest, newest_time)
+                stack.extend(entry[1])
+                if entry[3] > best_time:
+                    best, best_time = entry[2], entry[3]
+            for d in set(self._dirs) - seen:
+                del self._dirs[d]
+            return best, best_time
+
+
+newest_output_images = NewestImageIndex()
+
+# ComfyUI prompt ids whose thumbnail was already captured (several output nodes
+# each send an "executed" event for the same prompt)
+_captured_prompts = OrderedDict()
+_captured_lock = threading.Lock()
+
+
+class DirectoryListing:
+    """
+    Sorted image file names of a directory, re-listed only when the directory's
+    mtime changes. A listing taken within a second of the last change is not
+    trusted (coarse mtimes on network shares), so it is redone on the next call.
+    """
+    
+    def __init__(self, get_path):
+        self.get_path = get_path
+        self._key = None
+        self._files = []
+        self._lock = threading.Lock()
+    
+    def files(self):
+        """The cached list itself (same object until the directory changes) - do not modify it"""
+        path = self.get_path()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return []
+        with self._lock:
+            if self._key != (path, mtime):
+                try:
+                    self._files = sorted(f for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS))
+                except OSError:
+                    self._files = []
+                settled = time.time_ns() - mtime > 1_000_000_000
+                self._key = (path, mtime) if settled else None
+            return self._files
+
+
+input_images = DirectoryListing(folder_paths.get_input_directory)
+
+
+def resolve_output_image(image):
+    """Path of an image as ComfyUI references it ({filename, subfolder, type}), or None"""
+    if not isinstance(image, dict) or not image.get("filename"):
+        return None
+    if image.get("type") == "temp":
+        base = folder_paths.get_temp_directory()
+    elif image.get("type") == "input":
+        base = folder_paths.get_input_directory()
+    else:
+        base = folder_paths.get_output_directory()
+    base = os.path.abspath(base)
+    path = os.path.abspath(os.path.join(base, image.get("subfolder") or "", image["filename"]))
+    if not is_inside(base, path) or not os.path.isfile(path):
+        return None
+    return path
+
+
+@timed("operation")
+def capture_last_output_image(images=None, prompt_id=None):
+    """
+    Create a thumbnail for all recently saved prompts from the image ComfyUI reported
+    for the execution (images as in the "executed" event): a saved ("output") image,
+    or a temp/preview one if no saved image was reported. Without images, use the
+    newest image in the output dir (including subdirs) if it is recent.
+    """
+    if prompt_id:
+        with _captured_lock:
+            if prompt_id in _captured_prompts:
+                return False
+            _captured_prompts[prompt_id] = True
+            while len(_captured_prompts) > 256:
+                _captured_prompts.popitem(last=False)
+    
+    done = False
+    try:
+        latest = None
+        if images:
+            saved = [i for i in images if isinstance(i, dict) and i.get("type", "output") == "output"]
+            latest = next((p for p in map(resolve_output_image, saved or images) if p), None)
+            if latest is None:
+                print(f"[PS] Reported output images not found: {images}")
+        else:
+            latest, latest_time = newest_output_images.newest(folder_paths.get_output_directory())
+            # Only process if image is recent (within last 30 seconds)
+            if latest and (time.time() - latest_time) >= 30:
+                latest = None
+        
+        if latest:
+            # Get all recently saved prompt IDs
+            recent_ids = db.get_all_last_saved_ids()
+            if recent_ids:
+                data = create_thumbnail(latest)
+                if data:
+                    thumb = db.thumbs.put(data)
+                    source = output_relpath(latest)
+                    with db.batch():
+                        for pid in recent_ids:
+                            db.set_thumbnail(pid, thumb, source)
+                    done = True
+    except Exception as e:
+        print(f"[PS] Capture error: {e}")
+    
+    if prompt_id and not done:
+        # Let a later "executed" event of the same prompt try again
+        with _captured_lock:
+            _captured_prompts.pop(prompt_id, None)
+    return done
+
+
+# ============================================================================
+# IMAGE METADATA
+# ============================================================================
+# Text metadata of PNG / JPEG / WEBP files, read by seeking from chunk header to
+# chunk header: pixel data is never read, so a 50 MB PNG costs a few small reads.
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# EXIF tags read as text. ComfyUI's WEBP/JPEG savers store "prompt:{...}" in Model
+# and "workflow:{...}" in Make; A1111-style tools put their parameters in UserComment.
+EXIF_TEXT_TAGS = {0x010E: "ImageDescription", 0x010F: "Make", 0x0110: "Model", 0x9286: "UserComment"}
+EXIF_IFD_POINTER = 0x8769
+
+
+class UnsupportedImageFormat(ValueError):
+    """The file does not start with a PNG, JPEG or WEBP signature"""
+
+
+@timed("operation")
+def read_image_metadata(path, stop_at_idat=False):
+    """
+    Text metadata of an image as {key: text}: PNG tEXt/zTXt/iTXt chunks and EXIF
+    (PNG eXIf, JPEG APP1, WEBP EXIF chunk); JPEG comments appear as "comment".
+    stop_at_idat skips text chunks stored after the image data (ComfyUI and PIL
+    write them before it). Raises ValueError for truncated or malformed files, and
+    its subclass UnsupportedImageFormat for other formats.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(12)
+        f.seek(0)
+        try:
+            if head.startswith(PNG_SIGNATURE):
+                return _png_metadata(f, stop_at_idat)
+            if head.startswith(b'\xff\xd8'):
+                return _jpeg_metadata(f)
+            if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+                return _webp_metadata(f)
+        except struct.error as e:
+            raise ValueError(f"Malformed image: {e}")
+    raise UnsupportedImageFormat("Not a PNG, JPEG or WEBP file")
+
+
+def _read(f, size):
+    """Exactly size bytes from f; ValueError if the file ends first"""
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated image")
+    return data
+
+
+def _png_metadata(f, stop_at_idat=False):
+    chunks = {}
+    f.seek(len(PNG_SIGNATURE))
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        length, kind = struct.unpack('>I4s', header)
+        if kind in (b'tEXt', b'zTXt', b'iTXt', b'eXIf'):
+            data = _read(f, length)
+            f.seek(4, os.SEEK_CUR)  # CRC
+            try:
+                if kind == b'eXIf':
+                    chunks.update(parse_exif(data))
+                else:
+                    key, value = _png_text(kind, data)
+                    chunks[key] = value
+            except (ValueError, zlib.error, IndexError):
+                pass
+        elif kind == b'IEND' or (kind == b'IDAT' and stop_at_idat):
+            break
+        else:
+            f.seek(length + 4, os.SEEK_CUR)
+    return chunks
+
+
+def _png_text(kind, data):
+    """(keyword, text) of a tEXt, zTXt or iTXt chunk"""
+    key, rest = data.split(b'\x00', 1)
+    key = key.decode('latin-1')
+    if kind == b'tEXt':
+        return key, rest.decode('latin-1', errors='replace')
+    if kind == b'zTXt':
+        # Latin-1 by the spec, but some writers (ComfyUI among them) store UTF-8
+        return key, zlib.decompress(rest[1:]).decode('utf-8', errors='replace')
+    # iTXt: compression flag, method, language tag\0, translated keyword\0, UTF-8 text
+    compressed = rest[0]
+    text = rest[2:].split(b'\x00', 2)[2]
+    if compressed:
+        text = zlib.decompress(text)
+    return key, text.decode('utf-8', errors='replace')
+
+
+def _jpeg_metadata(f):
+    chunks = {}
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            break
+        if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+            continue  # no length field
+        if marker[1] in (0xD9, 0xDA):
+            break  # end of image / start of scan: only entropy-coded data follows
+        length = struct.unpack('>H', _read(f, 2))[0]
+        if length < 2:
+            raise ValueError("Malformed JPEG segment")
+        if marker[1] == 0xE1:
+            data = _read(f, length - 2)
+            if data.startswith(b'Exif\x00\x00'):
+                try:
+                    chunks.update(parse_exif(data))
+                except ValueError:
+                    pass
+        elif marker[1] == 0xFE:
+            chunks["comment"] = _read(f, length - 2).decode('utf-8', errors='replace')
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+    return chunks
+
+
+def _webp_metadata(f):
+    chunks = {}
+    f.seek(12)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        kind, length = struct.unpack('<4sI', header)
+        if kind == b'EXIF':
+            data = _read(f, length)
+            try:
+                chunks.update(parse_exif(data))
+            except ValueError:
+                pass
+            f.seek(length & 1, os.SEEK_CUR)
+        else:
+            f.seek(length + (length & 1), os.SEEK_CUR)
+    return chunks
+
+
+def parse_exif(data):
+    """
+    Text tags (EXIF_TEXT_TAGS) of a TIFF/EXIF block, with or without the "Exif\\0\\0"
+    prefix. Raises ValueError if it is not one or is cut short.
+    """
+    if data.startswith(b'Exif\x00\x00'):
+        data = data[6:]
+    if data[:2] == b'II':
+        order = '<'
+    elif data[:2] == b'MM':
+        order = '>'
+    else:
+        raise ValueError("Not a TIFF header")
+    out = {}
+    
+    def ifd(offset, depth=0):
+        count = struct.unpack_from(order + 'H', data, offset)[0]
+        for i in range(count):
+            tag, kind, n, value = struct.unpack_from(order + 'HHI4s', data, offset + 2 + 12 * i)
+            if tag == EXIF_IFD_POINTER and depth == 0:
+                ifd(struct.unpack(order + 'I', value)[0], depth + 1)
+            elif tag in EXIF_TEXT_TAGS and (kind in (2, 7) or kind == 1 and tag == 0x9286):
+                raw = value[:n] if n <= 4 else data[struct.unpack(order + 'I', value)[0]:][:n]
+                _exif_text(out, EXIF_TEXT_TAGS[tag], raw, kind, order)
+    
+    try:
+        ifd(struct.unpack(order + 'I', data[4:8])[0])
+    except struct.error as e:
+        raise ValueError(f"Malformed EXIF: {e}")
+    return out
+
+
+def _exif_text(out, name, raw, kind, order):
+    if kind in (1, 7):
+        # UNDEFINED (or BYTE, as Pillow writes it) with an 8-byte charset header (UserComment)
+        code, raw = raw[:8], raw[8:]
+        if code.startswith(b'UNICODE'):
+            text = raw.decode('utf-16-be' if order == '>' else 'utf-16-le', errors='replace')
+        else:
+            text = raw.decode('utf-8', errors='replace')
+    else:
+        text = raw.decode('utf-8', errors='replace')
+    text = text.rstrip('\x00')
+    if not text:
+        return
+    # ComfyUI stores "key:{json}" - expose it under its own key like a PNG text chunk
+    key, sep, rest = text.partition(':')
+    if sep and key.isidentifier() and rest[:1] in ('{', '['):
+        out[key] = rest
+    else:
+        out[name] = text
+
+
+def build_exif(tags, exif_tags=None):
+    """
+    "Exif\\0\\0" + big-endian TIFF block with IFD0 tags and an Exif sub-IFD, each
+    {tag: (type, bytes)}. Packed by hand because Pillow types sub-IFD bytes as BYTE,
+    while UserComment has to be UNDEFINED (7) for other readers to decode it.
+    """
+    tags = dict(tags)
+    if exif_tags:
+        tags[EXIF_IFD_POINTER] = (4, b'\x00' * 4)
+    
+    def size(entries):
+        return 6 + 12 * len(entries) + sum(len(v) + (len(v) & 1) for _, v in entries.values() if len(v) > 4)
+    
+    def pack(entries, offset):
+        head, data = [struct.pack('>H', len(entries))], []
+        offset += 6 + 12 * len(entries)
+        for tag in sorted(entries):
+            kind, value = entries[tag]
+            count = len(value) // 4 if kind == 4 else len(value)
+            if len(value) <= 4:
+                head.append(struct.pack('>HHI4s', tag, kind, count, value))
+            else:
+                head.append(struct.pack('>HHII', tag, kind, count, offset))
+                data.append(value + b'\x00' * (len(value) & 1))
+                offset += len(value) + (len(value) & 1)
+        return b''.join(head) + b'\x00' * 4 + b''.join(data)
+    
+    if exif_tags:
+        tags[EXIF_IFD_POINTER] = (4, struct.pack('>I', 8 + size(tags)))
+    block = b'MM\x00*' + struct.pack('>I', 8) + pack(tags, 8)
+    if exif_tags:
+        block += pack(exif_tags, len(block))
+    return b'Exif\x00\x00' + block
+
+
+PNG_TEXT_CHUNKS = (b'tEXt', b'zTXt', b'iTXt')
+
+
+def png_chunk(kind, data):
+    """Serialized PNG chunk: length, type, data, CRC"""
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def png_text_chunks(path):
+    """
+    Text metadata of an image as raw PNG chunks, for copying onto another PNG: a PNG's
+    own tEXt/zTXt/iTXt chunks byte for byte, or iTXt chunks built from a JPEG/WEBP's EXIF text.
+    """
+    with open(path, 'rb') as f:
+        if f.read(8) != PNG_SIGNATURE:
+            return [png_chunk(b'iTXt', key.encode('latin-1', errors='replace')[:79] + b'\x00\x00\x00\x00\x00' + value.encode('utf-8'))
+                    for key, value in read_image_metadata(path).items()]
+        chunks = []
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            length, kind = struct.unpack('>I4s', header)
+            if kind in PNG_TEXT_CHUNKS:
+                chunks.append(header + _read(f, length + 4))
+            elif kind == b'IEND':
+                break
+            else:
+                f.seek(length + 4, os.SEEK_CUR)
+        return chunks
+
+
+def strip_png_text(path):
+    """
+    Remove the text chunks of a PNG file in place. Every other chunk (IDAT included)
+    is copied unchanged, so nothing is decoded; the file's mtime is kept.
+    Returns the number of bytes removed (0: nothing to strip, file untouched).
+    """
+    st = os.stat(path)
+    tmp = path + ".ps-strip"
+    removed = 0
+    with open(path, 'rb') as src:
+        if src.read(8) != PNG_SIGNATURE:
+            raise ValueError("Not a PNG file")
+        # First pass over the headers only: most files may have nothing to strip
+        while True:
+            header = src.read(8)
+            if len(header) < 8:
+                break
+            length, kind = struct.unpack('>I4s', header)
+            if kind in PNG_TEXT_CHUNKS:
+                removed += length + 12
+            src.seek(length + 4, os.SEEK_CUR)
+        if not removed:
+            return 0
+        src.seek(8)
+        try:
+            with open(tmp, 'wb') as dst:
+                dst.write(PNG_SIGNATURE)
+                while True:
+                    header = src.read(8)
+                    if len(header) < 8:
+                        break
+                    length, kind = struct.unpack('>I4s', header)
+                    if kind in PNG_TEXT_CHUNKS:
+                        src.seek(length + 4, os.SEEK_CUR)
+                        continue
+                    dst.write(header)
+                    remaining = length + 4
+                    while remaining:
+                        block = src.read(min(remaining, 1024 * 1024))
+                        if not block:
+                            raise ValueError("Truncated PNG")
+                        dst.write(block)
+                        remaining -= len(block)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    os.replace(tmp, path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    return removed
+
+
+def extract_prompts(chunks):
+    """Prompt texts found in image metadata (ComfyUI workflow/prompt, A1111 parameters), deduplicated"""
+    prompts = []
+    
+    if 'workflow' in chunks:
+        try:
+            wf = json.loads(chunks['workflow'])
+            for node in wf.get('nodes', []):
+                for w in node.get('widgets_values', []):
+                    if isinstance(w, str) and len(w) > 20:
+                        prompts.append(w)
+        except:
+            pass
+    
+    if 'prompt' in chunks:
+        try:
+            pr = json.loads(chunks['prompt'])
+            for nid, node in pr.items():
+                if isinstance(node, dict):
+                    inputs = node.get('inputs', {})
+                    for key in ['text', 'prompt', 'positive', 'negative']:
+                        val = inputs.get(key, '')
+                        if isinstance(val, str) and len(val) > 10:
+                            prompts.append(val)
+        except:
+            pass
+    
+    for key in ('parameters', 'UserComment'):
+        if key in chunks:
+            prompts.append(chunks[key])
+    
+    # Dedupe
+    seen = set()
+    unique = []
+    for p in prompts:
+        if p not in seen:
+            seen.add(p)
+            unique.append(p)
+    return unique
+
+
+# ============================================================================
+# BACKGROUND JOBS
+# ============================================================================
+# Long-running work started from the API or a node (harvest, thumbnail backfill).
+# A job runs on its own thread and fans out to job_executor; the sidebar polls its
+# progress via /ps/jobs/<id>.
+
+jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+job_executor = CountingExecutor(max_workers=int(os.environ.get("PS_JOB_WORKERS", min(8, os.cpu_count() or 4))),
+                                thread_name_prefix="ps-job")
+
+
+class Job(ABC):
+    KIND = "job"
+    COUNTERS = ()
+    
+    def __init__(self):
+        self.id = hashlib.sha1(f"{self.KIND}{time.time_ns()}".encode()).hexdigest()[:10]
+        self.status = "pending"
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self._cancel = threading.Event()
+    
+    def cancel(self):
+        self._cancel.set()
+    
+    def progress(self):
+        info = {"id": self.id, "kind": self.KIND, "status": self.status, "error": self.error,
+                "started_at": self.started_at, "finished_at": self.finished_at}
+        info.update((name, getattr(self, name)) for name in self.COUNTERS)
+        return info
+    
+    def run(self):
+        """Do the work; blocks until done, cancelled or failed"""
+        self.status = "running"
+        self.started_at = datetime.now().isoformat()
+        try:
+            self._run()
+            self.status = "cancelled" if self._cancel.is_set() else "done"
+        except Exception as e:
+            self.status = "error"
+            self.error = str(e)
+            print(f"[PS] {self.KIND} job failed: {e}")
+        self.finished_at = datetime.now().isoformat()
+        return self.progress()
+    
+    def start(self):
+        """run() on its own thread, so it does not hold a slot of a shared pool while it waits on job_executor"""
+        threading.Thread(target=self.run, name=f"ps-{self.KIND}-job", daemon=True).start()
+    
+    @abstractmethod
+    def _run(self):
+        """The job's work; checks self._cancel and keeps the COUNTERS current"""
+
+
+def start_job(job):
+    """Register a job; returns (job, None), or (None, running job) if one of the same kind is running"""
+    with _jobs_lock:
+        for other in jobs.values():
+            if other.KIND == job.KIND and other.status in ("pending", "running"):
+                return None, other
+        jobs[job.id] = job
+        # Forget the oldest finished jobs; running ones stay reachable (progress, cancel)
+        finished = [jid for jid, other in jobs.items() if other.status not in ("pending", "running")]
+        for jid in finished[:max(len(jobs) - 20, 0)]:
+            del jobs[jid]
+    return job, None
+
+
+# Harvest: import the prompts found in a folder of images into PromptDB. Metadata
+# reads are seeks and thumbnails are PIL's C code, so threads parallelize well;
+# prompts are inserted in batches. harvest_cache.jsonl remembers (size, mtime) of
+# every handled file, so a re-run only opens new or changed files.
+
+class HarvestJob(Job):
+    KIND = "harvest"
+    COUNTERS = ("found", "unchanged", "processed", "added", "duplicates", "failed")
+    BATCH = 256
+    
+    def __init__(self, directory, recursive=True, thumbnails=True, category=None, tags=None):
+        super().__init__()
+        self.directory = os.path.abspath(directory)
+        self.recursive = recursive
+        self.thumbnails = thumbnails
+        self.category = category
+        self.tags = tags
+        self._thumbed = set()  # text hashes that already got a thumbnail in this job
+        self._rendering = set()  # text hashes whose thumbnail a worker is rendering now
+        self._thumb_lock = threading.Lock()
+    
+    def progress(self):
+        return {**super().progress(), "directory": self.directory}
+    
+    def _run(self):
+        if not os.path.isdir(self.directory):
+            raise ValueError(f"Not a directory: {self.directory}")
+        cache = harvest_cache.load()
+        todo = []
+        for path, size, mtime in self._scan(self.directory):
+            if self._cancel.is_set():
+                return
+            self.found += 1
+            if cache.get(path) == [size, mtime]:
+                self.unchanged += 1
+            else:
+                todo.append((path, size, mtime))
         
-        # Merge categories, models, tags
-        for cat in incoming.get("categories", []):
-            if cat not in self.data["categories"]:
-                self.data["categories"].append(cat)
-        for model in incoming.get("models", []):
-            if model not in self.data["models"]:
-                self.data["models"].append(model)
-        for tag in incoming.get("tags", []):
-            if tag not in self.data["tags"]:
-                self.data["tags"].append(tag)
-        
-        self._save()
-        return {"added": added, "updated": updated}
+        for i in range(0, len(todo), self.BATCH):
+            if self._cancel.is_set():
+                return
+            batch = todo[i:i + self.BATCH]
+            entries, parsed, handled = [], [], 0
+            results = job_executor.map(self._parse, [f[0] for f in batch])
+            try:
+                for file, result in zip(batch, results):
+                    handled += 1
+                    if result is None:
+                        self.failed += 1
+                    else:
+                        entries.extend(result)
+                        parsed.append(file)
+                    if self._cancel.is_set():
+                        break
+            finally:
+                results.close()  # cancels the files not started yet
+            counts = db.add_prompts(entries, self.category, self.tags)
+            self.added += counts["added"]
+            self.duplicates += counts["duplicates"]
+            self.processed += handled
+            # Unreadable files are not remembered, so the next run tries them again
+            harvest_cache.add(parsed)
     
-    def get_last_saved_id(self):
-        return self._last_saved_id
-
+    def _scan(self, directory):
+        """(path, size, mtime_ns) of the images under directory"""
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if self.recursive:
+                        yield from self._scan(entry.path)
+                elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    st = entry.stat()
+                    yield entry.path, st.st_size, st.st_mtime_ns
+            except OSError:
+                continue
+    
+    def _parse(self, path):
+        """Prompt entries of one image, or None if it could not be read (the job skips it)"""
+        try:
+            texts = [t.strip() for t in extract_prompts(read_image_metadata(path)) if t.strip()]
+            if not texts:
+                return []
+            created = datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+            thumb = self._thumbnail(path, texts) if self.thumbnails else None
+            source = output_relpath(path)
+        except (OSError, ValueError, struct.error, zlib.error) as e:
+            print(f"[PS] Harvest skipped {path}: {e}")
+            return None
+        return [{"text": t, "thumb": thumb, "created_at": created, "source": source} for t in texts]
+    
+    def _thumbnail(self, path, texts):
+        """
+        Thumbnail key for an image of texts, if one of them is new to the library and no
+        other image has supplied it yet. A failed render leaves it to the next image.
+        """
+        hashes = {db.text_hash(t) for t in texts}
+        fresh = hashes - db.known_hashes(hashes)
+        with self._thumb_lock:
+            claimed = fresh - self._thumbed - self._rendering
+            self._rendering |= claimed
+        if not claimed:
+            return None
+        thumb = None
+        try:
+            data = create_thumbnail(path)
+            if data:
+                thumb = db.thumbs.put(data)
+        finally:
+            with self._thumb_lock:
+                self._rendering -= claimed
+                if thumb:
+                    self._thumbed |= claimed
+        return thumb
 
-db = PromptDB()
 
+class HarvestCache:
+    """path -> [size, mtime_ns] of harvested files, as an append-only JSON-lines file"""
+    
+    def __init__(self, file):
+        self.file = file
+        self._lock = threading.Lock()
+    
+    def load(self):
+        cache = {}
+        try:
+            with open(self.file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        path, size, mtime = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line
+                    cache[path] = [size, mtime]
+        except OSError:
+            pass
+        return cache
+    
+    def add(self, files):
+        lines = "".join(json.dumps(list(f), ensure_ascii=False) + "\n" for f in files)
+        with self._lock, open(self.file, 'a', encoding='utf-8') as f:
+            f.write(lines)
+    
+    def clear(self):
+        with self._lock:
+            try:
+                os.remove(self.file)
+            except FileNotFoundError:
+                pass
 
-# ============================================================================
-# THUMBNAIL HELPER
-# ============================================================================
 
-def create_thumbnail(image_path, size=64):
-    """Create 64x64 JPEG thumbnail as base64"""
-    try:
-        from PIL import Image
-        with Image.open(image_path) as img:
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-            # Crop to square
-            w, h = img.size
-            m = min(w, h)
-            left = (w - m) // 2
-            top = (h - m) // 2
-            img = img.crop((left, top, left + m, top + m))
-            img = img.resize((size, size), Image.Resampling.LANCZOS)
-            
-            buf = BytesIO()
-            img.save(buf, format='JPEG', quality=85)
-            return base64.b64encode(buf.getvalue()).decode('ascii')
-    except Exception as e:
-        print(f"[PS] Thumbnail error: {e}")
-        return None
+harvest_cache = HarvestCache(db.path / "harvest_cache.jsonl")
 
 
-def capture_last_output_image():
-    """Find most recent image in output dir (including subdirs) and create thumbnail for all recently saved prompts"""
-    try:
-        import time
-        output_dir = folder_paths.get_output_directory()
-        latest = None
-        latest_time = 0
-        
-        # Search recursively in output dir
-        for root, dirs, files in os.walk(output_dir):
-            for f in files:
-                if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')):
-                    fp = os.path.join(root, f)
-                    mt = os.path.getmtime(fp)
-                    if mt > latest_time:
-                        latest_time = mt
-                        latest = fp
-        
-        # Only process if image is recent (within last 30 seconds)
-        if latest and (time.time() - latest_time) < 30:
-            # Get all recently saved prompt IDs
-            recent_ids = db.get_all_last_saved_ids()
-            if recent_ids:
-                thumb = create_thumbnail(latest, 64)
-                if thumb:
-                    for pid in recent_ids:
-                        db.set_thumbnail(pid, thumb)
-                    print(f"[PS] Thumbnail from {os.path.basename(latest)} assigned to {len(recent_ids)} prompts: {recent_ids}")
-                    return True
+class ThumbnailBackfillJob(Job):
+    """
+    Render thumbnails from the prompts' "source" images: the missing ones (no thumb,
+    or its file is gone), or all of them with regenerate (e.g. after changing
+    PS_THUMB_SIZE / PS_THUMB_FORMAT). Each source image is rendered once. Finally,
+    thumbnail files no prompt references any more are deleted.
+    
+    The counters are prompts: total = processed = created + failed once done, plus
+    no_source for prompts without a source image. swept counts thumbnail files.
+    """
+    KIND = "thumbnails"
+    COUNTERS = ("total", "processed", "created", "no_source", "failed", "swept")
+    BATCH = 64
+    
+    def __init__(self, regenerate=False, size=None, format=None):
+        super().__init__()
+        self.regenerate = regenerate
+        self.size = size
+        self.format = format
+    
+    def _run(self):
+        by_source = {}
+        for pid, thumb, source in db.thumbnail_sources():
+            if not self.regenerate and thumb and db.thumbs.exists(thumb):
+                continue
+            if source:
+                by_source.setdefault(source, []).append(pid)
             else:
-                print(f"[PS] No recent prompt IDs to assign thumbnail to")
-        else:
-            if latest:
-                print(f"[PS] Latest image too old: {time.time() - latest_time:.1f}s ago")
-    except Exception as e:
-        print(f"[PS] Capture error: {e}")
-    return False
+                self.no_source += 1
+        self.total = sum(len(pids) for pids in by_source.values())
+        
+        sources = list(by_source)
+        for i in range(0, len(sources), self.BATCH):
+            if self._cancel.is_set():
+                return
+            batch = sources[i:i + self.BATCH]
+            for source, key in zip(batch, job_executor.map(self._render, batch)):
+                pids = by_source[source]
+                if key:
+                    with db.batch():
+                        for pid in pids:
+                            db.set_thumbnail(pid, key)
+                    self.created += len(pids)
+                else:
+                    self.failed += len(pids)
+                self.processed += len(pids)
+        
+        # Thumbnails replaced above, or left behind by deleted prompts
+        self.swept = db.thumbs.sweep({thumb for _, thumb, _ in db.thumbnail_sources() if thumb})
+    
+    def _render(self, source):
+        path = source_path(source)
+        if not os.path.isfile(path):
+            return None
+        data = create_thumbnail(path, self.size, self.format)
+        return db.thumbs.put(data) if data else None
 
 
 # ============================================================================
@@ -471,11 +3407,16 @@ class SmartTextNode:
 
 class PromptSaverNode:
     """Saves prompts. Overwrites last saved until reset via API."""
+    _input_types = (None, None)  # (db.vocab_version, definition)
+    
     @classmethod
     def INPUT_TYPES(cls):
+        version = db.vocab_version
+        if cls._input_types[0] == version:
+            return cls._input_types[1]
         cats = ["none"] + db.get_categories()
         models = ["none"] + db.get_models()
-        return {
+        types = {
             "required": {
                 "text": ("STRING", {"forceInput": True}),
             },
@@ -486,6 +3427,8 @@ class PromptSaverNode:
                 "tags": ("STRING", {"default": ""}),
             }
         }
+        cls._input_types = (version, types)
+        return types
     
     RETURN_TYPES = ("STRING",)
     RETURN_NAMES = ("text",)
@@ -495,31 +3438,29 @@ class PromptSaverNode:
     
     def save(self, text, saver_id="", category="none", model="none", tags=""):
         if text and text.strip():
-            pid = db.save_prompt(
+            db.save_prompt(
                 text.strip(),
                 saver_id=saver_id if saver_id else None,
                 model=model if model != "none" else None,
                 category=category if category != "none" else None,
                 tags=tags
             )
-            print(f"[PS] Saved prompt {pid} (saver: {saver_id})")
         return (text,)
 
 
 class MetadataReaderNode:
+    _input_types = (None, None)
+    
     @classmethod
     def INPUT_TYPES(cls):
-        input_dir = folder_paths.get_input_directory()
-        files = [""]
-        try:
-            files += sorted([f for f in os.listdir(input_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))])
-        except:
-            pass
-        return {
-            "required": {
-                "image": (files, {"image_upload": True}),
-            }
-        }
+        files = input_images.files()
+        if cls._input_types[0] is not files:
+            cls._input_types = (files, {
+                "required": {
+                    "image": ([""] + files, {"image_upload": True}),
+                }
+            })
+        return cls._input_types[1]
     
     RETURN_TYPES = ("STRING",)
     RETURN_NAMES = ("prompts",)
@@ -534,99 +3475,99 @@ class MetadataReaderNode:
         if not image:
             return ("No image selected",)
         
-        import struct, zlib
         input_dir = folder_paths.get_input_directory()
         filepath = os.path.join(input_dir, image)
         
         if not os.path.exists(filepath):
             return ("File not found",)
         
-        chunks = {}
         try:
-            with open(filepath, 'rb') as f:
-                sig = f.read(8)
-                if sig != b'\x89PNG\r\n\x1a\n':
-                    return ("Not a PNG file",)
-                
-                while True:
-                    length_bytes = f.read(4)
-                    if len(length_bytes) < 4:
-                        break
-                    length = struct.unpack('>I', length_bytes)[0]
-                    chunk_type = f.read(4).decode('ascii', errors='ignore')
-                    chunk_data = f.read(length)
-                    f.read(4)
-                    
-                    if chunk_type == 'tEXt':
-                        parts = chunk_data.split(b'\x00', 1)
-                        if len(parts) == 2:
-                            chunks[parts[0].decode('latin-1')] = parts[1].decode('latin-1', errors='replace')
-                    elif chunk_type == 'zTXt':
-                        parts = chunk_data.split(b'\x00', 1)
-                        if len(parts) == 2:
-                            try:
-                                chunks[parts[0].decode('latin-1')] = zlib.decompress(parts[1][1:]).decode('utf-8', errors='replace')
-                            except:
-                                pass
-                    if chunk_type == 'IEND':
-                        break
+            chunks = read_image_metadata(filepath)
+        except UnsupportedImageFormat as e:
+            return (str(e),)
+        except ValueError as e:
+            return (f"Unreadable image: {e}",)
         except Exception as e:
             return (f"Error: {e}",)
         
-        prompts = []
-        
-        if 'workflow' in chunks:
-            try:
-                wf = json.loads(chunks['workflow'])
-                for node in wf.get('nodes', []):
-                    for w in node.get('widgets_values', []):
-                        if isinstance(w, str) and len(w) > 20:
-                            prompts.append(w)
-            except:
-                pass
-        
-        if 'prompt' in chunks:
-            try:
-                pr = json.loads(chunks['prompt'])
-                for nid, node in pr.items():
-                    if isinstance(node, dict):
-                        inputs = node.get('inputs', {})
-                        for key in ['text', 'prompt', 'positive', 'negative']:
-                            val = inputs.get(key, '')
-                            if isinstance(val, str) and len(val) > 10:
-                                prompts.append(val)
-            except:
-                pass
-        
-        if 'parameters' in chunks:
-            prompts.append(chunks['parameters'])
-        
-        # Dedupe
-        seen = set()
-        unique = []
-        for p in prompts:
-            if p not in seen:
-                seen.add(p)
-                unique.append(p)
-        
+        unique = extract_prompts(chunks)
         if unique:
             return ("\n\n---\n\n".join(unique),)
         return ("No prompts found in metadata",)
 
 
+class FilenameAllocator:
+    """
+    Free "{prefix}{index:04d}_{counter:04d}{ext}" names for a batch, all with the same counter.
+    A directory is scanned once per (prefix, ext) for the highest counter; after that a
+    batch costs one exclusive create per file. Names are reserved with O_EXCL, so
+    concurrent executions (or other processes) never get the same file.
+    """
+    
+    def __init__(self):
+        self._next = {}  # (dir, prefix, ext) -> next counter
+        self._lock = threading.Lock()
+    
+    def _scan(self, directory, prefix, ext):
+        pattern = re.compile(re.escape(prefix) + r"\d{4,}_(\d{4,})" + re.escape(ext) + "$")
+        highest = 0
+        try:
+            with os.scandir(directory) as it:
+                for e in it:
+                    m = pattern.match(e.name)
+                    if m:
+                        highest = max(highest, int(m.group(1)))
+        except OSError:
+            pass
+        return highest + 1
+    
+    def allocate(self, directory, prefix, ext, count):
+        """Reserve count new files (created empty); returns their paths in batch order"""
+        key = (os.path.abspath(directory), prefix, ext)
+        with self._lock:
+            counter = self._next.get(key) or self._scan(directory, prefix, ext)
+            while True:
+                paths = []
+                try:
+                    for i in range(count):
+                        path = os.path.join(directory, f"{prefix}{i:04d}_{counter:04d}{ext}")
+                        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                        paths.append(path)
+                except FileExistsError:
+                    # Taken by someone else since the scan: give back ours and try the next counter
+                    for path in paths:
+                        os.remove(path)
+                    counter += 1
+                    continue
+                self._next[key] = counter + 1
+                return paths
+
+
+output_names = FilenameAllocator()
+
+
 class MetadataCleanerNode:
+    # format -> file extension; "webp_lossless" is pixel-exact like PNG, "webp"/"jpeg" use quality
+    FORMATS = {"png": ".png", "webp_lossless": ".webp", "webp": ".webp", "jpeg": ".jpg"}
+    
     @classmethod
     def INPUT_TYPES(cls):
         return {
             "required": {
                 "images": ("IMAGE",),
-                "mode": (["clean", "custom", "clone"], {"default": "clean"}),
+                "mode": (["clean", "custom", "clone", "strip_in_place"], {"default": "clean"}),
                 "filename_prefix": ("STRING", {"default": "cleaned_"}),
                 "save": ("BOOLEAN", {"default": True}),
             },
             "optional": {
                 "source_image": ("IMAGE",),
                 "custom_metadata": ("STRING", {"multiline": True, "default": ""}),
+                "format": (list(cls.FORMATS), {"default": "png"}),
+                "compress_level": ("INT", {"default": 4, "min": 0, "max": 9}),
+                "quality": ("INT", {"default": 90, "min": 1, "max": 100}),
+                # clone: image to copy metadata from; strip_in_place: PNG file or folder to strip.
+                # Relative paths are looked up in the input folder, then the output folder.
+                "source_path": ("STRING", {"default": ""}),
             }
         }
     
@@ -636,14 +3577,30 @@ class MetadataCleanerNode:
     CATEGORY = "Prompting-System"
     OUTPUT_NODE = True
     
-    def process(self, images, mode, filename_prefix, save=True, source_image=None, custom_metadata=""):
-        from PIL import Image
-        from PIL.PngImagePlugin import PngInfo
-        import numpy as np
-        
+    def process(self, images, mode, filename_prefix, save=True, source_image=None, custom_metadata="",
+                format="png", compress_level=4, quality=90, source_path=""):
         if not save:
             return (images, "Save disabled - images passed through")
         
+        if mode == "strip_in_place":
+            return (images, self.strip_in_place(source_path))
+        
+        chunks = None
+        metadata = None
+        if mode == "custom" and custom_metadata:
+            metadata = {"parameters": custom_metadata}
+        elif mode == "clone":
+            source = self.resolve_source(source_path)
+            if not source or not os.path.isfile(source):
+                return (images, f"Clone source not found: {source_path}")
+            try:
+                if format == "png":
+                    chunks = png_text_chunks(source)
+                else:
+                    metadata = read_image_metadata(source)
+            except (OSError, ValueError) as e:
+                return (images, f"Clone source unreadable: {source_path} ({e})")
+        
         output_dir = folder_paths.get_output_directory()
         
         # Handle subfolder in filename_prefix (e.g., "Cleaner/IMG")
@@ -659,99 +3616,363 @@ class MetadataCleanerNode:
                 output_dir = full_subfolder
                 filename_prefix = prefix
         
-        saved_files = []
+        # To uint8 one image at a time into a preallocated batch, on the tensor's device: no
+        # float64 copy, and no float32 copy of the whole batch either
+        import torch
+        pixels = images.new_empty(images.shape, dtype=torch.uint8)
         for i in range(images.shape[0]):
-            img_tensor = images[i]
-            arr = 255. * img_tensor.cpu().numpy()
-            img = Image.fromarray(np.clip(arr, 0, 255).astype(np.uint8))
-            
+            pixels[i] = images[i].mul(255).clamp_(0, 255)
+        pixels = pixels.cpu().numpy()
+        ext = self.FORMATS.get(format, ".png")
+        
+        paths = output_names.allocate(output_dir, filename_prefix, ext, pixels.shape[0])
+        
+        # zlib / libwebp / libjpeg release the GIL, so the encodes run in parallel
+        try:
+            list(encode_executor.map(
+                lambda a: self.write_image(*a, format=format, metadata=metadata, chunks=chunks,
+                                           compress_level=compress_level, quality=quality),
+                zip(pixels, paths)
+            ))
+        except Exception:
+            # Don't leave reserved but unwritten (empty) files behind
+            for path in paths:
+                try:
+                    if os.path.getsize(path) == 0:
+                        os.remove(path)
+                except OSError:
+                    pass
+            raise
+        
+        return (images, f"Saved {len(paths)} images (mode: {mode}, format: {format})")
+    
+    @staticmethod
+    @timed("operation")
+    def write_image(pixels, path, format="png", metadata=None, chunks=None, compress_level=4, quality=90):
+        """
+        Encode one HxWxC uint8 array to path. PNG: metadata {key: text} becomes text chunks,
+        raw chunks (png_text_chunks) are inserted as they are. WEBP/JPEG: EXIF the way
+        ComfyUI writes it (prompt -> Model, workflow -> Make), parameters -> UserComment.
+        """
+        from PIL import Image
+        from PIL.PngImagePlugin import PngInfo
+        
+        img = Image.fromarray(pixels)
+        if format == "png":
             pnginfo = PngInfo()
-            if mode == "custom" and custom_metadata:
-                pnginfo.add_text("parameters", custom_metadata)
-            
-            counter = 1
-            while True:
-                filename = f"{filename_prefix}{i:04d}_{counter:04d}.png"
-                filepath = os.path.join(output_dir, filename)
-                if not os.path.exists(filepath):
-                    break
-                counter += 1
-            
-            img.save(filepath, pnginfo=pnginfo)
-            saved_files.append(filename)
+            for key, value in (metadata or {}).items():
+                pnginfo.add_text(key, value)
+            if not chunks:
+                img.save(path, pnginfo=pnginfo, compress_level=compress_level)
+                return
+            buf = BytesIO()
+            img.save(buf, "PNG", pnginfo=pnginfo, compress_level=compress_level)
+            data = buf.getbuffer()
+            ihdr_end = 8 + 12 + struct.unpack('>I', data[8:12])[0]
+            with open(path, 'wb') as f:
+                f.write(data[:ihdr_end])
+                for chunk in chunks:
+                    f.write(chunk)
+                f.write(data[ihdr_end:])
+            return
+        
+        metadata = metadata or {}
+        tags, exif_tags = {}, {}
+        text = metadata.get("parameters") or metadata.get("UserComment")
+        if text:
+            exif_tags[0x9286] = (7, b'UNICODE\x00' + text.encode('utf-16-be'))
+        if metadata.get("prompt"):
+            tags[0x0110] = (2, ("prompt:" + metadata["prompt"]).encode('utf-8') + b'\x00')
+        if metadata.get("workflow"):
+            tags[0x010F] = (2, ("workflow:" + metadata["workflow"]).encode('utf-8') + b'\x00')
+        exif = build_exif(tags, exif_tags)
+        if format == "webp_lossless":
+            # compress_level 0-9 maps to libwebp's effort (method 0-6)
+            img.save(path, "WEBP", lossless=True, method=round(compress_level * 6 / 9), exif=exif)
+        elif format == "webp":
+            img.save(path, "WEBP", quality=quality, method=4, exif=exif)
+        else:
+            img.convert("RGB").save(path, "JPEG", quality=quality, subsampling=0 if quality >= 90 else 2,
+                                    optimize=True, exif=exif)
+    
+    @staticmethod
+    def resolve_source(path):
+        path = (path or "").strip().strip('"')
+        if not path or os.path.isabs(path):
+            return path or None
+        for base in (folder_paths.get_input_directory(), folder_paths.get_output_directory()):
+            candidate = os.path.join(base, path)
+            if os.path.exists(candidate):
+                return candidate
+        return None
+    
+    def strip_in_place(self, source_path):
+        """Strip text chunks from a PNG file or every PNG under a folder, without re-encoding"""
+        target = self.resolve_source(source_path)
+        if not target:
+            return f"Nothing to strip: {source_path or 'no source_path'}"
+        if os.path.isdir(target):
+            files = [os.path.join(d, f) for d, _, names in os.walk(target) for f in names if f.lower().endswith('.png')]
+        else:
+            files = [target]
         
-        return (images, f"Saved {len(saved_files)} images (mode: {mode})")
+        def strip(path):
+            try:
+                return strip_png_text(path)
+            except (OSError, ValueError) as e:
+                print(f"[PS] Strip failed for {path}: {e}")
+                return None
+        
+        results = list(encode_executor.map(strip, files))
+        stripped = sum(1 for r in results if r)
+        failed = sum(1 for r in results if r is None)
+        removed = sum(r for r in results if r)
+        return (f"Stripped {stripped} of {len(files)} PNG files ({removed / 1024:.1f} KB of metadata removed"
+                f"{f', {failed} failed' if failed else ''})")
+
+
+class HarvestNode:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {
+            "required": {
+                "directory": ("STRING", {"default": "", "placeholder": "empty = output folder"}),
+                "recursive": ("BOOLEAN", {"default": True}),
+                "thumbnails": ("BOOLEAN", {"default": True}),
+            },
+            "optional": {
+                "category": ("STRING", {"default": ""}),
+                "tags": ("STRING", {"default": "harvested"}),
+            }
+        }
+    
+    RETURN_TYPES = ("STRING",)
+    RETURN_NAMES = ("info",)
+    FUNCTION = "harvest"
+    CATEGORY = "Prompting-System"
+    OUTPUT_NODE = True
+    
+    @classmethod
+    def IS_CHANGED(cls, **kwargs):
+        return float("nan")
+    
+    def harvest(self, directory, recursive=True, thumbnails=True, category="", tags=""):
+        directory = directory.strip() or folder_paths.get_output_directory()
+        job, running = start_job(HarvestJob(directory, recursive=recursive, thumbnails=thumbnails,
+                                            category=category or None, tags=tags))
+        if not job:
+            return (f"Harvest {running.id} is already running",)
+        r = job.run()
+        if r["status"] == "error":
+            return (f"Error: {r['error']}",)
+        return (f"Harvest {r['status']}: {r['added']} new prompts, {r['duplicates']} duplicates from "
+                f"{r['processed']} images ({r['unchanged']} unchanged, {r['failed']} unreadable)",)
+
+
+# ============================================================================
+# EXECUTOR
+# ============================================================================
+# PromptDB calls, filesystem walks, PIL and zip work run on this bounded pool so
+# handlers never block ComfyUI's shared event loop (and its websocket updates).
+
+executor = CountingExecutor(max_workers=int(os.environ.get("PS_WORKERS", 4)), thread_name_prefix="ps-worker")
+
+# Threads that produce streamed responses (exports, ZIP downloads): each holds one for the
+# whole transfer, so they get their own pool instead of starving the API requests
+stream_executor = CountingExecutor(max_workers=int(os.environ.get("PS_STREAM_WORKERS", 4)),
+                                   thread_name_prefix="ps-stream")
+
+# Image encoding for the cleaner node; separate so a 64-image batch does not queue ahead of API requests
+encode_executor = CountingExecutor(max_workers=int(os.environ.get("PS_ENCODE_WORKERS", os.cpu_count() or 4)),
+                                   thread_name_prefix="ps-encode")
+
+
+async def run_blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
 
 
 # ============================================================================
 # API ROUTES
 # ============================================================================
 
-routes = PromptServer.instance.routes
+class TimedRoutes:
+    """
+    PromptServer's route table, with each handler's duration and response status
+    recorded (ps_http_*). Used like the RouteTableDef it wraps: @routes.get(path).
+    """
+    
+    def __init__(self, table):
+        self.table = table
+    
+    def _route(self, method, path, **kwargs):
+        def register(handler):
+            getattr(self.table, method)(path, **kwargs)(self._timed(method.upper(), path, handler))
+            return handler
+        return register
+    
+    def get(self, path, **kwargs):
+        return self._route("get", path, **kwargs)
+    
+    def post(self, path, **kwargs):
+        return self._route("post", path, **kwargs)
+    
+    def put(self, path, **kwargs):
+        return self._route("put", path, **kwargs)
+    
+    def delete(self, path, **kwargs):
+        return self._route("delete", path, **kwargs)
+    
+    @staticmethod
+    def _timed(method, route, handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            metrics.start_loop_monitor()
+            started = time.perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status
+                return response
+            except web.HTTPException as e:
+                status = e.status
+                raise
+            except asyncio.CancelledError:
+                status = 499  # client went away
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.observe("ps_http_request_seconds", elapsed, (method, route))
+                metrics.count("ps_http_responses_total", (method, route, str(status)))
+                metrics.slow("request", f"{method} {request.path_qs} ({status})", elapsed)
+        return wrapper
+
+
+routes = TimedRoutes(PromptServer.instance.routes)
+
+# Part of every ETag, so tags handed out before a restart (revision starts over) never match
+BOOT_ID = os.urandom(4).hex()
+COMPRESS_MIN_BYTES = 1024
+
+
+async def revisioned_json(request, build):
+    """
+    JSON response for data that only changes with the library. The ETag is the library
+    revision plus the URL, so an unchanged poll gets a 304 before anything is built.
+    build() runs on the worker pool; a ValueError from it is a 400. Bodies above
+    COMPRESS_MIN_BYTES are compressed for clients that accept gzip/deflate.
+    """
+    etag = '"{}"'.format(hashlib.sha1(f"{BOOT_ID}:{db.revision}:{request.path_qs}".encode()).hexdigest()[:20])
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if etag in (t.strip() for t in request.headers.get("If-None-Match", "").split(",")):
+        return web.Response(status=304, headers=headers)
+    try:
+        text = await run_blocking(lambda: json.dumps(build()))
+    except ValueError as e:
+        return web.json_response({"success": False, "error": str(e)}, status=400)
+    response = web.json_response(text=text, headers=headers)
+    if len(text) > COMPRESS_MIN_BYTES:
+        response.enable_compression()
+    return response
 
 @routes.get("/ps/stats")
 async def ps_stats(request):
-    return web.json_response({"success": True, "stats": db.get_stats()})
+    return await revisioned_json(request, lambda: {"success": True, "stats": db.get_stats()})
 
 @routes.get("/ps/categories")
 async def ps_categories(request):
-    return web.json_response({"success": True, "categories": db.get_categories()})
+    return await revisioned_json(request, lambda: {"success": True, "categories": db.get_categories()})
 
 @routes.post("/ps/categories")
 async def ps_add_category(request):
     data = await request.json()
-    return web.json_response({"success": db.add_category(data.get("name", ""))})
+    return web.json_response({"success": await run_blocking(db.add_category, data.get("name", ""))})
 
 @routes.delete("/ps/categories/{name}")
 async def ps_del_category(request):
-    return web.json_response({"success": db.delete_category(request.match_info["name"])})
+    return web.json_response({"success": await run_blocking(db.delete_category, request.match_info["name"])})
 
 @routes.get("/ps/models")
 async def ps_models(request):
-    return web.json_response({"success": True, "models": db.get_models()})
+    return await revisioned_json(request, lambda: {"success": True, "models": db.get_models()})
 
 @routes.post("/ps/models")
 async def ps_add_model(request):
     data = await request.json()
-    return web.json_response({"success": db.add_model(data.get("name", ""))})
+    return web.json_response({"success": await run_blocking(db.add_model, data.get("name", ""))})
 
 @routes.delete("/ps/models/{name}")
 async def ps_del_model(request):
-    return web.json_response({"success": db.delete_model(request.match_info["name"])})
+    return web.json_response({"success": await run_blocking(db.delete_model, request.match_info["name"])})
 
 @routes.get("/ps/tags")
 async def ps_tags(request):
-    return web.json_response({"success": True, "tags": db.get_tags()})
+    return await revisioned_json(request, lambda: {"success": True, "tags": db.get_tags()})
+
+def project(p, fields):
+    """Keep only the requested prompt fields; text_preview is text cut to 160 characters"""
+    out = {}
+    for f in fields:
+        if f == "text_preview":
+            text = p.get("text") or ""
+            out[f] = text if len(text) <= 160 else text[:160] + "…"
+        elif f in p:
+            out[f] = p[f]
+    return out
 
 @routes.get("/ps/prompts")
 async def ps_prompts(request):
+    """Filtered prompts. Paging: limit + offset and/or cursor (next_cursor of the previous page); fields=a,b projects."""
+    q = request.query
+    
+    def build():
+        page = db.get_prompts_page(
+            search=q.get("search"),
+            category=q.get("category"),
+            model=q.get("model"),
+            tag=q.get("tag"),
+            rating_min=int(q.get("rating_min")) if q.get("rating_min") else None,
+            limit=max(int(q.get("limit", 50)), 0),
+            sort=q.get("sort", "updated_at"),
+            offset=max(int(q.get("offset", 0)), 0),
+            cursor=q.get("cursor") or None
+        )
+        results = page["prompts"]
+        if q.get("fields"):
+            fields = [f.strip() for f in q["fields"].split(",") if f.strip()]
+            results = [project(p, fields) for p in results]
+        return {"success": True, "prompts": results, "total": page["total"], "next_cursor": page["next_cursor"]}
+    
+    return await revisioned_json(request, build)
+
+@routes.get("/ps/facets")
+async def ps_facets(request):
+    """Prompt counts per category/model/tag/rating for the filter (search, category, model, tag, rating_min)"""
     q = request.query
-    results = db.get_prompts(
+    return await revisioned_json(request, lambda: {"success": True, "facets": db.get_facets(
         search=q.get("search"),
         category=q.get("category"),
         model=q.get("model"),
         tag=q.get("tag"),
-        rating_min=int(q.get("rating_min")) if q.get("rating_min") else None,
-        limit=int(q.get("limit", 50)),
-        sort=q.get("sort", "updated_at")
-    )
-    return web.json_response({"success": True, "prompts": results})
+        rating_min=int(q.get("rating_min")) if q.get("rating_min") else None
+    )})
 
 @routes.post("/ps/prompts/{pid}/rate")
 async def ps_rate(request):
     data = await request.json()
-    return web.json_response({"success": db.rate(request.match_info["pid"], data.get("rating", 0))})
+    return web.json_response({"success": await run_blocking(db.rate, request.match_info["pid"], data.get("rating", 0))})
 
 @routes.delete("/ps/prompts/{pid}")
 async def ps_delete(request):
-    return web.json_response({"success": db.delete_prompt(request.match_info["pid"])})
+    return web.json_response({"success": await run_blocking(db.delete_prompt, request.match_info["pid"])})
 
 @routes.put("/ps/prompts/{pid}")
 async def ps_update(request):
     """Update prompt metadata (model, category, tags)"""
     data = await request.json()
     pid = request.match_info["pid"]
-    success = db.update_prompt(
+    success = await run_blocking(
+        db.update_prompt,
         pid,
         model=data.get("model"),
         category=data.get("category"),
@@ -759,54 +3980,496 @@ async def ps_update(request):
     )
     return web.json_response({"success": success})
 
+class StreamWriter:
+    """
+    Write-only file object for zipfile/gzip on a worker thread. Output is handed to
+    the event loop in ~1 MB chunks through a bounded queue, so memory stays constant
+    and the worker waits while the client is slow.
+    """
+    
+    def __init__(self, loop, queue, chunk_size=1024 * 1024):
+        self.loop = loop
+        self.queue = queue
+        self.chunk_size = chunk_size
+        self.cancelled = False
+        self._buf = bytearray()
+    
+    def write(self, data):
+        if self.cancelled:
+            raise IOError("Download cancelled")
+        self._buf += data
+        if len(self._buf) >= self.chunk_size:
+            self._push(bytes(self._buf))
+            self._buf.clear()
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def _push(self, item):
+        asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop).result()
+    
+    def finish(self):
+        """Send what is left, then the end-of-stream marker"""
+        if self._buf and not self.cancelled:
+            self._push(bytes(self._buf))
+        self._buf.clear()
+        self._push(None)
+
+async def stream_from_worker(response, produce, *args):
+    """
+    Run produce(writer, *args) on stream_executor and send what it writes to the prepared
+    StreamResponse as it is written. Returns produce's result.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=4)
+    writer = StreamWriter(loop, queue)
+    
+    def run():
+        try:
+            return produce(writer, *args)
+        finally:
+            writer.finish()
+    
+    job = loop.run_in_executor(stream_executor, run)
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            await response.write(chunk)
+        return await job
+    except BaseException:
+        # Client went away (or the worker failed): stop the worker and unblock its queue.put
+        writer.cancelled = True
+        while not job.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.sleep(0.05)
+        if not job.cancelled():
+            job.exception()  # the worker's "cancelled" error is expected; don't log it as unretrieved
+        raise
+
+def write_ndjson_export(writer, thumbnails=False):
+    """
+    Write the library as gzip-compressed NDJSON: the export_header() record, then one
+    prompt per line. With thumbnails, the first prompt using an image carries it
+    inline as base64 "thumbnail" (the pre-store format, which import understands).
+    """
+    dumps = functools.partial(json.dumps, ensure_ascii=False, separators=(',', ':'))
+    count = 0
+    sent = set()
+    with gzip.GzipFile(fileobj=writer, mode='wb', compresslevel=6) as gz:
+        gz.write((dumps(db.export_header()) + "\n").encode('utf-8'))
+        for batch in db.iter_export():
+            for p in batch:
+                key = p.get("thumb")
+                if thumbnails and key and key not in sent:
+                    data = db.thumbs.get(key)
+                    if data:
+                        p["thumbnail"] = base64.b64encode(data).decode('ascii')
+                        sent.add(key)
+            gz.write("".join(dumps(p) + "\n" for p in batch).encode('utf-8'))
+            count += len(batch)
+    return count
+
+
+class NDJSONImporter:
+    """
+    Incremental import of a streamed export: feed() it the body as it arrives
+    (gzip-compressed or plain), then finish(). Prompts are merged by import_data
+    in batches, so memory does not grow with the size of the upload.
+    """
+    
+    def __init__(self, batch_size=500, max_chunk=8 * 1024 * 1024):
+        self.batch_size = batch_size
+        self.max_chunk = max_chunk
+        self.result = {"added": 0, "updated": 0}
+        self.lines = 0
+        self._inflate = None
+        self._started = False
+        self._buf = b""
+        self._batch = []
+    
+    def feed(self, data):
+        if not self._started:
+            data = self._buf + data
+            if len(data) < 2:
+                self._buf = data
+                return
+            self._buf = b""
+            self._started = True
+            if data[:2] == b"\x1f\x8b":
+                self._inflate = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self._inflate is None:
+            self._split(data)
+            return
+        try:
+            while data:
+                # Bounded output per call, so a highly compressed chunk cannot balloon
+                self._split(self._inflate.decompress(data, self.max_chunk))
+                data = self._inflate.unconsumed_tail
+        except zlib.error as e:
+            raise ValueError(f"Invalid gzip data: {e}")
+    
+    def finish(self):
+        if self._inflate is not None:
+            if not self._inflate.eof:
+                raise ValueError("Truncated gzip data")
+            self._split(self._inflate.flush())
+        if self._buf.strip():
+            self._line(self._buf)
+        self._buf = b""
+        self._flush()
+        return self.result
+    
+    def _split(self, data):
+        lines = (self._buf + data).split(b"\n")
+        self._buf = lines.pop()
+        for line in lines:
+            if line.strip():
+                self._line(line)
+    
+    def _line(self, line):
+        self.lines += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError(f"Line {self.lines}: invalid JSON")
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {self.lines}: expected an object")
+        if record.get("format") == EXPORT_FORMAT:
+            db.import_data({key: record.get(key) or [] for key in ("categories", "models", "tags")})
+            return
+        self._batch.append(record)
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+    
+    def _flush(self):
+        if not self._batch:
+            return
+        # import_data ignores incoming ids; keys only need to be unique within the batch
+        result = db.import_data({"prompts": {str(i): p for i, p in enumerate(self._batch)}})
+        self._batch = []
+        for key in self.result:
+            self.result[key] += result[key]
+
+
 @routes.get("/ps/export")
 async def ps_export(request):
-    return web.json_response({"success": True, "data": db.export_data()})
+    """
+    The library as one JSON document ({"success", "data"}), or with format=ndjson as a
+    streamed gzip-compressed NDJSON file (see write_ndjson_export). thumbnails=1 embeds images.
+    """
+    thumbnails = request.query.get("thumbnails") in ("1", "true")
+    if request.query.get("format") != "ndjson":
+        # Copy and serialize the whole library on a worker thread
+        return await revisioned_json(request, lambda: {"success": True, "data": db.export_data(thumbnails=thumbnails)})
+    
+    response = web.StreamResponse(headers={
+        'Content-Type': 'application/gzip',
+        'Content-Disposition': f'attachment; filename="prompts_{datetime.now().strftime("%Y%m%d_%H%M%S")}.ndjson.gz"'
+    })
+    await response.prepare(request)
+    count = await stream_from_worker(response, write_ndjson_export, thumbnails)
+    await response.write_eof()
+    metrics.count("ps_stream_items_total", ("export",), count)
+    return response
 
 @routes.post("/ps/import")
 async def ps_import(request):
-    data = await request.json()
-    return web.json_response({"success": True, "result": db.import_data(data)})
+    """
+    Merge an export into the library (newer updated_at wins). The body is the JSON
+    document of /ps/export, or a streamed NDJSON export (gzip-compressed, or plain with
+    Content-Type application/x-ndjson), which is imported in batches as it arrives.
+    """
+    chunk = await request.content.read(1024 * 1024)
+    if chunk[:2] != b"\x1f\x8b" and "ndjson" not in request.content_type:
+        body = chunk + await request.content.read()
+        try:
+            result = await run_blocking(lambda: db.import_data(json.loads(body)))
+        except (ValueError, AttributeError) as e:
+            return web.json_response({"success": False, "error": f"Invalid import file: {e}"}, status=400)
+        return web.json_response({"success": True, "result": result})
+    
+    importer = NDJSONImporter()
+    try:
+        while chunk:
+            await run_blocking(importer.feed, chunk)
+            chunk = await request.content.read(1024 * 1024)
+        result = await run_blocking(importer.finish)
+    except ValueError as e:
+        # Batches before the bad line are already merged
+        return web.json_response({"success": False, "error": str(e), "result": importer.result}, status=400)
+    return web.json_response({"success": True, "result": result})
+
+@routes.get("/ps/thumb/{key}")
+async def ps_thumb(request):
+    """Serve a stored thumbnail; keys are content hashes so the response never changes"""
+    key = request.match_info["key"]
+    headers = {"ETag": f'"{key}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("If-None-Match") == headers["ETag"] and ThumbnailStore.valid_key(key):
+        return web.Response(status=304, headers=headers)
+    data = await run_blocking(db.thumbs.get, key)
+    if data is None:
+        return web.json_response({"success": False, "error": "Not found"}, status=404)
+    return web.Response(body=data, content_type=ThumbnailStore.content_type(data), headers=headers)
+
+CAPTURE_EXTENSIONS = IMAGE_EXTENSIONS + ('.gif',)
+
+
+def capture_on_executed(send_sync):
+    """
+    Wrap PromptServer.send_sync so a thumbnail is captured as soon as an output node
+    reports its images: they are on disk by then, no browser round trip or delay needed.
+    Animated outputs ("gifs"/"videos", e.g. Video Helper Suite) count if PIL reads them;
+    a prompt that reported none gets the newest output image when it finishes.
+    """
+    @functools.wraps(send_sync)
+    def wrapper(event, data, sid=None):
+        send_sync(event, data, sid)
+        if not isinstance(data, dict):
+            return
+        if event == "executed":
+            output = data.get("output") or {}
+            images = [i for key in ("images", "gifs", "videos") for i in output.get(key) or ()
+                      if isinstance(i, dict) and str(i.get("filename", "")).lower().endswith(CAPTURE_EXTENSIONS)]
+            if images:
+                executor.submit(capture_last_output_image, images, data.get("prompt_id"))
+        elif event == "executing" and data.get("node") is None and data.get("prompt_id"):
+            # Execution finished; a no-op if an "executed" event already captured it
+            executor.submit(capture_last_output_image, None, data["prompt_id"])
+    return wrapper
+
+
+PromptServer.instance.send_sync = capture_on_executed(PromptServer.instance.send_sync)
 
 @routes.post("/ps/capture-thumbnail")
 async def ps_capture(request):
-    return web.json_response({"success": capture_last_output_image()})
+    """Body (optional): {"prompt_id": ..., "images": [{filename, subfolder, type}]} from the "executed" event"""
+    try:
+        data = await request.json() if request.body_exists else {}
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or not isinstance(data.get("images") or [], list):
+        return web.json_response({"success": False, "error": "Expected a JSON object with an images list"},
+                                 status=400)
+    success = await run_blocking(capture_last_output_image, data.get("images"), data.get("prompt_id"))
+    return web.json_response({"success": success})
 
 @routes.post("/ps/reset-last-saved")
 async def ps_reset(request):
     """Reset last_saved_id for specific saver - next save will create new prompt"""
     data = await request.json() if request.body_exists else {}
     saver_id = data.get('saver_id')
-    db.reset_last_saved(saver_id)
+    await run_blocking(db.reset_last_saved, saver_id)
     return web.json_response({"success": True, "saver_id": saver_id})
 
+def parse_time(value):
+    """Unix timestamp from an ISO date/datetime or a number; None if empty"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def iter_files(root, after=None, before=None, pattern=None):
+    """(path, arcname) of files under root, filtered by mtime range and an fnmatch pattern"""
+    for dirpath, dirs, files in os.walk(root):
+        for name in files:
+            path = os.path.join(dirpath, name)
+            arcname = os.path.relpath(path, root)
+            if pattern and not (fnmatch.fnmatch(arcname.replace(os.sep, "/"), pattern) or fnmatch.fnmatch(name, pattern)):
+                continue
+            if after is not None or before is not None:
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue
+                if (after is not None and mtime <= after) or (before is not None and mtime >= before):
+                    continue
+            yield path, arcname
+
+def write_zip(writer, files):
+    """Write files into a ZIP on writer; already-compressed images are stored, not deflated"""
+    import zipfile
+    count = 0
+    with zipfile.ZipFile(writer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for path, arcname in files:
+            compress = zipfile.ZIP_STORED if path.lower().endswith(IMAGE_EXTENSIONS) else zipfile.ZIP_DEFLATED
+            try:
+                zf.write(path, arcname, compress_type=compress)
+                count += 1
+            except FileNotFoundError:
+                pass  # deleted while zipping
+    return count
+
+def read_download_mark(key):
+    """Time of the last complete download of an output subfolder ("" = whole folder)"""
+    try:
+        with open(db.path / "last_download.json", 'r', encoding='utf-8') as f:
+            return json.load(f).get(key)
+    except (OSError, ValueError):
+        return None
+
+def write_download_mark(key, value):
+    try:
+        with open(db.path / "last_download.json", 'r', encoding='utf-8') as f:
+            marks = json.load(f)
+    except (OSError, ValueError):
+        marks = {}
+    marks[key] = value
+    with open(db.path / "last_download.json", 'w', encoding='utf-8') as f:
+        json.dump(marks, f, indent=2)
+
 @routes.get("/ps/download-outputs")
 async def ps_download_outputs(request):
-    """Download output folder as ZIP"""
-    import zipfile
-    from io import BytesIO
-    
-    output_dir = folder_paths.get_output_directory()
-    
-    # Create ZIP in memory
-    zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-        for root, dirs, files in os.walk(output_dir):
-            for file in files:
-                filepath = os.path.join(root, file)
-                arcname = os.path.relpath(filepath, output_dir)
-                zf.write(filepath, arcname)
-    
-    zip_buffer.seek(0)
-    
-    # Return as downloadable file
-    return web.Response(
-        body=zip_buffer.read(),
-        headers={
-            'Content-Type': 'application/zip',
-            'Content-Disposition': f'attachment; filename="outputs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip"'
-        }
-    )
+    """
+    Stream the output folder as a ZIP while it is being built.
+    Query (all optional): subfolder, after / before (ISO date or unix time),
+    glob (fnmatch on the relative path or file name), since_last=1 (only files
+    modified after the last complete download of the same subfolder).
+    """
+    q = request.query
+    output_dir = os.path.abspath(folder_paths.get_output_directory())
+    subfolder = (q.get("subfolder") or "").strip("/\\")
+    root = os.path.abspath(os.path.join(output_dir, subfolder))
+    if not is_inside(output_dir, root) or not os.path.isdir(root):
+        return web.json_response({"success": False, "error": "Invalid subfolder"}, status=400)
+    try:
+        after = parse_time(q.get("after"))
+        before = parse_time(q.get("before"))
+    except ValueError as e:
+        return web.json_response({"success": False, "error": f"Invalid date: {e}"}, status=400)
+    since_last = q.get("since_last") in ("1", "true")
+    if since_last:
+        last = await run_blocking(read_download_mark, subfolder)
+        if last is not None:
+            after = max(after or 0, last)
+    started = time.time()
+    
+    response = web.StreamResponse(headers={
+        'Content-Type': 'application/zip',
+        'Content-Disposition': f'attachment; filename="outputs_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip"'
+    })
+    await response.prepare(request)
+    
+    files = iter_files(root, after, before, q.get("glob") or None)
+    count = await stream_from_worker(response, write_zip, files)
+    await response.write_eof()
+    
+    if since_last:
+        await run_blocking(write_download_mark, subfolder, started)
+    metrics.count("ps_stream_items_total", ("zip",), count)
+    return response
+
+@routes.get("/ps/image-metadata")
+async def ps_image_metadata(request):
+    """Text metadata and prompts of an image. Query: filename, subfolder, type (output/input/temp) like ComfyUI's /view."""
+    path = resolve_output_image(dict(request.query))
+    if not path:
+        return web.json_response({"success": False, "error": "Image not found"}, status=404)
+    try:
+        chunks = await run_blocking(read_image_metadata, path)
+    except (OSError, ValueError) as e:
+        return web.json_response({"success": False, "error": str(e)}, status=400)
+    return web.json_response({"success": True, "metadata": chunks, "prompts": extract_prompts(chunks)})
+
+@routes.post("/ps/harvest")
+async def ps_harvest(request):
+    """
+    Start importing prompts from the images of a folder.
+    Body: {type: output|input, subfolder, recursive, thumbnails, category, tags, rescan}.
+    rescan=true forgets which files were already harvested. Returns the job; poll
+    GET /ps/jobs/{id} for its progress until status is done, cancelled or error.
+    """
+    data = await request.json() if request.body_exists else {}
+    base = folder_paths.get_input_directory() if data.get("type") == "input" else folder_paths.get_output_directory()
+    base = os.path.abspath(base)
+    directory = os.path.abspath(os.path.join(base, data.get("subfolder") or ""))
+    if not is_inside(base, directory) or not os.path.isdir(directory):
+        return web.json_response({"success": False, "error": "Invalid subfolder"}, status=400)
+    if data.get("rescan"):
+        await run_blocking(harvest_cache.clear)
+    job, running = start_job(HarvestJob(
+        directory, recursive=data.get("recursive", True), thumbnails=data.get("thumbnails", True),
+        category=data.get("category"), tags=data.get("tags")
+    ))
+    if not job:
+        return web.json_response({"success": False, "error": "A harvest is already running", "job": running.progress()}, status=409)
+    job.start()
+    return web.json_response({"success": True, "job": job.progress()})
+
+@routes.post("/ps/thumbnails/backfill")
+async def ps_thumbnails_backfill(request):
+    """
+    Start rendering missing thumbnails from the prompts' source images.
+    Body: {regenerate: re-render all, size, format: jpeg|webp}. Returns the job; poll
+    GET /ps/jobs/{id} for its progress until status is done, cancelled or error.
+    """
+    data = await request.json() if request.body_exists else {}
+    job, running = start_job(ThumbnailBackfillJob(
+        regenerate=bool(data.get("regenerate")), size=data.get("size"), format=data.get("format")
+    ))
+    if not job:
+        return web.json_response({"success": False, "error": "A backfill is already running", "job": running.progress()}, status=409)
+    job.start()
+    return web.json_response({"success": True, "job": job.progress()})
+
+@routes.get("/ps/jobs")
+async def ps_jobs(request):
+    kind = request.query.get("kind")
+    return web.json_response({"jobs": [job.progress() for job in jobs.values() if not kind or job.KIND == kind]})
+
+@routes.get("/ps/jobs/{job_id}")
+async def ps_job_status(request):
+    job = jobs.get(request.match_info["job_id"])
+    if not job:
+        return web.json_response({"success": False, "error": "Unknown job"}, status=404)
+    return web.json_response({"success": True, "job": job.progress()})
+
+@routes.post("/ps/jobs/{job_id}/cancel")
+async def ps_job_cancel(request):
+    job = jobs.get(request.match_info["job_id"])
+    if not job:
+        return web.json_response({"success": False, "error": "Unknown job"}, status=404)
+    job.cancel()
+    return web.json_response({"success": True, "job": job.progress()})
+
+def library_gauges():
+    """Scrape-time gauges for /ps/metrics: library size, storage files, worker queues"""
+    stats = db.get_stats()
+    files = [f for f in (db.file, db.journal, getattr(db, "db_file", None)) if f is not None]
+    files += [f.with_name(f.name + "-wal") for f in files if f.suffix == ".sqlite3"]
+    sizes = []
+    for f in files:
+        try:
+            sizes.append(({"file": f.name}, f.stat().st_size))
+        except OSError:
+            pass
+    pools = (("worker", executor), ("stream", stream_executor), ("encode", encode_executor), ("job", job_executor))
+    return [
+        ("ps_library_prompts", "Prompts in the library", [({}, stats["total"])]),
+        ("ps_library_rated_prompts", "Prompts with a rating", [({}, stats["rated"])]),
+        ("ps_library_thumbnail_prompts", "Prompts with a thumbnail", [({}, stats["with_thumbnail"])]),
+        ("ps_library_vocabulary", "Entries of the category/model/tag lists",
+         [({"kind": kind}, stats[kind]) for kind in ("categories", "models", "tags")]),
+        ("ps_library_revision", "Mutations since startup", [({}, db.revision)]),
+        ("ps_storage_bytes", "Size of the library files on disk", sizes),
+        ("ps_executor_queued", "Tasks waiting for a thread of each pool",
+         [({"pool": name}, pool.queued) for name, pool in pools]),
+        ("ps_executor_active", "Tasks running on a thread of each pool",
+         [({"pool": name}, pool.active) for name, pool in pools]),
+        ("ps_jobs_running", "Background jobs running",
+         [({}, sum(job.status == "running" for job in list(jobs.values())))]),
+    ]
+
+@routes.get("/ps/metrics")
+async def ps_metrics(request):
+    """Prometheus text format: request/PromptDB/operation/persist latency, event-loop lag, library gauges"""
+    text = metrics.render(await run_blocking(library_gauges))
+    return web.Response(body=text.encode('utf-8'), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
 
 @routes.post("/ps/upload-lora")
 async def ps_upload_lora(request):
@@ -828,19 +4491,22 @@ async def ps_upload_lora(request):
             return web.json_response({"success": False, "error": "No loras folder found"}, status=500)
         
         lora_dir = lora_dirs[0]
-        os.makedirs(lora_dir, exist_ok=True)
+        await run_blocking(os.makedirs, lora_dir, exist_ok=True)
         
         filepath = os.path.join(lora_dir, filename)
         
-        # Write file
+        # Write file (disk writes on the worker pool)
         size = 0
-        with open(filepath, 'wb') as f:
+        f = await run_blocking(open, filepath, 'wb')
+        try:
             while True:
-                chunk = await field.read_chunk()
+                chunk = await field.read_chunk(1024 * 1024)
                 if not chunk:
                     break
                 size += len(chunk)
-                f.write(chunk)
+                await run_blocking(f.write, chunk)
+        finally:
+            await run_blocking(f.close)
         
         return web.json_response({
             "success": True, 
@@ -861,6 +4527,7 @@ NODE_CLASS_MAPPINGS = {
     "PS_PromptSaver": PromptSaverNode,
     "PS_MetadataReader": MetadataReaderNode,
     "PS_MetadataCleaner": MetadataCleanerNode,
+    "PS_Harvest": HarvestNode,
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
@@ -868,9 +4535,10 @@ NODE_DISPLAY_NAME_MAPPINGS = {
     "PS_PromptSaver": "💾 Prompt Saver",
     "PS_MetadataReader": "📖 Metadata Reader",
     "PS_MetadataCleaner": "🧹 Metadata Cleaner",
+    "PS_Harvest": "🌾 Harvest Prompts",
 }
 
 WEB_DIRECTORY = "./js"
 __all__ = ['NODE_CLASS_MAPPINGS', 'NODE_DISPLAY_NAME_MAPPINGS', 'WEB_DIRECTORY']
 
-print(f"\033[94m[Prompting-System]\033[0m Loaded | {db.get_stats()['total']} prompts")
+print(f"\033[94m[Prompting-System]\033[0m Loaded | {db.storage} storage")
@@ -0,0 +1,90 @@
+"""
+Stand-ins for the two ComfyUI modules the extension imports at module level
+(folder_paths and server.PromptServer), so it can be loaded by a plain Python
+process. load_extension() copies the extension into a scratch ComfyUI layout,
+which keeps data/ (prompts, journal, thumbnails) away from a real library.
+"""
+
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import types
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = "ComfyUI-Prompting-System"
+
+
+class PromptServerStub:
+    """PromptServer.instance as the extension uses it: a route table and send_sync"""
+    
+    def __init__(self):
+        from aiohttp import web
+        self.routes = web.RouteTableDef()
+        self.loop = None
+        self.events = []  # (event, data) of every send_sync call
+    
+    def send_sync(self, event, data, sid=None):
+        self.events.append((event, data))
+
+
+def install_stubs(root):
+    """Register folder_paths and server modules rooted at root (input/, output/, temp/, models/)"""
+    dirs = {}
+    for name in ("input", "output", "temp"):
+        dirs[name] = os.path.join(root, name)
+        os.makedirs(dirs[name], exist_ok=True)
+    
+    folder_paths = types.ModuleType("folder_paths")
+    folder_paths.base_path = root
+    folder_paths.get_input_directory = lambda: dirs["input"]
+    folder_paths.get_output_directory = lambda: dirs["output"]
+    folder_paths.get_temp_directory = lambda: dirs["temp"]
+    folder_paths.get_folder_paths = lambda kind: [os.path.join(root, "models", kind)]
+    sys.modules["folder_paths"] = folder_paths
+    
+    server = types.ModuleType("server")
+    
+    class PromptServer:
+        instance = PromptServerStub()
+    
+    server.PromptServer = PromptServer
+    sys.modules["server"] = server
+    return dirs
+
+
+def load_extension(source=None, root=None, env=None):
+    """
+    Import the extension from source (default: this checkout's __init__.py) inside a
+    fresh ComfyUI layout under root (default: a new temp dir). env is applied to
+    os.environ first (PS_STORAGE, PS_DURABILITY, ...), since the extension reads it at
+    import. Returns the module; module.bench_root is the layout root, module.bench_source
+    the file it was copied from.
+    The library is a process-wide singleton, so load one extension per process.
+    """
+    root = root or tempfile.mkdtemp(prefix="ps_bench_")
+    install_stubs(root)
+    package = os.path.join(root, "custom_nodes", PACKAGE)
+    os.makedirs(package, exist_ok=True)
+    source = source or os.path.join(REPO, "__init__.py")
+    shutil.copy(source, os.path.join(package, "__init__.py"))
+    os.environ.update(env or {})
+    
+    spec = importlib.util.spec_from_file_location("prompting_system", os.path.join(package, "__init__.py"),
+                                                  submodule_search_locations=[package])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    module.bench_root = root
+    module.bench_source = source
+    return module
+
+
+def wait_ready(module):
+    """Block until the library has loaded (it loads on a background thread)"""
+    db = module.db
+    ready = getattr(db, "_ready", None)
+    if ready is not None:
+        ready.wait()
+    return db
@@ -0,0 +1,75 @@
+"""
+Compare two benchmark result files (python -m benchmarks.run --out ...) and list
+the metrics that got worse by more than a threshold.
+
+    python -m benchmarks.compare baseline.json current.json --threshold 0.15
+
+Exits with status 1 if there is a regression, so it can gate a release.
+"""
+
+import argparse
+import json
+import sys
+
+
+def result_key(r):
+    params = tuple(sorted((k, str(v)) for k, v in (r.get("params") or {}).items()))
+    return (r["suite"], r.get("backend"), r.get("size"), r["metric"], params)
+
+
+def describe(key):
+    suite, backend, size, metric, params = key
+    where = "/".join(str(part) for part in (suite, backend, size) if part is not None)
+    extra = ",".join(f"{k}={v}" for k, v in params)
+    return f"{where} {metric}" + (f" [{extra}]" if extra else "")
+
+
+def compare(baseline, current):
+    """
+    (key, old, new, change) for every metric present in both runs; change > 0 means
+    worse (slower, bigger, fewer ops/sec), as a fraction of the old value
+    """
+    old = {result_key(r): r for r in baseline["results"] if "value" in r}
+    rows = []
+    for r in current["results"]:
+        key = result_key(r)
+        if "value" not in r or key not in old or not old[key]["value"]:
+            continue
+        before, after = old[key]["value"], r["value"]
+        change = (after - before) / before
+        if r.get("better") == "higher":
+            change = -change
+        rows.append((key, before, after, change))
+    return rows
+
+
+def report(baseline, current, threshold=0.15, show_all=False):
+    """Print the comparison; returns 1 if something regressed by more than threshold"""
+    rows = compare(baseline, current)
+    regressions = [row for row in rows if row[3] > threshold]
+    for key, before, after, change in rows:
+        if show_all or change > threshold:
+            flag = "REGRESSION" if change > threshold else ("improved" if change < -threshold else "")
+            print(f"{describe(key):70s} {before:12.4g} -> {after:12.4g} {after / before - 1:+8.1%} {flag}")
+    print(f"{len(rows)} metrics compared, {len(regressions)} regressed by more than {threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="relative change that counts as a regression (default 0.15)")
+    parser.add_argument("--all", action="store_true", help="print every metric, not only regressions")
+    args = parser.parse_args()
+    
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+    sys.exit(report(baseline, current, args.threshold, args.all))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,622 @@
+"""
+Benchmarks for PromptDB, the image helpers and the /ps routes.
+
+    python -m benchmarks.run                                  # all suites, 1k and 10k prompts (memory: 10k-1M)
+    python -m benchmarks.run --suite query --suite stats --sizes 100000 --backend sqlite
+    python -m benchmarks.run --out new.json --compare old.json
+
+Run from the repository root. Each (suite, backend, size, variant) runs in its own
+process against a scratch ComfyUI layout (see comfy_stubs), so the library
+singleton, environment settings and memory figures never leak between cases.
+--source benchmarks another copy of __init__.py (e.g. the last release) with the
+same suite.
+
+Results are one JSON document (stdout, or --out): the environment, then one
+record per metric {suite, backend, size, params, metric, value, unit, better}.
+Timings are medians of repeated runs. Needs aiohttp (the extension imports it);
+the image suites also need Pillow and numpy and are skipped without them.
+"""
+
+import argparse
+import asyncio
+import collections
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks import comfy_stubs, synthetic
+
+# "json" is the original storage (prompts.json rewritten per mutation): the baseline for the others
+BACKENDS = {"journal": {"PS_STORAGE": "journal"}, "json": {"PS_STORAGE": "json"}, "sqlite": {"PS_STORAGE": "sqlite"}}
+
+
+# ============================================================================
+# MEASUREMENT
+# ============================================================================
+
+RESULT_PREFIX = "@ps-bench "
+
+
+class Recorder:
+    """Reports the metrics of one case to the runner as they come (stdout lines with RESULT_PREFIX)"""
+    
+    def add(self, metric, value, unit, better="lower", **params):
+        result = {"metric": metric, "value": value, "unit": unit, "better": better, "params": params}
+        print(RESULT_PREFIX + json.dumps(result), flush=True)
+
+
+def measure(fn, min_time=0.2, min_runs=3, max_runs=200):
+    """
+    Median seconds per call of fn(); samples until min_time has passed (at least
+    min_runs). Calls faster than a millisecond are timed in groups.
+    """
+    def sample(number):
+        t = time.perf_counter()
+        for _ in range(number):
+            fn()
+        return time.perf_counter() - t
+    
+    started = time.perf_counter()
+    number = 1
+    elapsed = sample(number)
+    while elapsed < 0.001 and number < 100000:
+        number *= 10
+        elapsed = sample(number)
+    samples = [elapsed / number]
+    while len(samples) < max_runs and (len(samples) < min_runs or time.perf_counter() - started < min_time):
+        samples.append(sample(number) / number)
+    return statistics.median(samples)
+
+
+def throughput(fn, count):
+    """Calls per second of fn(i) for i in range(count)"""
+    started = time.perf_counter()
+    for i in range(count):
+        fn(i)
+    return count / (time.perf_counter() - started)
+
+
+def peak_memory(fn):
+    """(result, peak traced bytes) of fn(); tracemalloc slows it down, so time it separately"""
+    tracemalloc.start()
+    try:
+        result = fn()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class CountingWriter(io.RawIOBase):
+    """Write-only sink that only counts bytes (stands in for the response of a streamed export)"""
+    
+    def __init__(self):
+        self.bytes = 0
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self.bytes += len(data)
+        return len(data)
+
+
+def populate(ps, size, seed=0, thumbs=0.3):
+    """Import a synthetic library of size prompts and persist it"""
+    db = ps.db
+    if size:
+        db.import_data(synthetic.generate_library(size, seed=seed, thumbs=thumbs))
+    db.flush()
+    return db
+
+
+def disk_bytes(ps):
+    return sum(f.stat().st_size for f in ps.db.path.iterdir() if f.is_file())
+
+
+# ============================================================================
+# SUITES
+# ============================================================================
+# bench_<name>(ps, rec, size, params): ps is the loaded extension module, size the
+# library size (None for suites that do not use the library), params the variant.
+
+QUERY_FILTERS = {
+    "all": {},
+    "search_common": {"search": "masterpiece"},
+    "search_rare": {"search": "chiaroscuro"},
+    "search_prefix": {"search": "cinem"},
+    "search_phrase": {"search": "golden hour castle"},
+    "category": {"category": "portrait"},
+    "model": {"model": "flux1-dev"},
+    "tag": {"tag": "tag0003"},
+    "rating_min": {"rating_min": 4},
+    "combined": {"category": "portrait", "tag": "tag0000", "rating_min": 3},
+}
+SORTS = ("updated_at", "rating", "used_count", "relevance")
+
+
+def bench_save(ps, rec, size, params):
+    """
+    save_prompt (new prompts and the overwrite of a saver's last prompt), rate, flush, and
+    a queue burst: params["count"] generations that each save a prompt and get its
+    thumbnail, persisted by the final flush
+    """
+    db = populate(ps, size)
+    count = params["count"]
+    thumb = db.thumbs.put(synthetic.thumbnail_bytes(random.Random(0)))
+    
+    def create(i):
+        db.reset_last_saved("bench")
+        return db.save_prompt(f"benchmark prompt {i}, highly detailed", saver_id="bench", category="portrait",
+                              model="flux1-dev", tags="bench, tag0001")
+    
+    def queue():
+        for i in range(count):
+            db.set_thumbnail(create(f"queue {i}"), thumb)
+        db.flush()
+    
+    rec.add("queue", count / measure(queue, min_runs=1, max_runs=1), "items/s", "higher")
+    # Per-operation rates from a smaller sample: with PS_STORAGE=json each is a full rewrite
+    count = min(count, 200)
+    rec.add("save_new", throughput(create, count), "ops/s", "higher")
+    rec.add("save_overwrite", throughput(
+        lambda i: db.save_prompt(f"benchmark prompt {i}, overwritten", saver_id="bench", tags="bench"), count),
+        "ops/s", "higher")
+    pids = [p["id"] for p in db.get_prompts(limit=count)]
+    rec.add("rate", throughput(lambda i: db.rate(pids[i % len(pids)], i % 5 + 1), count), "ops/s", "higher")
+    rec.add("flush", measure(db.flush, min_runs=1, max_runs=1) * 1000, "ms")
+    rec.add("disk", disk_bytes(ps), "bytes")
+
+
+def bench_query(ps, rec, size, params):
+    """get_prompts_page with every filter and sort, cursor paging, and the legacy get_prompts"""
+    db = populate(ps, size)
+    for name, filters in QUERY_FILTERS.items():
+        for sort in SORTS:
+            if sort == "relevance" and "search" not in filters:
+                continue
+            rec.add("page", measure(lambda: db.get_prompts_page(limit=50, sort=sort, **filters)) * 1000, "ms",
+                    filter=name, sort=sort)
+    
+    def walk():
+        cursor = None
+        for _ in range(10):
+            cursor = db.get_prompts_page(limit=50, cursor=cursor)["next_cursor"]
+            if not cursor:
+                break
+    
+    rec.add("cursor_walk_10_pages", measure(walk) * 1000, "ms")
+    rec.add("get_prompts", measure(lambda: db.get_prompts(limit=100)) * 1000, "ms")
+    rec.add("get_prompts_search", measure(lambda: db.get_prompts(search="masterpiece", limit=100)) * 1000, "ms")
+
+
+def bench_stats(ps, rec, size, params):
+    """get_stats, get_facets and the vocabulary lists"""
+    db = populate(ps, size)
+    rec.add("get_stats", measure(db.get_stats) * 1000, "ms")
+    rec.add("get_tags", measure(db.get_tags) * 1000, "ms")
+    rec.add("get_categories", measure(db.get_categories) * 1000, "ms")
+    for name in ("all", "category", "search_common", "combined"):
+        rec.add("get_facets", measure(lambda: db.get_facets(**QUERY_FILTERS[name])) * 1000, "ms", filter=name)
+
+
+def bench_import(ps, rec, size, params):
+    """Import into an empty library (legacy JSON document or streamed NDJSON), then again (all duplicates)"""
+    db = ps.db
+    library = synthetic.generate_library(size)
+    if params["format"] == "json":
+        def run():
+            return db.import_data(json.loads(body))
+        body = json.dumps(library)
+    else:
+        def run():
+            importer = ps.NDJSONImporter()
+            for i in range(0, len(body), 1024 * 1024):
+                importer.feed(body[i:i + 1024 * 1024])
+            return importer.finish()
+        path = os.path.join(tempfile.mkdtemp(), "library.ndjson.gz")
+        synthetic.write_ndjson(path, library)
+        with open(path, 'rb') as f:
+            body = f.read()
+    del library
+    
+    started = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - started
+    db.flush()
+    assert result["added"] == size, result
+    rec.add("import", elapsed, "s")
+    rec.add("import_rate", size / elapsed, "prompts/s", "higher")
+    rec.add("reimport", measure(run, min_runs=1, max_runs=3), "s")
+    rec.add("reimport_peak", peak_memory(run)[1], "bytes")
+
+
+def bench_export(ps, rec, size, params):
+    """Whole-document JSON export vs the streamed gzip NDJSON export, with thumbnails"""
+    db = populate(ps, size)
+    
+    def document():
+        return len(json.dumps({"success": True, "data": db.export_data(thumbnails=True)}))
+    
+    def ndjson():
+        writer = CountingWriter()
+        ps.write_ndjson_export(writer, thumbnails=True)
+        return writer.bytes
+    
+    for name, fn in (("json", document), ("ndjson", ndjson)):
+        rec.add("export", measure(fn, min_runs=1, max_runs=3), "s", format=name)
+        written, peak = peak_memory(fn)
+        rec.add("export_bytes", written, "bytes", format=name)
+        rec.add("export_peak", peak, "bytes", format=name)
+
+
+def bench_load(ps, rec, size, params):
+    """
+    Startup: importing the extension (module exec until its nodes are registered, which
+    is what ComfyUI waits for) and the time until the library is loaded in the background
+    """
+    db = populate(ps, size)
+    while getattr(db, "_compacting", False):  # a large import may have started one
+        time.sleep(0.05)
+    
+    imports, readies = [], []
+    for _ in range(3):
+        started = time.perf_counter()
+        module = comfy_stubs.load_extension(ps.bench_source, root=ps.bench_root)
+        imports.append(time.perf_counter() - started)
+        assert module.NODE_CLASS_MAPPINGS
+        comfy_stubs.wait_ready(module)
+        readies.append(time.perf_counter() - started)
+    rec.add("import", statistics.median(imports), "s")
+    rec.add("ready", statistics.median(readies), "s")
+    
+    def load():
+        ps.PromptDB._instance = None
+        ps.db = ps.PromptDB()
+        ps.db._wait_ready()
+    
+    rec.add("load", measure(load, min_runs=1, max_runs=3), "s")
+
+
+def bench_memory(ps, rec, size, params):
+    """Memory the loaded library occupies (tracemalloc), per prompt"""
+    db = populate(ps, size, thumbs=0)
+    while getattr(db, "_compacting", False):
+        time.sleep(0.05)
+    
+    def load():
+        ps.PromptDB._instance = None
+        ps.db = ps.PromptDB()
+        ps.db._wait_ready()
+    
+    rec.add("memory_per_prompt", retained_memory(load) / max(size, 1), "bytes/prompt")
+
+
+def retained_memory(fn):
+    """Traced bytes allocated by fn() that are still alive when it returns"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_thumbnail(ps, rec, size, params):
+    """create_thumbnail from a 1024px PNG and JPEG, to each thumbnail format"""
+    from PIL import Image
+    directory = tempfile.mkdtemp()
+    image = Image.fromarray(synthetic.pixels(1024, 1024))
+    sources = {}
+    for name, format in (("png", "PNG"), ("jpeg", "JPEG")):
+        sources[name] = os.path.join(directory, f"source.{name}")
+        image.save(sources[name], format)
+    for source, path in sources.items():
+        for format in ("jpeg", "webp"):
+            rec.add("create_thumbnail", 1 / measure(lambda: ps.create_thumbnail(path, format=format)),
+                    "thumbs/s", "higher", source=source, format=format)
+
+
+def bench_metadata(ps, rec, size, params):
+    """
+    MetadataReaderNode.read of ComfyUI-style metadata: a small PNG and 4096px PNG, JPEG
+    and WEBP files of 10-40 MB (the reader seeks past pixel data, so a large file costs
+    about the same as a small one; a PNG has one IDAT header per 64 KB to skip).
+    JPEG/WEBP and the 4096px PNG need Pillow and numpy, else the large PNG is 2048px.
+    """
+    rng = random.Random(0)
+    metadata = synthetic.comfy_metadata(rng)
+    input_dir = sys.modules["folder_paths"].get_input_directory()
+    files = {"small.png": "png"}
+    synthetic.write_png(os.path.join(input_dir, "small.png"), 256, 256, text=metadata)
+    if importlib.util.find_spec("PIL") and importlib.util.find_spec("numpy"):
+        pixels = synthetic.pixels(4096, 4096)
+        pixels[:, :, 2] = synthetic.pixels(4096, 4096, seed=1)[:, :, 0] * 8  # noise that barely compresses
+        for format, ext in (("png", ".png"), ("jpeg", ".jpg"), ("webp", ".webp")):
+            ps.MetadataCleanerNode.write_image(pixels, os.path.join(input_dir, "large" + ext), format=format,
+                                               metadata={**metadata, "parameters": synthetic.prompt_text(rng, 0)},
+                                               quality=95)
+            files["large" + ext] = format
+    else:
+        synthetic.write_png(os.path.join(input_dir, "large.png"), 2048, 2048, text=metadata)
+        files["large.png"] = "png"
+    node = ps.MetadataReaderNode()
+    for name, format in files.items():
+        text = node.read(name)[0]
+        assert "#1," in text, f"{name}: {text[:200]}"  # the first encoder's prompt was found
+        rec.add("read", 1 / measure(lambda: node.read(name)), "reads/s", "higher",
+                file=format, size=name.split(".")[0])
+
+
+def bench_encode(ps, rec, size, params):
+    """MetadataCleanerNode image writing: images/s by format and batch size (parallel encode)"""
+    resolution = params.get("resolution", 512)
+    frames = synthetic.pixels(resolution, resolution)
+    output = sys.modules["folder_paths"].get_output_directory()
+    node = ps.MetadataCleanerNode()
+    try:
+        import torch
+    except ImportError:
+        torch = None
+    for batch in (1, 4, 16):
+        pixels = [frames] * batch
+        for format in ("png", "webp", "jpeg"):
+            if torch is not None:
+                images = torch.from_numpy(synthetic.pixels(resolution, resolution)).float().div(255)[None].repeat(
+                    batch, 1, 1, 1)
+                run = lambda: node.process(images, "clean", "bench_", format=format)
+            else:
+                # No torch here: the same allocation + parallel write_image that process() does
+                def run():
+                    paths = ps.output_names.allocate(output, "bench_", node.FORMATS[format], batch)
+                    list(ps.encode_executor.map(lambda a: node.write_image(*a, format=format), zip(pixels, paths)))
+            rec.add("encode", batch / measure(run, min_runs=2), "images/s", "higher", format=format, batch=batch)
+
+
+def bench_allocator(ps, rec, size, params):
+    """Output filename allocation in a folder that already holds 10,000 images"""
+    directory = tempfile.mkdtemp()
+    for i in range(10000):
+        open(os.path.join(directory, f"img_{i % 4:04d}_{i // 4:04d}.png"), 'w').close()
+    allocator = ps.FilenameAllocator()
+    rec.add("first_allocate", measure(lambda: allocator.allocate(directory, "img_", ".png", 4),
+                                      min_runs=1, max_runs=1) * 1000, "ms")
+    rec.add("allocate", throughput(lambda i: allocator.allocate(directory, "img_", ".png", 4), 500),
+            "batches/s", "higher")
+
+
+def bench_routes(ps, rec, size, params):
+    """The /ps API over HTTP under concurrent clients: plain GETs, revalidated GETs (304) and a mix with writes"""
+    from aiohttp import web, ClientSession
+    from aiohttp.test_utils import TestServer
+    
+    db = populate(ps, size)
+    pids = [p["id"] for p in db.get_prompts(limit=200)]
+    urls = ["/ps/prompts?limit=50", "/ps/prompts?limit=50&sort=rating&category=portrait",
+            "/ps/prompts?limit=50&search=masterpiece&sort=relevance", "/ps/prompts?limit=50&tag=tag0003",
+            "/ps/prompts?limit=100&fields=id,text,thumb", "/ps/stats", "/ps/facets", "/ps/tags", "/ps/categories"]
+    duration = params.get("duration", 2.0)
+    
+    async def client(session, base, scenario, latencies, etags, rng):
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            if scenario == "mixed" and rng.random() < 0.1:
+                async with session.post(f"{base}/ps/prompts/{rng.choice(pids)}/rate",
+                                        json={"rating": rng.randint(1, 5)}) as r:
+                    await r.read()
+            else:
+                url = rng.choice(urls)
+                headers = {"Accept-Encoding": "gzip"}
+                if scenario != "cold" and url in etags:
+                    headers["If-None-Match"] = etags[url]
+                async with session.get(base + url, headers=headers) as r:
+                    await r.read()
+                    if "ETag" in r.headers:
+                        etags[url] = r.headers["ETag"]
+            latencies.append(time.perf_counter() - started)
+    
+    async def main():
+        app = web.Application()
+        app.add_routes(sys.modules["server"].PromptServer.instance.routes)
+        server = TestServer(app)
+        await server.start_server()
+        base = str(server.make_url("")).rstrip("/")
+        try:
+            async with ClientSession() as session:
+                for scenario in ("cold", "revalidate", "mixed"):
+                    for clients in (1, 8, 32):
+                        latencies = []
+                        etags = {}
+                        started = time.perf_counter()
+                        await asyncio.gather(*(client(session, base, scenario, latencies, etags, random.Random(i))
+                                               for i in range(clients)))
+                        elapsed = time.perf_counter() - started
+                        latencies.sort()
+                        rec.add("requests", len(latencies) / elapsed, "req/s", "higher", scenario=scenario,
+                                clients=clients)
+                        rec.add("latency_p50", latencies[len(latencies) // 2] * 1000, "ms", scenario=scenario,
+                                clients=clients)
+                        rec.add("latency_p95", latencies[int(len(latencies) * 0.95)] * 1000, "ms",
+                                scenario=scenario, clients=clients)
+        finally:
+            await server.close()
+    
+    asyncio.run(main())
+
+
+SAVE_QUEUE = 1000  # generations in a queued batch (save suite)
+DEFAULT_SIZES = (1000, 10000)
+
+
+class Suite:
+    def __init__(self, fn, library=True, variants=({},), requires=(), sizes=None):
+        self.fn = fn
+        self.library = library  # runs per backend and size
+        self.sizes = sizes  # library sizes when --sizes is not given (default DEFAULT_SIZES)
+        self.variants = variants  # PS_* keys are set in the environment, all are reported as params
+        self.requires = requires
+
+
+SUITES = {
+    "save": Suite(bench_save, variants=[{"PS_DURABILITY": d, "count": SAVE_QUEUE}
+                                        for d in ("deferred", "commit", "fsync")]),
+    "query": Suite(bench_query),
+    "stats": Suite(bench_stats),
+    "import": Suite(bench_import, variants=[{"format": "json"}, {"format": "ndjson"}]),
+    "export": Suite(bench_export),
+    "load": Suite(bench_load),
+    "memory": Suite(bench_memory, sizes=(10000, 100000, 1000000)),
+    "routes": Suite(bench_routes),
+    "thumbnail": Suite(bench_thumbnail, library=False, requires=("PIL", "numpy")),
+    "metadata": Suite(bench_metadata, library=False),
+    "encode": Suite(bench_encode, library=False, requires=("PIL", "numpy")),
+    "allocator": Suite(bench_allocator, library=False),
+}
+
+
+# ============================================================================
+# RUNNER
+# ============================================================================
+
+def run_case(case):
+    """Worker process: load the extension for one case and run its suite"""
+    env = dict(BACKENDS[case["backend"]] if case["backend"] else {})
+    env.update((k, str(v)) for k, v in case["params"].items() if k.startswith("PS_"))
+    ps = comfy_stubs.load_extension(case["source"], env=env)
+    comfy_stubs.wait_ready(ps)
+    SUITES[case["suite"]].fn(ps, Recorder(), case["size"], case["params"])
+
+
+def run_worker(case, timeout, verbose=False):
+    """
+    Run one case in a child process. Returns (results, error); results recorded before
+    a failure or timeout are kept. Progress goes to stderr as results arrive.
+    """
+    proc = subprocess.Popen([sys.executable, "-m", "benchmarks.run", "--case", json.dumps(case)],
+                            cwd=comfy_stubs.REPO, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    timed_out = threading.Event()
+    timer = threading.Timer(timeout, lambda: (timed_out.set(), proc.kill()))
+    timer.start()
+    results = []
+    output = collections.deque(maxlen=50)  # the extension's output and tracebacks
+    try:
+        for line in proc.stdout:
+            if line.startswith(RESULT_PREFIX):
+                result = json.loads(line[len(RESULT_PREFIX):])
+                results.append(result)
+                print(f"  {result['metric']} {result['params'] or ''}: {result['value']:.4g} {result['unit']}",
+                      file=sys.stderr)
+            else:
+                output.append(line)
+                if verbose:
+                    sys.stderr.write(line)
+        proc.wait()
+    finally:
+        timer.cancel()
+    if proc.returncode == 0:
+        return results, None
+    if timed_out.is_set():
+        return results, f"timeout after {timeout}s"
+    if not verbose:
+        sys.stderr.writelines(output)
+    return results, (output[-1].strip() if output else f"exit status {proc.returncode}")
+
+
+def cases(suites, backends, sizes, source):
+    """sizes=None: each suite's own sizes"""
+    for name in suites:
+        suite = SUITES[name]
+        for backend in (backends if suite.library else [None]):
+            for size in ((sizes or suite.sizes or DEFAULT_SIZES) if suite.library else [None]):
+                for params in suite.variants:
+                    yield {"suite": name, "backend": backend, "size": size, "params": dict(params), "source": source}
+
+
+def environment(source):
+    def version(module):
+        try:
+            return __import__(module).__version__
+        except Exception:
+            return None
+    
+    commit = None
+    if os.path.samefile(source, os.path.join(comfy_stubs.REPO, "__init__.py")):
+        try:
+            commit = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=comfy_stubs.REPO,
+                                    capture_output=True, text=True).stdout.strip() or None
+        except OSError:
+            pass
+    return {"started": datetime.now().isoformat(timespec="seconds"), "commit": commit, "source": source,
+            "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "aiohttp": version("aiohttp"), "pillow": version("PIL"), "numpy": version("numpy"),
+            "torch": version("torch")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Prompting System extension")
+    parser.add_argument("--suite", action="append", choices=list(SUITES), help="suite to run (repeatable; default all)")
+    parser.add_argument("--backend", action="append", choices=list(BACKENDS),
+                        help="storage backend (repeatable; default all: journal, json, sqlite)")
+    parser.add_argument("--sizes", help="library sizes, comma separated (default 1000,10000; "
+                                         "memory: 10000,100000,1000000)")
+    parser.add_argument("--source", default=os.path.join(comfy_stubs.REPO, "__init__.py"),
+                        help="extension to benchmark (default: this checkout)")
+    parser.add_argument("--out", help="write the results here instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="regression threshold for --compare")
+    parser.add_argument("--timeout", type=int, default=1800, help="seconds per case")
+    parser.add_argument("--verbose", action="store_true", help="show the extension's output")
+    parser.add_argument("--case", help=argparse.SUPPRESS)  # worker process: run this JSON case
+    args = parser.parse_args()
+    
+    if args.case:
+        run_case(json.loads(args.case))
+        return
+    
+    if importlib.util.find_spec("aiohttp") is None:
+        sys.exit("aiohttp is required: the extension imports it at module level")
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()] if args.sizes else None
+    document = {"environment": environment(os.path.abspath(args.source)), "results": []}
+    for case in cases(args.suite or list(SUITES), args.backend or list(BACKENDS), sizes,
+                      os.path.abspath(args.source)):
+        record = {k: case[k] for k in ("suite", "backend", "size")}
+        label = " ".join(str(v) for v in (case["suite"], case["backend"], case["size"], case["params"] or "") if v)
+        print(f"[bench] {label}", file=sys.stderr)
+        missing = [m for m in SUITES[case["suite"]].requires if importlib.util.find_spec(m) is None]
+        if missing:
+            document["results"].append({**record, "params": case["params"], "skipped": f"needs {', '.join(missing)}"})
+            print(f"  skipped: needs {', '.join(missing)}", file=sys.stderr)
+            continue
+        results, error = run_worker(case, args.timeout, args.verbose)
+        for result in results:
+            document["results"].append({**record, **result, "params": {**case["params"], **result["params"]}})
+        if error:
+            document["results"].append({**record, "params": case["params"], "error": error})
+    
+    text = json.dumps(document, indent=1)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    
+    if args.compare:
+        from benchmarks import compare
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        sys.exit(compare.report(baseline, document, args.threshold))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Synthetic prompt libraries and test images for the benchmarks.
+
+Libraries are deterministic for a given seed and shaped like a real one: prompt
+lengths, categories, models and tags follow skewed (Zipf-like) distributions,
+most prompts are unrated, and a share of them use thumbnails from a smaller
+pool of images (one render often belongs to several prompts).
+
+    python -m benchmarks.synthetic --prompts 10000 --out library.json
+    python -m benchmarks.synthetic --prompts 100000 --out library.ndjson.gz --thumbs 0.3
+
+writes a file /ps/import accepts (legacy JSON export, or gzip NDJSON when the name
+ends in .gz).
+"""
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import random
+import struct
+import zlib
+from datetime import datetime, timedelta
+
+SUBJECTS = ["portrait", "landscape", "city street", "forest", "castle", "spaceship", "robot", "cat",
+            "dragon", "lighthouse", "mountain lake", "market", "library", "garden", "desert", "harbor",
+            "knight", "witch", "astronaut", "samurai", "mermaid", "train station", "cafe", "temple"]
+WORDS = ["masterpiece", "best quality", "highly detailed", "cinematic lighting", "volumetric fog",
+         "golden hour", "soft light", "rim light", "bokeh", "8k", "sharp focus", "intricate",
+         "digital painting", "oil painting", "watercolor", "concept art", "photorealistic", "octane render",
+         "trending on artstation", "by greg rutkowski", "wide angle", "close-up", "dramatic sky",
+         "rainy night", "neon lights", "snow", "autumn leaves", "moody", "pastel colors", "vibrant",
+         "dark fantasy", "art nouveau", "cyberpunk", "steampunk", "minimalist", "ultra wide shot",
+         "depth of field", "film grain", "35mm", "studio lighting", "ethereal", "glowing", "ornate",
+         "symmetrical", "epic scale", "crowd", "reflections", "long exposure", "isometric", "low poly",
+         "café au lait", "über detailed", "naïve art", "rococo", "ukiyo-e", "bauhaus", "chiaroscuro"]
+CATEGORIES = ["portrait", "landscape", "character", "architecture", "animal", "sci-fi", "fantasy",
+              "product", "anime", "abstract", "food", "vehicle"]
+MODELS = ["sdxl_base_1.0", "flux1-dev", "sd_1.5", "juggernautXL_v9", "ponyDiffusionV6XL",
+          "dreamshaper_8", "realisticVision_v6", "sd3_medium"]
+
+
+def zipf_choice(rng, items, s=1.1):
+    """Pick from items with weight 1/rank^s (earlier items are more common)"""
+    weights = zipf_choice.cache.get((len(items), s))
+    if weights is None:
+        weights = zipf_choice.cache[(len(items), s)] = [1 / (rank + 1) ** s for rank in range(len(items))]
+    return rng.choices(items, weights=weights)[0]
+
+
+zipf_choice.cache = {}
+
+
+def prompt_text(rng, index):
+    words = [zipf_choice(rng, WORDS, 0.8) for _ in range(rng.randint(4, 40))]
+    # The index keeps texts (and so hashes) unique across the library
+    return f"{rng.choice(SUBJECTS)} #{index}, " + ", ".join(dict.fromkeys(words))
+
+
+def thumbnail_bytes(rng, size=2400):
+    """Stand-in for an encoded 64px thumbnail: JPEG markers around incompressible bytes"""
+    return b'\xff\xd8\xff\xe0' + rng.randbytes(size) + b'\xff\xd9'
+
+
+def generate_library(count, seed=0, tags=200, thumbs=0.3, thumb_pool=None, rated=0.4,
+                     categorized=0.8, start=datetime(2024, 1, 1), days=730):
+    """
+    A library as the legacy JSON export ({"prompts": {id: prompt}, "categories", "models",
+    "tags", "thumbnails": {key: base64}}), for PromptDB.import_data. thumbs is the share of
+    prompts with a thumbnail, drawn from thumb_pool images (default: one per 4 prompts).
+    """
+    rng = random.Random(seed)
+    tag_names = [f"tag{i:04d}" for i in range(tags)]
+    pool = []
+    for _ in range((thumb_pool or max(count // 4, 1)) if thumbs else 0):
+        data = thumbnail_bytes(rng, rng.randint(1500, 4000))
+        pool.append((hashlib.sha256(data).hexdigest()[:32], data))
+    
+    prompts = {}
+    used = {}
+    for i in range(count):
+        created = start + timedelta(seconds=rng.randrange(days * 86400))
+        updated = created + timedelta(seconds=int(rng.expovariate(1 / 86400) * 10))
+        p = {
+            "id": f"syn{i:08d}",
+            "text": prompt_text(rng, i),
+            "model": zipf_choice(rng, MODELS) if rng.random() < categorized else None,
+            "category": zipf_choice(rng, CATEGORIES) if rng.random() < categorized else None,
+            "tags": list(dict.fromkeys(zipf_choice(rng, tag_names) for _ in range(int(rng.expovariate(0.5))))),
+            "rating": rng.randint(1, 5) if rng.random() < rated else None,
+            "thumb": None,
+            "created_at": created.isoformat(),
+            "updated_at": updated.isoformat(),
+            "used_count": 1 + int(rng.expovariate(0.3)),
+        }
+        if pool and rng.random() < thumbs:
+            key, data = rng.choice(pool)
+            p["thumb"] = key
+            used[key] = data
+        prompts[p["id"]] = p
+    
+    return {
+        "prompts": prompts,
+        "categories": list(CATEGORIES),
+        "models": list(MODELS),
+        "tags": tag_names,
+        "thumbnails": {key: base64.b64encode(data).decode('ascii') for key, data in used.items()},
+    }
+
+
+def write_ndjson(path, library):
+    """Write a library as the streamed export format (gzip NDJSON, thumbnails inline on first use)"""
+    dumps = lambda record: json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n"
+    thumbnails = library.get("thumbnails") or {}
+    sent = set()
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=6) as f:
+        f.write(dumps({"format": "ps-prompts", "version": 1, "categories": library["categories"],
+                       "models": library["models"], "tags": library["tags"]}))
+        for p in library["prompts"].values():
+            key = p.get("thumb")
+            if key in thumbnails and key not in sent:
+                p = dict(p, thumbnail=thumbnails[key])
+                sent.add(key)
+            f.write(dumps(p))
+
+
+# ----------------------------------------------------------------------------
+# Images
+# ----------------------------------------------------------------------------
+
+def comfy_metadata(rng, nodes=40):
+    """The "prompt" and "workflow" JSON ComfyUI embeds (a few text encoders among other nodes)"""
+    prompt = {}
+    workflow = {"last_node_id": nodes, "nodes": [], "links": [], "version": 0.4}
+    for i in range(1, nodes + 1):
+        if i % 8 == 1:
+            text = prompt_text(rng, i)
+            prompt[str(i)] = {"class_type": "CLIPTextEncode", "inputs": {"text": text, "clip": [str(i + 1), 0]}}
+            widgets = [text]
+        else:
+            prompt[str(i)] = {"class_type": "KSampler", "inputs": {"seed": rng.randrange(2 ** 32), "steps": 30,
+                                                                   "cfg": 7.0, "sampler_name": "euler"}}
+            widgets = [rng.randrange(2 ** 32), "randomize", 30, 7.0, "euler", "normal", 1.0]
+        workflow["nodes"].append({"id": i, "type": prompt[str(i)]["class_type"], "pos": [i * 10, i * 20],
+                                  "size": [400, 200], "flags": {}, "order": i, "mode": 0,
+                                  "widgets_values": widgets})
+    return {"prompt": json.dumps(prompt), "workflow": json.dumps(workflow)}
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def write_png(path, width=512, height=512, text=None, seed=0):
+    """RGB PNG with a noisy gradient and tEXt chunks after IHDR; needs nothing but zlib"""
+    rng = random.Random(seed)
+    rows = []
+    for y in range(height):
+        noise = rng.randbytes(width)
+        row = bytearray(width * 3)
+        for x in range(width):
+            row[3 * x] = (x * 255 // width) ^ (noise[x] & 15)
+            row[3 * x + 1] = y * 255 // height
+            row[3 * x + 2] = noise[x]
+        rows.append(b'\x00' + bytes(row))
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        for key, value in (text or {}).items():
+            f.write(_png_chunk(b'tEXt', key.encode('latin-1') + b'\x00' + value.encode('latin-1', 'replace')))
+        f.write(_png_chunk(b'IDAT', zlib.compress(b''.join(rows), 4)))
+        f.write(_png_chunk(b'IEND', b''))
+    return path
+
+
+def pixels(width=512, height=512, seed=0):
+    """HxWx3 uint8 numpy array (numpy required)"""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 255, width, dtype=np.uint8)[None, :, None]
+    return (gradient + rng.integers(0, 32, (height, width, 3), dtype=np.uint8)).astype(np.uint8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic prompt library for /ps/import")
+    parser.add_argument("--prompts", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tags", type=int, default=200, help="tag vocabulary size")
+    parser.add_argument("--thumbs", type=float, default=0.3, help="share of prompts with a thumbnail")
+    parser.add_argument("--out", required=True, help="*.json (legacy export) or *.gz (NDJSON)")
+    args = parser.parse_args()
+    
+    library = generate_library(args.prompts, seed=args.seed, tags=args.tags, thumbs=args.thumbs)
+    if args.out.endswith(".gz"):
+        write_ndjson(args.out, library)
+    else:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(library, f, ensure_ascii=False)
+    print(f"Wrote {args.prompts} prompts, {len(library['thumbnails'])} thumbnails to {args.out} "
+          f"({os.path.getsize(args.out) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -49,6 +49,9 @@ const getWorkflowName = () => {
 // ============================================================================
 // EXTENSION
 // ============================================================================
+// Handler of the open sidebar for "ps-prompts" change events (set by its render)
+let onPromptsChanged = null;
+
 app.registerExtension({
     name: "PromptingSystem.UI",
     
@@ -172,15 +175,12 @@ app.registerExtension({
                     exportBtn.textContent = '💾 DB';
                     exportBtn.title = 'Export prompts';
                     exportBtn.style.cssText = btnStyle2;
-                    exportBtn.onclick = async () => {
-                        const r = await psApi('/export');
-                        if (r.success && r.data) {
-                            const a = document.createElement('a');
-                            a.href = URL.createObjectURL(new Blob([JSON.stringify(r.data, null, 2)], { type: 'application/json' }));
-                            a.download = `prompts_${new Date().toISOString().slice(0,10)}.json`;
-                            a.click();
-                            toast('Exported!', 'success');
-                        }
+                    exportBtn.onclick = () => {
+                        // Streamed by the server (gzip NDJSON); the browser saves it as it arrives
+                        const a = document.createElement('a');
+                        a.href = '/ps/export?format=ndjson&thumbnails=1';
+                        a.click();
+                        toast('Exporting...', 'info');
                     };
                     row2.appendChild(exportBtn);
                     
@@ -190,20 +190,20 @@ app.registerExtension({
                     importBtn.onclick = () => {
                         const input = document.createElement('input');
                         input.type = 'file';
-                        input.accept = '.json';
+                        input.accept = '.json,.ndjson,.gz';
                         input.onchange = async (e) => {
                             const file = e.target.files[0];
                             if (file) {
-                                try {
-                                    const text = await file.text();
-                                    const data = JSON.parse(text);
-                                    const r = await psApi('/import', { method: 'POST', body: JSON.stringify(data) });
-                                    if (r.success) {
-                                        toast(`+${r.result.added} new, ${r.result.updated} updated`, 'success');
-                                        loadData();
-                                    }
-                                } catch (e) {
-                                    toast('Invalid file', 'error');
+                                // Upload the file as is; the server detects JSON / NDJSON / gzip
+                                const r = await psApi('/import', {
+                                    method: 'POST',
+                                    headers: { 'Content-Type': file.name.endsWith('.json') ? 'application/json' : 'application/x-ndjson' },
+                                    body: file
+                                });
+                                if (r.success) {
+                                    toast(`+${r.result.added} new, ${r.result.updated} updated`, 'success');
+                                } else {
+                                    toast(r.error || 'Invalid file', 'error');
                                 }
                             }
                         };
@@ -219,22 +219,15 @@ app.registerExtension({
                     
                     const outputZipBtn = document.createElement('button');
                     outputZipBtn.textContent = '📦 Outputs ZIP';
+                    outputZipBtn.title = 'Download output folder (Shift+click: only files new since the last download)';
                     outputZipBtn.style.cssText = 'flex: 1; padding: 8px; background: rgba(249,226,175,0.3); border: none; border-radius: 5px; color: #1e1e2e; cursor: pointer; font-size: 12px; font-weight: 500;';
-                    outputZipBtn.onclick = async () => {
-                        toast('Creating ZIP...', 'info');
-                        try {
-                            const response = await fetch('/ps/download-outputs');
-                            if (response.ok) {
-                                const blob = await response.blob();
-                                const a = document.createElement('a');
-                                a.href = URL.createObjectURL(blob);
-                                a.download = `outputs_${new Date().toISOString().slice(0,10)}.zip`;
-                                a.click();
-                                toast('Downloaded!', 'success');
-                            }
-                        } catch (e) {
-                            toast('Failed', 'error');
-                        }
+                    outputZipBtn.onclick = (e) => {
+                        // Let the browser stream the ZIP straight to disk instead of buffering a Blob
+                        const a = document.createElement('a');
+                        a.href = e.shiftKey ? '/ps/download-outputs?since_last=1' : '/ps/download-outputs';
+                        a.download = `outputs_${new Date().toISOString().slice(0,10)}.zip`;
+                        a.click();
+                        toast(e.shiftKey ? 'Downloading new outputs...' : 'Download started', 'info');
                     };
                     row3.appendChild(outputZipBtn);
                     
@@ -298,6 +291,40 @@ app.registerExtension({
                     };
                     row3.appendChild(loraBtn);
                     
+                    const harvestBtn = document.createElement('button');
+                    harvestBtn.textContent = '🌾 Harvest';
+                    harvestBtn.title = 'Import prompts from the images in the output folder (click again to cancel)';
+                    harvestBtn.style.cssText = 'flex: 1; padding: 8px; background: rgba(166,227,161,0.3); border: none; border-radius: 5px; color: #1e1e2e; cursor: pointer; font-size: 12px; font-weight: 500;';
+                    let harvestJob = null;
+                    harvestBtn.onclick = async () => {
+                        if (harvestJob) {
+                            await psApi(`/jobs/${harvestJob}/cancel`, { method: 'POST' });
+                            return;
+                        }
+                        const r = await psApi('/harvest', { method: 'POST', body: JSON.stringify({ type: 'output' }) });
+                        if (!r.success) {
+                            toast(r.error || 'Failed', 'error');
+                            return;
+                        }
+                        harvestJob = r.job.id;
+                        const poll = setInterval(async () => {
+                            const s = await psApi(`/jobs/${harvestJob}`);
+                            const job = s.job;
+                            if (!job) return;
+                            if (job.status === 'running' || job.status === 'pending') {
+                                const left = job.found - job.unchanged;
+                                harvestBtn.textContent = `⏳ ${left ? Math.round(job.processed / left * 100) : 0}%`;
+                                return;
+                            }
+                            clearInterval(poll);
+                            harvestJob = null;
+                            harvestBtn.textContent = '🌾 Harvest';
+                            toast(job.status === 'done' ? `Harvested ${job.added} new prompts` : `Harvest ${job.status}`,
+                                  job.status === 'error' ? 'error' : 'success');
+                        }, 1000);
+                    };
+                    row3.appendChild(harvestBtn);
+                    
                     container.appendChild(row3);
                     
                     // Settings section
@@ -348,7 +375,6 @@ app.registerExtension({
                         if (catInput.value.trim()) {
                             await psApi('/categories', { method: 'POST', body: JSON.stringify({ name: catInput.value.trim() }) });
                             catInput.value = '';
-                            loadData();
                         }
                     };
                     catAddRow.appendChild(catAddBtn);
@@ -375,7 +401,6 @@ app.registerExtension({
                         if (modelInput.value.trim()) {
                             await psApi('/models', { method: 'POST', body: JSON.stringify({ name: modelInput.value.trim() }) });
                             modelInput.value = '';
-                            loadData();
                         }
                     };
                     modelAddRow.appendChild(modelAddBtn);
@@ -391,12 +416,15 @@ app.registerExtension({
                     let currentModel = savedState.model || 'All';
                     let currentTag = savedState.tag || 'All';
                     let currentPage = 1;
+                    let pageCursors = [''];  // pageCursors[i] = cursor that starts page i + 1
                     let perPage = savedState.perPage || 8;
                     let selectedPromptId = null;
                     let selectedPromptText = '';
                     let allCategories = [];
                     let allModels = [];
                     
+                    const resetPaging = () => { currentPage = 1; pageCursors = ['']; };
+                    
                     const persistState = () => {
                         saveState({ search: currentSearch, category: currentCategory, model: currentModel, tag: currentTag, perPage });
                     };
@@ -527,17 +555,18 @@ app.registerExtension({
                             
                             overlay.remove();
                             toast('Saved!', 'success');
-                            loadData();
                         };
                     };
                     
                     // Load data
-                    const loadData = async () => {
+                    const loadStats = async () => {
                         const statsRes = await psApi('/stats');
                         if (statsRes.success) {
                             stats.textContent = `📝 ${statsRes.stats.total} | ⭐ ${statsRes.stats.rated} | 🖼 ${statsRes.stats.with_thumbnail}`;
                         }
-                        
+                    };
+                    
+                    const loadVocab = async () => {
                         // Categories
                         const catRes = await psApi('/categories');
                         if (catRes.success) {
@@ -554,7 +583,6 @@ app.registerExtension({
                                 chip.querySelector('span').onclick = async (e) => {
                                     e.stopPropagation();
                                     await psApi(`/categories/${encodeURIComponent(c)}`, { method: 'DELETE' });
-                                    loadData();
                                 };
                                 catChips.appendChild(chip);
                             });
@@ -576,7 +604,6 @@ app.registerExtension({
                                 chip.querySelector('span').onclick = async (e) => {
                                     e.stopPropagation();
                                     await psApi(`/models/${encodeURIComponent(m)}`, { method: 'DELETE' });
-                                    loadData();
                                 };
                                 modelChips.appendChild(chip);
                             });
@@ -589,31 +616,79 @@ app.registerExtension({
                                 tagRes.tags.map(t => `<option value="${t}">${t}</option>`).join('');
                             tagSelect.value = currentTag;
                         }
-                        
-                        // Prompts
+                    };
+                    
+                    // Prompts of the visible page (patched in place by change events, see below)
+                    let pagePrompts = [];
+                    let hasNext = false;
+                    let totalPages = 1;
+                    
+                    const filterParams = () => {
                         const params = new URLSearchParams();
                         if (currentSearch) params.append('search', currentSearch);
                         if (currentCategory !== 'All') params.append('category', currentCategory);
                         if (currentModel !== 'All') params.append('model', currentModel);
                         if (currentTag !== 'All') params.append('tag', currentTag);
-                        params.append('limit', '500');
+                        return params;
+                    };
+                    
+                    // Show how many prompts of the current filter each dropdown option has
+                    const loadFacets = async () => {
+                        const r = await psApi(`/facets?${filterParams()}`);
+                        if (!r.success) return;
+                        // Tag counts are keyed lowercase, like tag filtering
+                        for (const [select, counts, key] of [[catSelect, r.facets.categories, v => v], [modelSelect, r.facets.models, v => v],
+                                                             [tagSelect, r.facets.tags, v => v.toLowerCase()]]) {
+                            for (const option of select.options) {
+                                if (option.value === 'All') continue;
+                                option.textContent = `${option.value} (${counts[key(option.value)] || 0})`;
+                            }
+                        }
+                    };
+                    
+                    const loadPrompts = async () => {
+                        const params = filterParams();
+                        if (currentSearch) params.append('sort', 'relevance');
+                        // Fetch only the visible page; cursors keep pages stable while prompts are added
+                        params.append('limit', String(perPage));
+                        if (pageCursors[currentPage - 1]) params.append('cursor', pageCursors[currentPage - 1]);
+                        params.append('fields', 'id,text,model,category,tags,rating,thumb,updated_at');
                         
                         const promptsRes = await psApi(`/prompts?${params}`);
+                        if (!promptsRes.success && currentPage > 1) {
+                            // Cursor rejected (relevance cursors go stale when prompts change) - start over
+                            resetPaging();
+                            return loadPrompts();
+                        }
+                        if (!promptsRes.prompts?.length && currentPage > 1) {
+                            // Page emptied (e.g. after deletes) - step back
+                            currentPage--;
+                            pageCursors.length = currentPage;
+                            return loadPrompts();
+                        }
+                        pagePrompts = promptsRes.prompts || [];
+                        pageCursors[currentPage] = promptsRes.next_cursor || '';
+                        hasNext = !!promptsRes.next_cursor;
+                        totalPages = Math.max(currentPage, Math.ceil((promptsRes.total || 0) / perPage));
+                        renderPrompts();
+                    };
+                    
+                    const loadData = async () => {
+                        await loadStats();
+                        await loadVocab();
+                        await loadPrompts();
+                        await loadFacets();
+                    };
+                    
+                    const renderPrompts = () => {
                         resultsList.innerHTML = '';
                         
-                        if (!promptsRes.success || !promptsRes.prompts?.length) {
+                        if (!pagePrompts.length) {
                             resultsList.innerHTML = '<div style="text-align: center; padding: 30px; color: #666; font-size: 13px;">No prompts found</div>';
                             paginationRow.innerHTML = '';
                             return;
                         }
                         
-                        const allPrompts = promptsRes.prompts;
-                        const totalPages = Math.ceil(allPrompts.length / perPage);
-                        currentPage = Math.min(currentPage, totalPages);
-                        
-                        const startIdx = (currentPage - 1) * perPage;
-                        const pagePrompts = allPrompts.slice(startIdx, startIdx + perPage);
-                        
                         // Render prompts - FULL TEXT, variable height
                         pagePrompts.forEach(p => {
                             const card = document.createElement('div');
@@ -624,7 +699,7 @@ app.registerExtension({
                                 selectedPromptText = p.text;
                                 navigator.clipboard.writeText(p.text);
                                 toast('Copied!', 'success');
-                                loadData();
+                                renderPrompts();
                             };
                             
                             const content = document.createElement('div');
@@ -688,7 +763,6 @@ app.registerExtension({
                                 star.onclick = async (e) => {
                                     e.stopPropagation();
                                     await psApi(`/prompts/${p.id}/rate`, { method: 'POST', body: JSON.stringify({ rating: i === p.rating ? 0 : i }) });
-                                    loadData();
                                 };
                                 starsDiv.appendChild(star);
                             }
@@ -707,7 +781,6 @@ app.registerExtension({
                                 e.stopPropagation();
                                 if (confirm('Delete this prompt?')) {
                                     await psApi(`/prompts/${p.id}`, { method: 'DELETE' });
-                                    loadData();
                                 }
                             };
                             bottomRow.appendChild(delBtn);
@@ -716,11 +789,11 @@ app.registerExtension({
                             card.appendChild(content);
                             
                             // Thumbnail
-                            if (p.thumbnail) {
+                            if (p.thumb) {
                                 const thumbDiv = document.createElement('div');
                                 thumbDiv.style.cssText = 'width: 70px; height: 70px; background: rgba(255,255,255,0.05); border-radius: 6px; flex-shrink: 0; overflow: hidden;';
                                 const img = document.createElement('img');
-                                img.src = `data:image/jpeg;base64,${p.thumbnail}`;
+                                img.src = `/ps/thumb/${p.thumb}`;
                                 img.style.cssText = 'width: 100%; height: 100%; object-fit: cover;';
                                 thumbDiv.appendChild(img);
                                 card.appendChild(thumbDiv);
@@ -731,12 +804,12 @@ app.registerExtension({
                         
                         // Pagination
                         paginationRow.innerHTML = '';
-                        if (totalPages > 1) {
+                        if (totalPages > 1 || hasNext) {
                             const prevBtn = document.createElement('button');
                             prevBtn.textContent = '◀ Prev';
                             prevBtn.disabled = currentPage === 1;
                             prevBtn.style.cssText = 'padding: 6px 12px; background: rgba(255,255,255,0.1); border: none; border-radius: 4px; color: #fff; cursor: pointer; font-size: 12px;';
-                            prevBtn.onclick = () => { currentPage--; loadData(); };
+                            prevBtn.onclick = () => { currentPage--; loadPrompts(); };
                             paginationRow.appendChild(prevBtn);
                             
                             const pageInfo = document.createElement('span');
@@ -746,9 +819,9 @@ app.registerExtension({
                             
                             const nextBtn = document.createElement('button');
                             nextBtn.textContent = 'Next ▶';
-                            nextBtn.disabled = currentPage === totalPages;
+                            nextBtn.disabled = !hasNext;
                             nextBtn.style.cssText = 'padding: 6px 12px; background: rgba(255,255,255,0.1); border: none; border-radius: 4px; color: #fff; cursor: pointer; font-size: 12px;';
-                            nextBtn.onclick = () => { currentPage++; loadData(); };
+                            nextBtn.onclick = () => { currentPage++; loadPrompts(); };
                             paginationRow.appendChild(nextBtn);
                         }
                     };
@@ -759,16 +832,65 @@ app.registerExtension({
                         clearTimeout(searchTimeout);
                         searchTimeout = setTimeout(() => {
                             currentSearch = searchInput.value;
-                            currentPage = 1;
+                            resetPaging();
                             persistState();
-                            loadData();
+                            loadPrompts();
+                            loadFacets();
                         }, 300);
                     };
                     
-                    catSelect.onchange = () => { currentCategory = catSelect.value; currentPage = 1; persistState(); loadData(); };
-                    modelSelect.onchange = () => { currentModel = modelSelect.value; currentPage = 1; persistState(); loadData(); };
-                    tagSelect.onchange = () => { currentTag = tagSelect.value; currentPage = 1; persistState(); loadData(); };
-                    perPageSelect.onchange = () => { perPage = parseInt(perPageSelect.value); currentPage = 1; persistState(); loadData(); };
+                    catSelect.onchange = () => { currentCategory = catSelect.value; resetPaging(); persistState(); loadPrompts(); loadFacets(); };
+                    modelSelect.onchange = () => { currentModel = modelSelect.value; resetPaging(); persistState(); loadPrompts(); loadFacets(); };
+                    tagSelect.onchange = () => { currentTag = tagSelect.value; resetPaging(); persistState(); loadPrompts(); loadFacets(); };
+                    perPageSelect.onchange = () => { perPage = parseInt(perPageSelect.value); resetPaging(); persistState(); loadPrompts(); };
+                    
+                    // Server change events: patch the visible page instead of refetching it
+                    const matchesFilters = (p) =>
+                        (currentCategory === 'All' || p.category === currentCategory) &&
+                        (currentModel === 'All' || p.model === currentModel) &&
+                        (currentTag === 'All' || (p.tags || []).some(t => t.toLowerCase() === currentTag.toLowerCase()));
+                    let statsTimeout;
+                    let vocabChanged = false;
+                    onPromptsChanged = (event) => {
+                        if (!el.isConnected) return;
+                        if (event.reset) {
+                            loadData();
+                            return;
+                        }
+                        // Counts and lists refresh once things settle
+                        vocabChanged = vocabChanged || event.vocab;
+                        clearTimeout(statsTimeout);
+                        statsTimeout = setTimeout(async () => {
+                            await loadStats();
+                            if (vocabChanged) {
+                                vocabChanged = false;
+                                await loadVocab();
+                            }
+                            await loadFacets();
+                        }, 500);
+                        let refetch = false;
+                        for (const change of event.changes || []) {
+                            const id = change.op === 'del' ? change.id : change.prompt.id;
+                            const index = pagePrompts.findIndex(p => p.id === id);
+                            if (change.op === 'put' && index >= 0 && (currentSearch || matchesFilters(change.prompt))) {
+                                pagePrompts[index] = change.prompt;
+                            } else if (index >= 0) {
+                                // Deleted, or no longer matches the filters - the next page shifts up
+                                pagePrompts.splice(index, 1);
+                                refetch = refetch || hasNext || !pagePrompts.length;
+                            } else if (change.op === 'put' && currentPage === 1 && !currentSearch && matchesFilters(change.prompt) &&
+                                       (!pagePrompts.length || change.prompt.updated_at >= pagePrompts[0].updated_at)) {
+                                // New or just updated: it sorts first (newest updated_at)
+                                pagePrompts.unshift(change.prompt);
+                                if (pagePrompts.length > perPage) {
+                                    pagePrompts.length = perPage;
+                                    hasNext = true;
+                                }
+                            }
+                        }
+                        if (refetch) loadPrompts();
+                        else renderPrompts();
+                    };
                     
                     loadData();
                 };
@@ -777,12 +899,8 @@ app.registerExtension({
             }
         });
         
-        // Capture thumbnail after execution
-        api.addEventListener("executed", async () => {
-            setTimeout(async () => {
-                await psApi("/capture-thumbnail", { method: "POST" });
-            }, 1500);
-        });
+        // Library changes pushed by the server (thumbnails are captured server-side on "executed")
+        api.addEventListener("ps-prompts", ({ detail }) => onPromptsChanged?.(detail));
     },
     
     async beforeRegisterNodeDef(nodeType, nodeData, app) {
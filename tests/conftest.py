@@ -0,0 +1,51 @@
+"""
+Fixtures: the extension loaded outside ComfyUI (benchmarks.comfy_stubs) into a
+fresh layout per test. Each load is a separate module object with its own
+PromptDB singleton, so tests do not share a library.
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO not in sys.path:
+    sys.path.insert(0, REPO)
+
+from benchmarks import comfy_stubs  # noqa: E402
+
+
+@pytest.fixture
+def load(tmp_path, monkeypatch):
+    """load(root=None, **env): the extension in a ComfyUI layout under root (default: tmp_path/comfy), loaded"""
+    def load(root=None, **env):
+        monkeypatch.setenv("PS_DURABILITY", "commit")
+        for key, value in env.items():
+            monkeypatch.setenv(key, str(value))
+        ps = comfy_stubs.load_extension(root=str(root or tmp_path / "comfy"))
+        comfy_stubs.wait_ready(ps)
+        return ps
+    return load
+
+
+@pytest.fixture
+def ps(load):
+    return load()
+
+
+@pytest.fixture
+def serve(ps):
+    """serve(scenario): run async scenario(client) against the extension's routes and return its result"""
+    from aiohttp import web
+    from aiohttp.test_utils import TestClient, TestServer
+    
+    def serve(scenario):
+        async def main():
+            app = web.Application(client_max_size=1024 ** 3)
+            app.add_routes(sys.modules["server"].PromptServer.instance.routes)
+            async with TestClient(TestServer(app)) as client:
+                return await scenario(client)
+        return asyncio.run(main())
+    return serve
@@ -0,0 +1,64 @@
+"""Output file names: a crowded directory is scanned once, and concurrent batches never share a name"""
+
+import os
+import threading
+import time
+
+
+def populate(tmp_path, count=10000, batch=4):
+    directory = tmp_path / "output"
+    directory.mkdir()
+    for i in range(count):
+        open(os.path.join(directory, f"img_{i % batch:04d}_{i // batch:04d}.png"), 'w').close()
+    return str(directory)
+
+
+def test_allocation_cost_in_a_crowded_directory(ps, tmp_path):
+    directory = populate(tmp_path)
+    allocator = ps.FilenameAllocator()
+    scans = []
+    scan = allocator._scan
+    allocator._scan = lambda *args: scans.append(args) or scan(*args)
+
+    started = time.perf_counter()
+    first = allocator.allocate(directory, "img_", ".png", 4)
+    first_ms = (time.perf_counter() - started) * 1000
+    assert [os.path.basename(p) for p in first] == [f"img_{i:04d}_2500.png" for i in range(4)]
+
+    started = time.perf_counter()
+    for _ in range(200):
+        allocator.allocate(directory, "img_", ".png", 4)
+    per_batch_ms = (time.perf_counter() - started) * 1000 / 200
+    # One scan of the 10k names; later batches only create their own files
+    assert len(scans) == 1
+    assert first_ms < 500, f"first batch {first_ms:.1f} ms"
+    assert per_batch_ms < 5, f"{per_batch_ms:.2f} ms per batch"
+
+
+def test_concurrent_callers_get_unique_names(ps, tmp_path):
+    directory = populate(tmp_path)
+    # Two allocators stand in for two processes sharing the output directory
+    allocators = [ps.FilenameAllocator(), ps.FilenameAllocator()]
+    results = []
+    barrier = threading.Barrier(8)
+
+    def worker(allocator):
+        barrier.wait()
+        for _ in range(40):
+            results.append(allocator.allocate(directory, "img_", ".png", 4))
+
+    threads = [threading.Thread(target=worker, args=(allocators[i % 2],)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    paths = [p for batch in results for p in batch]
+    assert len(results) == 8 * 40
+    assert len(set(paths)) == len(paths)
+    assert all(os.path.exists(p) for p in paths)
+    # A batch shares one counter across its files, and never reuses a pre-existing one
+    for batch in results:
+        counters = {os.path.basename(p)[9:13] for p in batch}
+        assert len(counters) == 1 and int(counters.pop()) >= 2500
+    assert len(os.listdir(directory)) == 10000 + len(paths)
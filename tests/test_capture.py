@@ -0,0 +1,77 @@
+"""Thumbnail capture from the images an execution reported (/ps/capture-thumbnail)"""
+
+import os
+import time
+
+import pytest
+
+from benchmarks import synthetic
+
+pytest.importorskip("PIL")
+
+
+def post(serve, body, **kwargs):
+    async def scenario(client):
+        async with client.post("/ps/capture-thumbnail", data=body, **kwargs) as r:
+            return r.status, await r.json()
+    return serve(scenario)
+
+
+@pytest.mark.parametrize("body", ["[]", '"images"', "{not json"])
+def test_capture_rejects_a_body_that_is_not_an_object(serve, body):
+    status, result = post(serve, body, headers={"Content-Type": "application/json"})
+    assert status == 400 and result["success"] is False
+
+
+def test_capture_prefers_the_saved_image_over_previews(ps, serve):
+    root = ps.bench_root
+    synthetic.write_png(os.path.join(root, "temp", "preview.png"), 64, 64, seed=1)
+    os.makedirs(os.path.join(root, "output", "run"))
+    synthetic.write_png(os.path.join(root, "output", "run", "saved.png"), 64, 64, seed=2)
+    pid = ps.db.save_prompt("a prompt to capture", saver_id="node")
+    images = [{"filename": "preview.png", "subfolder": "", "type": "temp"},
+              {"filename": "saved.png", "subfolder": "run", "type": "output"}]
+    
+    status, result = post(serve, None, json={"prompt_id": "p1", "images": images})
+    assert status == 200 and result["success"] is True
+    assert [s for i, _, s in ps.db.thumbnail_sources() if i == pid] == ["run/saved.png"]
+
+
+def test_capture_falls_back_to_a_preview(ps, serve):
+    synthetic.write_png(os.path.join(ps.bench_root, "temp", "preview.png"), 64, 64, seed=1)
+    pid = ps.db.save_prompt("a prompt to capture", saver_id="node")
+    
+    status, result = post(serve, None, json={"prompt_id": "p2", "images": [
+        {"filename": "preview.png", "subfolder": "", "type": "temp"}]})
+    assert status == 200 and result["success"] is True
+    assert ps.db.get_prompt(pid)["thumb"]
+
+
+def wait_for_thumbnail(ps, pid, timeout=5):
+    deadline = time.time() + timeout
+    while not ps.db.get_prompt(pid)["thumb"]:
+        assert time.time() < deadline, "no thumbnail captured"
+        time.sleep(0.01)
+    return [s for i, _, s in ps.db.thumbnail_sources() if i == pid]
+
+
+def test_executed_event_with_an_animation(ps):
+    from PIL import Image
+    Image.fromarray(synthetic.pixels(32, 32)).save(os.path.join(ps.bench_root, "output", "anim.gif"))
+    pid = ps.db.save_prompt("an animated prompt", saver_id="node")
+    send_sync = ps.capture_on_executed(lambda event, data, sid=None: None)
+    
+    send_sync("executed", {"prompt_id": "p3", "output": {"gifs": [
+        {"filename": "anim.mp4", "subfolder": "", "type": "output", "format": "video/h264-mp4"},
+        {"filename": "anim.gif", "subfolder": "", "type": "output", "format": "image/gif"}]}})
+    assert wait_for_thumbnail(ps, pid) == ["anim.gif"]
+
+
+def test_prompt_without_reported_images_gets_the_newest_output(ps):
+    synthetic.write_png(os.path.join(ps.bench_root, "output", "saved.png"), 64, 64, seed=3)
+    pid = ps.db.save_prompt("a prompt saved by a custom node", saver_id="node")
+    send_sync = ps.capture_on_executed(lambda event, data, sid=None: None)
+    
+    send_sync("executed", {"prompt_id": "p4", "output": {"text": ["done"]}})
+    send_sync("executing", {"node": None, "prompt_id": "p4"})
+    assert wait_for_thumbnail(ps, pid) == ["saved.png"]
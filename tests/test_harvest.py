@@ -0,0 +1,146 @@
+"""Harvest: unreadable images are skipped, the rest of the folder is imported; thumbnails and the job registry"""
+
+import os
+import random
+import threading
+import time
+
+import pytest
+
+from benchmarks import synthetic
+
+
+def test_truncated_images_are_skipped(ps):
+    output = os.path.join(ps.bench_root, "output")
+    rng = random.Random(0)
+    for i in range(5):
+        synthetic.write_png(os.path.join(output, f"good_{i}.png"), 32, 32, text=synthetic.comfy_metadata(rng, 8), seed=i)
+    with open(os.path.join(output, "good_0.png"), 'rb') as f:
+        data = f.read()
+    with open(os.path.join(output, "cut.png"), 'wb') as f:
+        f.write(data[:200])
+    with open(os.path.join(output, "cut.jpg"), 'wb') as f:
+        f.write(b'\xff\xd8\xff\xe1\x00')
+    
+    progress = ps.HarvestJob(output, thumbnails=False).run()
+    assert progress["status"] == "done", progress
+    assert progress["found"] == 7 and progress["processed"] == 7
+    assert progress["failed"] == 2
+    assert progress["added"] > 0
+    
+    # Only the files that were read are remembered: the damaged ones are tried again
+    progress = ps.HarvestJob(output, thumbnails=False).run()
+    assert progress["unchanged"] == 5 and progress["processed"] == 2 and progress["failed"] == 2
+
+
+def test_paths_on_another_drive_are_outside(ps, monkeypatch):
+    def commonpath(paths):
+        raise ValueError("Paths don't have the same drive")
+    
+    monkeypatch.setattr(ps.os.path, "commonpath", commonpath)
+    outside = os.path.abspath(os.path.join(ps.bench_root, "..", "elsewhere.png"))
+    assert ps.is_inside(os.path.join(ps.bench_root, "output"), outside) is False
+    assert ps.output_relpath(outside) == outside
+    assert ps.resolve_output_image({"filename": "elsewhere.png", "subfolder": ".."}) is None
+
+
+def test_job_needs_its_work(ps):
+    class Unfinished(ps.Job):
+        KIND = "unfinished"
+    
+    for cls in (ps.Job, Unfinished):
+        with pytest.raises(TypeError):
+            cls()
+
+
+def same_prompt_images(ps, count):
+    output = os.path.join(ps.bench_root, "output")
+    metadata = synthetic.comfy_metadata(random.Random(5), 8)
+    paths = []
+    for i in range(count):
+        paths.append(os.path.join(output, f"same_{i}.png"))
+        synthetic.write_png(paths[-1], 32, 32, text=metadata, seed=i)
+    return output, paths
+
+
+def test_a_failed_thumbnail_leaves_it_to_the_next_image(ps, monkeypatch):
+    output, paths = same_prompt_images(ps, 2)
+    render = ps.create_thumbnail
+    calls = []
+    
+    def fail_first(path):
+        calls.append(path)
+        return None if len(calls) == 1 else render(path)
+    
+    monkeypatch.setattr(ps, "create_thumbnail", fail_first)
+    job = ps.HarvestJob(output)
+    
+    assert {e["thumb"] for e in job._parse(paths[0])} == {None}
+    thumbs = {e["thumb"] for e in job._parse(paths[1])}
+    assert len(calls) == 2 and None not in thumbs
+
+
+def test_each_prompt_is_rendered_once_across_workers(ps, monkeypatch):
+    output, paths = same_prompt_images(ps, 16)
+    render = ps.create_thumbnail
+    calls = []
+    
+    def slow(path):
+        calls.append(path)
+        time.sleep(0.05)  # keep the render in flight while other workers parse
+        return render(path)
+    
+    monkeypatch.setattr(ps, "create_thumbnail", slow)
+    progress = ps.HarvestJob(output).run()
+    assert progress["status"] == "done" and progress["added"] > 0
+    assert len(calls) == 1
+    assert all(p["thumb"] for p in ps.db.get_prompts(limit=100))
+
+
+def test_running_jobs_are_not_evicted(ps):
+    class Waiting(ps.Job):
+        KIND = "waiting"
+        
+        def __init__(self):
+            super().__init__()
+            self.release = threading.Event()
+        
+        def _run(self):
+            self.release.wait()
+    
+    class Quick(ps.Job):
+        KIND = "quick"
+        
+        def _run(self):
+            pass
+    
+    waiting, _ = ps.start_job(Waiting())
+    waiting.start()
+    while waiting.status == "pending":
+        time.sleep(0.01)
+    for _ in range(30):
+        job, _ = ps.start_job(Quick())
+        job.run()
+    
+    assert ps.jobs[waiting.id] is waiting
+    assert len(ps.jobs) == 20
+    waiting.release.set()
+
+
+def test_cancel_stops_within_a_batch(ps, monkeypatch):
+    output, paths = same_prompt_images(ps, 40)
+    job = ps.HarvestJob(output, thumbnails=False)
+    parse = job._parse
+    
+    def parse_then_cancel(path):
+        job.cancel()
+        time.sleep(0.01)
+        return parse(path)
+    
+    monkeypatch.setattr(job, "_parse", parse_then_cancel)
+    progress = job.run()
+    assert progress["status"] == "cancelled"
+    assert progress["found"] == 40 and progress["processed"] < 40
+    # What was handled is kept; the rest is picked up by the next run
+    again = ps.HarvestJob(output, thumbnails=False).run()
+    assert again["unchanged"] == progress["processed"] and again["processed"] == 40 - progress["processed"]
@@ -0,0 +1,76 @@
+"""Crash safety of the journal: a writer killed at any point loses nothing it acknowledged"""
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import REPO
+
+# Saves prompts in a loop and records each acknowledged save (save_prompt returned)
+WRITER = """
+import sys
+from benchmarks import comfy_stubs
+ps = comfy_stubs.load_extension(root=sys.argv[1])
+db = comfy_stubs.wait_ready(ps)
+start = int(sys.argv[2])
+with open(sys.argv[3], "a") as progress:
+    for i in range(start, start + 100000):
+        db.reset_last_saved("w")
+        pid = db.save_prompt(f"crash test prompt {i} " + "x" * 200, saver_id="w", tags=f"t{i % 7}")
+        if i % 3 == 0:
+            db.rate(pid, i % 5 + 1)
+        progress.write(f"{i}\\n")
+        progress.flush()
+"""
+
+
+def acknowledged(path):
+    with open(path) as f:
+        return [int(line) for line in f.read().split("\n")[:-1]]
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGKILL"), reason="needs SIGKILL")
+@pytest.mark.parametrize("durability", ["commit", "fsync"])
+def test_sigkill_mid_write_loses_no_acknowledged_save(load, tmp_path, durability):
+    root = tmp_path / "comfy"
+    progress = tmp_path / "progress"
+    progress.touch()
+    env = dict(os.environ, PS_DURABILITY=durability, PS_COMPACT_BYTES="20000")
+    next_index = 0
+    for round, target in enumerate((40, 150, 75, 300, 20)):
+        proc = subprocess.Popen([sys.executable, "-c", WRITER, str(root), str(next_index), str(progress)],
+                                cwd=REPO, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        deadline = time.time() + 60
+        while len(acknowledged(progress)) < next_index + target:
+            assert proc.poll() is None, proc.stderr.read().decode()
+            assert time.time() < deadline, "writer made no progress"
+            time.sleep(0.002)
+        proc.send_signal(signal.SIGKILL)
+        proc.wait()
+        proc.stderr.close()
+        next_index = acknowledged(progress)[-1] + 1
+
+        data = root / "custom_nodes" / "ComfyUI-Prompting-System" / "data"
+        # Whatever compaction was doing, the snapshot on disk is a complete document
+        if (data / "prompts.json").exists():
+            assert "prompts" in json.loads((data / "prompts.json").read_text(encoding="utf-8"))
+
+        ps = load(root, PS_DURABILITY=durability, PS_COMPACT_BYTES=20000)
+        texts = {p["text"].split(" ")[3]: p for p in ps.db.get_prompts(limit=10 ** 6)}
+        for i in acknowledged(progress):
+            p = texts.get(str(i))
+            assert p is not None, f"round {round}: acknowledged prompt {i} lost"
+            assert p["tags"] == [f"t{i % 7}"]
+            if i % 3 == 0:
+                assert p["rating"] == i % 5 + 1, f"round {round}: rating of prompt {i} lost"
+        # At most the one save that was in flight when the process died is extra
+        assert len(texts) - len(acknowledged(progress)) in (0, 1)
+        assert ps.db.check_indexes() == []
+        # Loading folded a half-finished compaction: no rotated journal is left behind
+        ps.db.flush()
+        assert not (data / "prompts.journal.old").exists() or ps.db._compacting
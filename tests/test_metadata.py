@@ -0,0 +1,136 @@
+"""Image metadata readers: truncated and malformed files are a ValueError, never a crash; the cleaner node"""
+
+import json
+import os
+import random
+
+import pytest
+
+from benchmarks import synthetic
+
+
+@pytest.fixture
+def images(ps, tmp_path):
+    """An image with ComfyUI-style metadata per format: {format: path}"""
+    pytest.importorskip("PIL")
+    metadata = synthetic.comfy_metadata(random.Random(0), nodes=8)
+    metadata["parameters"] = "a castle at golden hour, highly detailed"
+    paths = {"png": synthetic.write_png(str(tmp_path / "image.png"), 64, 64, text=metadata)}
+    for format in ("jpeg", "webp"):
+        paths[format] = str(tmp_path / f"image.{format}")
+        ps.MetadataCleanerNode.write_image(synthetic.pixels(64, 64), paths[format], format, metadata)
+    return paths
+
+
+@pytest.mark.parametrize("format", ["png", "jpeg", "webp"])
+def test_written_metadata_reads_back(ps, tmp_path, format):
+    from PIL import Image
+    metadata = synthetic.comfy_metadata(random.Random(1), nodes=8)
+    metadata["parameters"] = "café au lait, über detailed, naïve art"
+    path = str(tmp_path / f"image.{format}")
+    ps.MetadataCleanerNode.write_image(synthetic.pixels(32, 32), path, format, metadata)
+    chunks = ps.read_image_metadata(path)
+    if format != "png":
+        chunks["parameters"] = chunks.pop("UserComment", None)
+    assert {key: chunks.get(key) for key in metadata} == metadata
+    if format != "png":
+        # UserComment is UNDEFINED (7) with a charset header, as other EXIF readers expect
+        with Image.open(path) as img:
+            exif_ifd = img.getexif().get_ifd(ps.EXIF_IFD_POINTER)
+        assert exif_ifd[0x9286].startswith(b'UNICODE\x00')
+
+
+@pytest.mark.parametrize("format", ["png", "jpeg", "webp"])
+def test_truncated_files(ps, images, tmp_path, format):
+    with open(images[format], 'rb') as f:
+        data = f.read()
+    assert "prompt" in ps.read_image_metadata(images[format])
+    cut = str(tmp_path / "cut")
+    step = max(1, len(data) // 400)
+    for size in list(range(0, 400)) + list(range(400, len(data), step)):
+        with open(cut, 'wb') as f:
+            f.write(data[:size])
+        try:
+            chunks = ps.read_image_metadata(cut)
+        except ValueError:
+            continue
+        assert isinstance(chunks, dict)
+        for key in ("prompt", "workflow"):
+            if key in chunks:
+                json.loads(chunks[key])  # a text is either complete or missing
+
+
+def test_corrupt_exif_block(ps):
+    header = b'II*\x00\x08\x00\x00\x00'
+    for block in (header, header + b'\x05\x00', header + b'\x01\x00' + b'\x86\x92\x07\x00\xff\xff\x00\x00\x40\x00\x00\x00'):
+        try:
+            ps.parse_exif(block)
+        except ValueError:
+            pass
+
+
+@pytest.mark.parametrize("kind", [1, 7])
+def test_user_comment_as_byte_or_undefined(ps, kind):
+    for code, text in ((b'UNICODE\x00', "naïve art".encode('utf-16-be')), (b'ASCII\x00\x00\x00', b"castle")):
+        block = ps.build_exif({}, {0x9286: (kind, code + text)})
+        assert ps.parse_exif(block) == {"UserComment": "naïve art" if code.startswith(b'UNICODE') else "castle"}
+    # Other tags stay text-only
+    assert ps.parse_exif(ps.build_exif({0x010E: (1, b"not text")})) == {}
+
+
+def test_metadata_route_answers_400_for_a_truncated_jpeg(ps, images, serve):
+    with open(images["jpeg"], 'rb') as f:
+        data = f.read()
+    with open(os.path.join(ps.bench_root, "output", "cut.jpeg"), 'wb') as f:
+        f.write(data[:30])
+    
+    async def scenario(client):
+        async with client.get("/ps/image-metadata", params={"filename": "cut.jpeg", "type": "output"}) as r:
+            return r.status, await r.json()
+    
+    status, result = serve(scenario)
+    assert status == 400 and result["success"] is False
+
+
+def test_reader_node_tells_damaged_files_from_other_formats(ps, images):
+    input_dir = os.path.join(ps.bench_root, "input")
+    with open(images["png"], 'rb') as f:
+        data = f.read()
+    with open(os.path.join(input_dir, "cut.png"), 'wb') as f:
+        f.write(data[:100])
+    with open(os.path.join(input_dir, "notes.png"), 'w') as f:
+        f.write("not an image")
+    
+    node = ps.MetadataReaderNode()
+    assert node.read("cut.png") == ("Unreadable image: Truncated image",)
+    assert node.read("notes.png") == ("Not a PNG, JPEG or WEBP file",)
+
+
+def test_cleaner_converts_the_batch_like_comfyui(ps):
+    torch = pytest.importorskip("torch")
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("PIL")
+    from PIL import Image
+    images = torch.rand(3, 24, 40, 3)
+    images[0, 0, 0] = torch.tensor([1.5, -0.2, 0.999])  # out of range values are clamped
+    ps.MetadataCleanerNode().process(images, "strip", "Cleaner/IMG")
+    
+    folder = os.path.join(ps.bench_root, "output", "Cleaner")
+    for name, image in zip(sorted(os.listdir(folder)), images):
+        with Image.open(os.path.join(folder, name)) as img:
+            assert np.array_equal(np.asarray(img), (image * 255).clamp(0, 255).byte().numpy())
+
+
+@pytest.mark.parametrize("format", ["png", "webp"])
+def test_cleaner_reports_an_unreadable_clone_source(ps, images, tmp_path, format):
+    torch = pytest.importorskip("torch")
+    with open(images["jpeg" if format == "png" else "png"], 'rb') as f:
+        data = f.read()
+    damaged = tmp_path / "damaged"
+    damaged.write_bytes(data[:len(data) // 3] if format == "png" else b"not an image at all")
+    batch = torch.rand(1, 8, 8, 3)
+    
+    result, info = ps.MetadataCleanerNode().process(batch, "clone", "Cleaner/IMG", format=format,
+                                                    source_path=str(damaged))
+    assert result is batch and info.startswith("Clone source unreadable")
+    assert not os.path.exists(os.path.join(ps.bench_root, "output", "Cleaner"))
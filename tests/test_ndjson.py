@@ -0,0 +1,76 @@
+"""Export and re-import: the streamed NDJSON export (gzip or plain) and the legacy JSON document"""
+
+import gzip
+import json
+
+import pytest
+
+from benchmarks import synthetic
+
+FIELDS = ("category", "model", "tags", "rating", "created_at", "updated_at", "used_count")
+
+
+def snapshot(db):
+    """The library by prompt text (import assigns new ids): fields, thumbnail bytes"""
+    data = db.export_data(thumbnails=True)
+    thumbnails = data.get("thumbnails") or {}
+    return {p["text"]: ({k: p.get(k) for k in FIELDS}, thumbnails.get(p.get("thumb")))
+            for p in data["prompts"].values()}
+
+
+@pytest.fixture
+def exported(ps, serve):
+    """The source library's snapshot and its exports: {"ndjson": gzip bytes, "json": bytes}"""
+    ps.db.import_data(synthetic.generate_library(1200, seed=5, thumbs=0.5))
+
+    async def scenario(client):
+        bodies = {}
+        async with client.get("/ps/export", params={"format": "ndjson", "thumbnails": "1"}) as r:
+            assert r.status == 200 and r.content_type == "application/gzip"
+            bodies["ndjson"] = await r.read()
+        async with client.get("/ps/export", params={"thumbnails": "1"}) as r:
+            assert r.status == 200
+            bodies["json"] = json.dumps((await r.json())["data"]).encode()
+        return bodies
+
+    return snapshot(ps.db), serve(scenario)
+
+
+def post_import(serve, body, content_type):
+    async def scenario(client):
+        async with client.post("/ps/import", data=body, headers={"Content-Type": content_type}) as r:
+            return r.status, await r.json()
+    return serve(scenario)
+
+
+@pytest.mark.parametrize("variant", ["gzip", "plain", "json"])
+def test_export_imports_into_an_empty_library(load, tmp_path, serve, exported, variant):
+    expected, bodies = exported
+    assert sum(1 for _, thumb in expected.values() if thumb) > 0
+    target = load(tmp_path / "target")
+    assert target.db.get_prompts(limit=1) == []
+    if variant == "gzip":
+        status, result = post_import(serve, bodies["ndjson"], "application/gzip")
+    elif variant == "plain":
+        status, result = post_import(serve, gzip.decompress(bodies["ndjson"]), "application/x-ndjson")
+    else:
+        status, result = post_import(serve, bodies["json"], "application/json")
+    assert status == 200 and result["success"] is True, result
+    assert result["result"]["added"] == len(expected)
+    assert snapshot(target.db) == expected
+    assert target.db.check_indexes() == []
+
+
+def test_malformed_line_keeps_the_batches_before_it(load, tmp_path, serve, exported):
+    expected, bodies = exported
+    lines = gzip.decompress(bodies["ndjson"]).split(b"\n")
+    lines.insert(1 + 700, b'{"text": "cut off here", "tags": [')
+    target = load(tmp_path / "target")
+
+    status, result = post_import(serve, b"\n".join(lines), "application/x-ndjson")
+    assert status == 400 and result["success"] is False
+    assert "Line 702" in result["error"]
+    # The importer merges in batches of 500: the first batch is in, nothing after the bad line
+    imported = snapshot(target.db)
+    assert result["result"]["added"] == len(imported) == 500
+    assert all(expected[text] == value for text, value in imported.items())
@@ -0,0 +1,209 @@
+"""
+Search, paging and facets of the journal backend against a brute-force reference,
+their latency, and the counts SQLite keeps for stats and facets
+"""
+
+import random
+import statistics
+import time
+
+import pytest
+
+from benchmarks import comfy_stubs, synthetic
+
+QUERIES = [
+    {},
+    {"search": "masterpiece"},
+    {"search": "chiaroscuro"},
+    {"search": "cinem"},
+    {"search": "golden hour castle"},
+    {"search": "an"},  # short: whole tokens only
+    {"search": "!!"},  # no word characters: substring match
+    {"category": "portrait"},
+    {"model": "flux1-dev"},
+    {"tag": "TAG0003"},
+    {"rating_min": 4},
+    {"category": "portrait", "tag": "tag0000", "rating_min": 3},
+    {"search": "masterpiece", "category": "anime", "rating_min": 2},
+    {"search": "nothing-like-this"},
+]
+SORTS = ["updated_at", "rating", "used_count", "relevance"]
+
+
+def reference(ps, db, search=None, category=None, model=None, tag=None, rating_min=None):
+    """Matching prompts by the definitions, without the indexes"""
+    terms = ps.search_terms(search) if search else []
+    result = []
+    for p in db.data["prompts"].values():
+        if search and not terms and search.lower() not in p.text.lower():
+            continue
+        tokens = ps.document_tokens(p.text)
+        if not all(any(t == term or len(term) >= 3 and t.startswith(term) for t in tokens) for term in terms):
+            continue
+        if category and p.category != category or model and p.model != model:
+            continue
+        if tag and tag.lower() not in {t.lower() for t in p.tags}:
+            continue
+        if rating_min and (p.rating or 0) < rating_min:
+            continue
+        result.append(p)
+    return result
+
+
+def check(ps, db, query, sort):
+    expected = reference(ps, db, **query)
+    pages, cursor = [], None
+    while True:
+        page = db.get_prompts_page(limit=37, sort=sort, cursor=cursor, **query)
+        assert page["total"] == len(expected), (query, sort)
+        pages.extend(p["id"] for p in page["prompts"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert sorted(pages) == sorted(p.id for p in expected), (query, sort)
+    if sort != "relevance" or not ps.search_terms(query.get("search") or ""):
+        value = db._sort_key(sort)
+        assert pages == [p.id for p in sorted(expected, key=lambda p: (value(p), p.id), reverse=True)], (query, sort)
+    offset = db.get_prompts_page(limit=5, offset=7, sort=sort, **query)["prompts"]
+    assert [p["id"] for p in offset] == pages[7:12]
+    assert [p["id"] for p in db.get_prompts(limit=20, sort=sort, **query)] == pages[:20]
+
+    facets = db.get_facets(**query)
+    assert facets["total"] == len(expected)
+    tags = {}
+    for p in expected:
+        for t in {t.lower() for t in p.tags}:
+            tags[t] = tags.get(t, 0) + 1
+    assert facets["tags"] == tags
+    assert sum(facets["categories"].values()) == sum(1 for p in expected if p.category)
+    assert sum(facets["ratings"].values()) == len(expected)
+
+
+@pytest.fixture
+def library(ps):
+    ps.db.import_data(synthetic.generate_library(1500, seed=3))
+    return ps.db
+
+
+def test_pages_and_facets_match_reference(ps, library):
+    db = library
+    rng = random.Random(0)
+    for round in range(3):
+        for query in QUERIES:
+            for sort in SORTS:
+                check(ps, db, query, sort)
+        # Mutations keep the indexes (sort orders included) in step
+        pids = list(db.data["prompts"])
+        for pid in rng.sample(pids, 40):
+            db.rate(pid, rng.randint(1, 5))
+        for pid in rng.sample(pids, 10):
+            db.delete_prompt(pid)
+        for pid in rng.sample(list(db.data["prompts"]), 10):
+            db.update_prompt(pid, category="portrait", tags="tag0000, Extra")
+        for i in range(30):
+            db.reset_last_saved("t")
+            db.save_prompt(f"masterpiece castle golden hour #{round}-{i}", saver_id="t", tags="tag0003")
+        assert db.check_indexes() == []
+
+
+@pytest.mark.parametrize("query", [{}, {"search": "masterpiece", "sort": "relevance"}, {"tag": "tag0003"}])
+def test_malformed_cursor_is_rejected(library, query):
+    with pytest.raises(ValueError):
+        library.get_prompts_page(limit=5, cursor="not-a-cursor", **query)
+
+
+def latency(fn, runs=7):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+# First pages the library sidebar asks for while browsing and typing, at 100k prompts.
+# Measured at well under a millisecond to a few ms (a linear scan was 50-300 ms); the
+# limits leave room for slow CI machines.
+LATENCY_TARGETS_MS = [
+    ({"sort": "updated_at"}, 5),
+    ({"sort": "rating"}, 5),
+    ({"search": "chiaroscuro", "sort": "updated_at"}, 10),
+    ({"search": "masterpiece", "sort": "updated_at"}, 10),
+    ({"search": "cinem", "sort": "used_count"}, 10),
+    ({"search": "golden hour castle", "sort": "relevance"}, 20),
+    ({"category": "portrait", "sort": "updated_at"}, 10),
+    ({"tag": "tag0003", "sort": "updated_at"}, 10),
+    ({"category": "portrait", "tag": "tag0000", "rating_min": 3, "sort": "updated_at"}, 25),
+]
+
+
+@pytest.fixture(scope="module")
+def big_library(tmp_path_factory):
+    ps = comfy_stubs.load_extension(root=str(tmp_path_factory.mktemp("big")))
+    db = comfy_stubs.wait_ready(ps)
+    db.import_data(synthetic.generate_library(100000, thumbs=0))
+    return db
+
+
+@pytest.mark.parametrize("query, limit_ms", LATENCY_TARGETS_MS)
+def test_first_page_latency_at_100k(big_library, query, limit_ms):
+    db = big_library
+    # Each call searches afresh, as when the query changes with every keystroke
+    ms = latency(lambda: (db._search_cache.clear(), db.get_prompts_page(limit=50, **query)))
+    assert ms < limit_ms, f"{query}: {ms:.1f} ms"
+
+
+def test_sqlite_counts_follow_mutations(load):
+    """Stats and unfiltered facets come from trigger-kept counts; they must equal a recount"""
+    db = load(PS_STORAGE="sqlite").db
+    db.import_data(synthetic.generate_library(1500, seed=4, thumbs=0))
+    rng = random.Random(1)
+    pids = [r[0] for r in db.conn.execute("SELECT id FROM prompts")]
+    for pid in rng.sample(pids, 40):
+        db.rate(pid, rng.randint(0, 5))
+    for pid in rng.sample(pids, 20):
+        db.delete_prompt(pid)
+    pids = [r[0] for r in db.conn.execute("SELECT id FROM prompts")]
+    for pid in rng.sample(pids, 20):
+        db.update_prompt(pid, category=rng.choice(["portrait", "none"]), tags="tag0000, Extra, extra")
+    for pid in rng.sample(pids, 10):
+        db.set_thumbnail(pid, "0" * 32)
+    db.add_category("brand new")
+    db.delete_model(db.get_models()[0])
+    db.save_prompt("castle at dawn", model="sdxl", tags="Dawn")
+    db.add_prompts([{"text": "castle at dusk"}, {"text": "castle at dawn"}], category="portrait", tags="dusk")
+
+    kept = db.get_stats(), db.get_facets()
+    with db.conn:
+        db.conn.execute("DELETE FROM meta WHERE key = 'counts'")
+    db._build_counts()
+    assert (db.get_stats(), db.get_facets()) == kept
+    sql = db.conn.execute
+    assert kept[0]["total"] == kept[1]["total"] == sql("SELECT COUNT(*) FROM prompts").fetchone()[0]
+    assert kept[0]["rated"] == sql("SELECT COUNT(rating) FROM prompts").fetchone()[0]
+    assert kept[0]["with_thumbnail"] == 10
+    assert kept[0]["categories"] == len(db.get_categories())
+    assert kept[1]["categories"] == dict(sql("SELECT category, COUNT(*) FROM prompts WHERE category IS NOT NULL GROUP BY 1"))
+    assert kept[1]["tags"] == dict(sql("SELECT lower(tag), COUNT(DISTINCT prompt_id) FROM prompt_tags GROUP BY 1"))
+    assert kept[1]["tags"]["extra"] == 20
+
+
+@pytest.mark.parametrize("storage", ["journal", "sqlite"])
+def test_relevance_cursors_go_stale_when_the_text_index_changes(load, storage):
+    db = load(PS_STORAGE=storage).db
+    db.import_data(synthetic.generate_library(300, seed=5, thumbs=0))
+    first = db.get_prompts_page(search="masterpiece", sort="relevance", limit=10)
+    by_date = db.get_prompts_page(limit=10)
+    assert first["next_cursor"] and by_date["next_cursor"]
+    
+    # Ratings do not move BM25 scores
+    db.rate(first["prompts"][0]["id"], 5)
+    db.get_prompts_page(search="masterpiece", sort="relevance", limit=10, cursor=first["next_cursor"])
+    
+    # A new prompt changes idf and the average length: the old cursor would skip or repeat rows
+    db.save_prompt("masterpiece, a lighthouse in a storm")
+    with pytest.raises(ValueError, match="Stale cursor"):
+        db.get_prompts_page(search="masterpiece", sort="relevance", limit=10, cursor=first["next_cursor"])
+    assert db.get_prompts_page(limit=10, cursor=by_date["next_cursor"])["prompts"]
+    again = db.get_prompts_page(search="masterpiece", sort="relevance", limit=10)
+    assert db.get_prompts_page(search="masterpiece", sort="relevance", limit=10, cursor=again["next_cursor"])["prompts"]
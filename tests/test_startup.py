@@ -0,0 +1,49 @@
+"""Startup: the library loads on a background thread, so importing the extension does not wait for it"""
+
+import json
+import os
+
+import pytest
+
+from benchmarks import comfy_stubs, synthetic
+
+
+@pytest.mark.parametrize("storage", ["journal", "sqlite"])
+def test_import_returns_before_a_large_library_is_loaded(tmp_path, monkeypatch, storage):
+    root = tmp_path / "comfy"
+    data = root / "custom_nodes" / comfy_stubs.PACKAGE / "data"
+    data.mkdir(parents=True)
+    library = synthetic.generate_library(20000, seed=1, thumbs=0)
+    with open(data / "prompts.json", 'w', encoding='utf-8') as f:
+        json.dump(library, f)
+    monkeypatch.setenv("PS_STORAGE", storage)
+    monkeypatch.setenv("PS_DURABILITY", "commit")
+
+    ps = comfy_stubs.load_extension(root=str(root))
+    # Nodes and routes are registered; the JSON load (or the SQLite migration) is still running
+    assert "PS_SmartText" in ps.NODE_CLASS_MAPPINGS
+    assert not ps.db._ready.is_set()
+
+    db = comfy_stubs.wait_ready(ps)
+    assert db.get_prompts_page(limit=1)["total"] == 20000
+    assert db.get_prompts_page(limit=5, search="chiaroscuro")["total"] > 0
+    if storage == "sqlite":
+        assert os.path.exists(data / "prompts.sqlite3")
+
+
+@pytest.mark.parametrize("storage", ["journal", "sqlite"])
+def test_a_library_that_failed_to_load_is_not_served_as_empty(tmp_path, monkeypatch, storage):
+    root = tmp_path / "comfy"
+    data = root / "custom_nodes" / comfy_stubs.PACKAGE / "data"
+    data.mkdir(parents=True)
+    with open(data / "prompts.json", 'w', encoding='utf-8') as f:
+        json.dump({"prompts": ["not", "a", "mapping"]}, f)
+    monkeypatch.setenv("PS_STORAGE", storage)
+    monkeypatch.setenv("PS_DURABILITY", "commit")
+
+    ps = comfy_stubs.load_extension(root=str(root))
+    db = comfy_stubs.wait_ready(ps)
+    for call in (db.get_stats, db.get_tags, lambda: db.get_prompts_page(limit=1),
+                 lambda: db.save_prompt("saved over a library that did not load")):
+        with pytest.raises(RuntimeError, match="failed to load"):
+            call()
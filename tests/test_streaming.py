@@ -0,0 +1,104 @@
+"""The event loop stays responsive while an import and a ZIP download stream at the same time; pool gauges"""
+
+import asyncio
+import io
+import os
+import threading
+import time
+import zipfile
+
+from benchmarks import synthetic
+
+
+async def sample_lag(stop, lags, interval=0.005):
+    """How late each short sleep wakes up: the time the loop was busy elsewhere"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+def test_loop_lag_during_import_and_zip_download(ps, serve, tmp_path):
+    export = tmp_path / "library.ndjson.gz"
+    synthetic.write_ndjson(export, synthetic.generate_library(20000, thumbs=0.3))
+    body = export.read_bytes()
+    output = os.path.join(ps.bench_root, "output")
+    for i in range(150):
+        with open(os.path.join(output, f"image_{i:04d}.png"), 'wb') as f:
+            f.write(os.urandom(256 * 1024))
+    
+    async def scenario(client):
+        stop, lags = asyncio.Event(), []
+        sampler = asyncio.create_task(sample_lag(stop, lags))
+        
+        async def upload():
+            async with client.post("/ps/import", data=body, headers={"Content-Type": "application/gzip"}) as r:
+                return r.status, await r.json()
+        
+        async def download():
+            async with client.get("/ps/download-outputs") as r:
+                return r.status, await r.read()
+        
+        (import_status, result), (zip_status, archive) = await asyncio.gather(upload(), download())
+        stop.set()
+        await sampler
+        return import_status, result, zip_status, archive, sorted(lags)
+    
+    import_status, result, zip_status, archive, lags = serve(scenario)
+    assert import_status == 200 and result["result"]["added"] == 20000
+    assert zip_status == 200 and len(zipfile.ZipFile(io.BytesIO(archive)).namelist()) == 150
+    assert 'ps_stream_items_total{stream="zip"} 150' in ps.metrics.render()
+    # Work happens on worker threads: the loop only ever waits for a GIL switch or a small copy
+    p95, worst = lags[int(len(lags) * 0.95)], lags[-1]
+    assert p95 < 0.05 and worst < 0.25, f"loop lag: p95 {p95 * 1000:.1f} ms, max {worst * 1000:.1f} ms"
+
+
+def test_api_requests_are_served_while_streams_hold_their_pool(ps, serve, monkeypatch):
+    output = os.path.join(ps.bench_root, "output")
+    for i in range(4):
+        with open(os.path.join(output, f"image_{i}.png"), 'wb') as f:
+            f.write(b"x" * 1024)
+    
+    # Hold every download on its worker until released
+    release = threading.Event()
+    write_zip = ps.write_zip
+    monkeypatch.setattr(ps, "write_zip", lambda writer, files: (release.wait(30), write_zip(writer, files))[1])
+    
+    async def scenario(client):
+        async def download():
+            async with client.get("/ps/download-outputs") as r:
+                return r.status, await r.read()
+        
+        downloads = [asyncio.create_task(download()) for _ in range(8)]
+        await asyncio.sleep(0.2)
+        
+        async def get_stats():
+            async with client.get("/ps/stats") as r:
+                return r.status
+        
+        try:
+            # Must not queue behind the downloads
+            stats = await asyncio.wait_for(get_stats(), 5)
+        finally:
+            release.set()
+        return stats, await asyncio.gather(*downloads)
+    
+    stats, downloads = serve(scenario)
+    assert stats == 200
+    assert all(status == 200 and len(zipfile.ZipFile(io.BytesIO(body)).namelist()) == 4 for status, body in downloads)
+
+
+def test_pools_count_their_queued_and_running_tasks(ps):
+    pool = ps.CountingExecutor(max_workers=1)
+    release = threading.Event()
+    futures = [pool.submit(release.wait) for _ in range(3)]
+    while pool.active == 0:
+        time.sleep(0.01)
+    assert (pool.queued, pool.active) == (2, 1)
+    assert futures[2].cancel()
+    assert (pool.queued, pool.active) == (1, 1)
+    
+    release.set()
+    pool.shutdown(wait=True)
+    assert (pool.queued, pool.active) == (0, 0)
+    assert 'ps_executor_active{pool="worker"} 0' in ps.metrics.render(ps.library_gauges())
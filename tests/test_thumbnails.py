@@ -0,0 +1,72 @@
+"""Thumbnail store: concurrent writers, the sweep of unreferenced files and the backfill counters"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from benchmarks import synthetic
+
+
+def test_concurrent_puts_of_the_same_image(ps):
+    store = ps.db.thumbs
+    data = os.urandom(50000)
+    keys, errors = [], []
+    start = threading.Barrier(16)
+    
+    def put():
+        start.wait()
+        try:
+            keys.append(store.put(data))
+        except Exception as e:
+            errors.append(e)
+    
+    threads = [threading.Thread(target=put) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert len(set(keys)) == 1 and store.get(keys[0]) == data
+    assert os.listdir(store.path / keys[0][:2]) == [keys[0]]
+
+
+def test_backfill_sweeps_unreferenced_thumbnails(ps):
+    db = ps.db
+    kept = db.save_prompt("a prompt that keeps its thumbnail")
+    db.set_thumbnail(kept, db.thumbs.put(b"kept"))
+    gone = db.save_prompt("a prompt that gets deleted", saver_id="other")
+    orphan = db.thumbs.put(b"orphan")
+    db.set_thumbnail(gone, orphan)
+    db.delete_prompt(gone)
+    fresh = db.thumbs.put(b"not committed to a prompt yet")
+    stray = db.thumbs.path / orphan[:2] / (orphan + "abc.tmp")
+    stray.write_bytes(b"left by a crash")
+    
+    old = time.time() - 2 * 3600
+    for key in (orphan, db.get_prompt(kept)["thumb"]):
+        os.utime(db.thumbs.path / key[:2] / key, (old, old))
+    os.utime(stray, (old, old))
+    
+    progress = ps.ThumbnailBackfillJob().run()
+    assert progress["status"] == "done" and progress["swept"] == 2
+    assert db.thumbs.exists(db.get_prompt(kept)["thumb"])
+    assert db.thumbs.exists(fresh)
+    assert not db.thumbs.exists(orphan) and not stray.exists()
+
+
+def test_backfill_counts_prompts(ps):
+    pytest.importorskip("PIL")
+    db = ps.db
+    synthetic.write_png(os.path.join(ps.bench_root, "output", "shared.png"), 32, 32)
+    missing = "0" * 32  # thumbnail file that is gone
+    for i, source in enumerate(["shared.png", "shared.png", "deleted.png"]):
+        db.set_thumbnail(db.save_prompt(f"prompt {i}", saver_id=str(i)), missing, source=source)
+    db.save_prompt("a prompt without a source image", saver_id="none")
+    
+    progress = ps.ThumbnailBackfillJob().run()
+    assert progress["status"] == "done"
+    # Two prompts share one rendered image; each prompt is counted
+    assert (progress["total"], progress["processed"], progress["created"], progress["failed"]) == (3, 3, 2, 1)
+    assert progress["no_source"] == 1